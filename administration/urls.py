@@ -4,6 +4,7 @@ from administration.views import (
     AddStreamersView,
     IndexView,
     StreamersView,
+    SyncSchedules,
     UpdateStreamersFromTwitch,
 )
 
@@ -18,6 +19,11 @@ urlpatterns = [
         UpdateStreamersFromTwitch.as_view(),
         name="update-streamers",
     ),
+    path(
+        "streamers/schedules-sync",
+        SyncSchedules.as_view(),
+        name="sync-schedules",
+    ),
     path(
         "streamers/p/list",
         StreamersView.as_view(partial=True),
@@ -13,6 +13,7 @@ from pogscience.twitch import get_twitch_client
 
 from administration.forms import AddStreamersForm
 from streamers.models import Streamer
+from streamers.sync.engine import start_sync_schedules
 
 
 class IndexView(LoginRequiredMixin, RedirectView):
@@ -74,7 +75,8 @@ class UpdateStreamersFromTwitch(PermissionRequiredMixin, LoginRequiredMixin, Vie
         # We use string keys because Twitch returns string ids
         streamers = {str(streamer.twitch_id): streamer for streamer in streamers}
 
-        streamers_twitch = get_twitch_client().get_users(ids=ids)
+        # This is an explicit refresh request, so we don't want cached data.
+        streamers_twitch = get_twitch_client().get_users(ids=ids, use_cache=False)
 
         for streamer in streamers_twitch:
             streamer_model = streamers[streamer["id"]]
@@ -82,3 +84,15 @@ class UpdateStreamersFromTwitch(PermissionRequiredMixin, LoginRequiredMixin, Vie
             streamer_model.save()
 
         return HttpResponse(status=HTTPStatus.NO_CONTENT)
+
+
+class SyncSchedules(PermissionRequiredMixin, LoginRequiredMixin, View):
+    permission_required = ["streamers.change_scheduledstream"]
+
+    def post(self, request):
+        # A sync takes a while, so it runs in the background; we only wait
+        # for it to take the lock, as another sync may be running.
+        if not start_sync_schedules():
+            return HttpResponse(status=HTTPStatus.CONFLICT)
+
+        return HttpResponse(status=HTTPStatus.ACCEPTED)
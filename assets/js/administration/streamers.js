@@ -81,4 +81,45 @@ document.addEventListener("DOMContentLoaded", () => {
                 })
         })
     })
+
+    document.querySelectorAll('.js-sync-schedules').forEach(button => {
+        const buttonIcon = button.querySelector("span.icon > span.fas")
+        button.addEventListener('click', ev => {
+            ev.preventDefault()
+
+            button.classList.add('is-loading')
+            fetch("schedules-sync", {
+                method: 'POST',
+                headers: {
+                    'X-CSRFToken': csrf
+                }
+            })
+                .then(res => {
+                    if (res.status === 409) {
+                        alert("Une synchronisation des plannings est déjà en cours.")
+                        return
+                    }
+                    if (!res.ok) throw new Error(`Unable to start the schedules sync (HTTP ${res.status})`)
+
+                    button.classList.add("is-success")
+                    buttonIcon.classList.toggle("fa-calendar-alt", false)
+                    buttonIcon.classList.toggle("fa-check", true)
+                })
+                .catch(e => {
+                    console.error(e)
+                    button.classList.add("is-danger")
+                    buttonIcon.classList.toggle("fa-calendar-alt", false)
+                    buttonIcon.classList.toggle("fa-times", true)
+                })
+                .finally(() => {
+                    button.classList.remove('is-loading')
+                    setTimeout(() => {
+                        button.classList.remove('is-success', 'is-danger')
+                        buttonIcon.classList.toggle("fa-calendar-alt", true)
+                        buttonIcon.classList.toggle("fa-check", false)
+                        buttonIcon.classList.toggle("fa-times", false)
+                    }, 5000)
+                })
+        })
+    })
 })
@@ -65,7 +65,12 @@ document.addEventListener("DOMContentLoaded", () => {
                     <article class="event-stream" style={{backgroundColor: bg_color}}>
                         <h3>{info.event.title}</h3>
                         <footer>
-                            <img src={streamer.profile_image} alt={streamer.name} />
+                            <picture>
+                                {Object.entries(streamer.profile_image_srcset || {}).map(([format, srcset]) => (
+                                    <source type={`image/${format}`} srcSet={srcset} sizes="32px" />
+                                ))}
+                                <img src={streamer.profile_image} alt={streamer.name} />
+                            </picture>
                             <span>{streamer.name}</span>
                         </footer>
                     </article>
@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pogscience.settings")
 
 application = get_asgi_application()
+
+# Imported once Django is set up, as it uses the settings.
+from pogscience.background import start_periodic_tasks  # noqa: E402
+
+start_periodic_tasks()
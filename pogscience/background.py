@@ -0,0 +1,100 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_background_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool running background tasks, created on first use.
+    """
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.POG_BACKGROUND["WORKERS"], thread_name_prefix="background"
+                )
+
+    return _executor
+
+
+def run_after_commit(func, *args, **kwargs):
+    """
+    Runs the given function in a background thread, once the current
+    transaction is committed (or right away, outside of a transaction), so the
+    caller (e.g. a view, or a webhook) does not wait for it, and it sees the
+    committed data.
+
+    If the transaction is rolled back, the function is never called. Errors are
+    logged, as no one would catch them.
+    """
+
+    def task():
+        try:
+            func(*args, **kwargs)
+        except Exception:
+            logger.exception("Background task %s failed", func.__qualname__)
+        finally:
+            # Each thread has its own database connections.
+            connections.close_all()
+
+    transaction.on_commit(lambda: get_background_executor().submit(task))
+
+
+_periodic_tasks = []
+_periodic_tasks_started = False
+
+
+def register_periodic_task(func, period: timedelta):
+    """
+    Registers a function to be called every `period`, in a background thread of
+    the web processes (see `start_periodic_tasks`). Tasks must tolerate running
+    in several processes at once (e.g. holding a lock).
+
+    :param func: The function, or its dotted path, so it is only imported when
+                 the tasks start.
+    :param period: The time between two calls.
+    """
+    _periodic_tasks.append((func, period))
+
+
+def start_periodic_tasks():
+    """
+    Starts the registered periodic tasks, each in a daemon thread; called once
+    the web application is loaded. Errors are logged, and the task is called
+    again on the next period.
+    """
+    global _periodic_tasks_started
+
+    with _executor_lock:
+        if _periodic_tasks_started:
+            return
+        _periodic_tasks_started = True
+
+    for func, period in _periodic_tasks:
+        if isinstance(func, str):
+            func = import_string(func)
+
+        def loop(func=func, period=period):
+            while True:
+                time.sleep(period.total_seconds())
+                try:
+                    func()
+                except Exception:
+                    logger.exception("Periodic task %s failed", func.__qualname__)
+                finally:
+                    connections.close_all()
+
+        threading.Thread(target=loop, name=f"periodic-{func.__name__}", daemon=True).start()
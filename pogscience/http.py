@@ -0,0 +1,76 @@
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    An HTTP adapter applying a default timeout to every request sent through it,
+    as `requests` sessions don't support one.
+    """
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super(TimeoutHTTPAdapter, self).__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super(TimeoutHTTPAdapter, self).send(request, **kwargs)
+
+
+def build_http_session(pool_size: int, timeout, retries: int, backoff_factor: float) -> requests.Session:
+    """
+    Builds a requests session keeping connections alive in a pool, so
+    consecutive requests to the same host (Twitch API, Twitch CDN…) reuse the
+    same TCP+TLS connection.
+
+    :param pool_size: The maximal amount of connections kept open per host.
+    :param timeout: The default timeout, either a number of seconds or a
+                    (connect, read) tuple.
+    :param retries: How many times failed connections and server errors are
+                    retried. Rate-limited requests (429) are not retried here,
+                    as they are handled by the Twitch client.
+    :param backoff_factor: The exponential backoff factor between retries.
+    :return: The session.
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD", "OPTIONS", "DELETE"]),
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry, timeout=timeout)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session() -> requests.Session:
+    """
+    Returns the process-wide HTTP session, configured from the `POG_HTTP`
+    setting. Use it for every outgoing request so connections are pooled.
+    """
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_http_session(
+                    pool_size=settings.POG_HTTP["POOL_SIZE"],
+                    timeout=settings.POG_HTTP["TIMEOUT"],
+                    retries=settings.POG_HTTP["RETRIES"],
+                    backoff_factor=settings.POG_HTTP["BACKOFF_FACTOR"],
+                )
+
+    return _session
@@ -0,0 +1,50 @@
+import fcntl
+import os
+import threading
+from contextlib import contextmanager
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+
+class LockHeld(Exception):
+    """Raised when a lock is already held, and the caller won't wait for it."""
+
+
+def _thread_lock(path) -> threading.Lock:
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.fspath(path), threading.Lock())
+
+
+@contextmanager
+def file_lock(path, blocking=True):
+    """
+    Holds an exclusive lock shared by every thread and every process of this
+    host, materialized by the given file (created if needed).
+
+    :param path: The lock file path.
+    :param blocking: If False, `LockHeld` is raised instead of waiting for the
+                     lock if someone else holds it.
+    :return: A context manager yielding the lock file descriptor, opened in
+             read-write mode, so small shared states can be stored in the lock
+             file itself.
+    """
+    thread_lock = _thread_lock(path)
+    if not thread_lock.acquire(blocking=blocking):
+        raise LockHeld(path)
+
+    try:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise LockHeld(path) from None
+            try:
+                yield fd
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+    finally:
+        thread_lock.release()
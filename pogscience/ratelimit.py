@@ -0,0 +1,99 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from pogscience.locks import file_lock
+
+
+class SharedTokenBucket:
+    """
+    A token bucket rate limiter shared by every thread and process of this host:
+    its state is stored in a file, read and written under an exclusive lock.
+
+    The bucket holds up to `capacity` points, and is refilled continuously at
+    `capacity / period` points per second. Each request takes points from the
+    bucket, waiting for it to be refilled if needed. The bucket can also be
+    synced with the remote budget (e.g. from rate limit HTTP headers), as other
+    hosts may share the same budget.
+    """
+
+    def __init__(self, path, capacity: int, period: float):
+        """
+        :param path: The file where the bucket state is stored.
+        :param capacity: The maximal amount of points available at once.
+        :param period: The time, in seconds, to refill an empty bucket.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.rate = capacity / period
+
+    @contextmanager
+    def _state(self):
+        """
+        Locks the bucket, and yields its up-to-date state as a dict, which is
+        written back when the context exits.
+        """
+        with file_lock(self.path) as fd:
+            try:
+                state = json.loads(os.pread(fd, 4096, 0) or b"{}")
+            except ValueError:
+                state = {}
+
+            now = time.time()
+            tokens = state.get("tokens", self.capacity)
+            updated = state.get("updated", now)
+
+            state["tokens"] = min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+            state["updated"] = now
+            state.setdefault("blocked_until", 0.0)
+
+            yield state
+
+            data = json.dumps(state).encode()
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, data, 0)
+
+    def acquire(self, points: int = 1):
+        """
+        Takes the given amount of points from the bucket, waiting until they are
+        available.
+        """
+        while True:
+            with self._state() as state:
+                now = state["updated"]
+                if state["blocked_until"] > now:
+                    wait = state["blocked_until"] - now
+                elif state["tokens"] >= points:
+                    state["tokens"] -= points
+                    return
+                else:
+                    wait = (points - state["tokens"]) / self.rate
+
+            time.sleep(wait)
+
+    def sync(self, remaining: int = None, reset: float = None):
+        """
+        Syncs the bucket with the remote budget. As the remote budget may be
+        consumed by others, we never consider having more points than it.
+
+        :param remaining: The amount of points remaining, according to the
+                          remote service.
+        :param reset: The UNIX timestamp when the remote budget will be full
+                      again.
+        """
+        with self._state() as state:
+            if remaining is not None:
+                state["tokens"] = min(state["tokens"], remaining)
+                if remaining <= 0 and reset is not None:
+                    state["blocked_until"] = max(state["blocked_until"], reset)
+
+    def block(self, until: float):
+        """
+        Empties the bucket, and blocks every request until the given UNIX
+        timestamp, e.g. because the remote service told us we were over the
+        limit.
+        """
+        with self._state() as state:
+            state["tokens"] = 0.0
+            state["blocked_until"] = max(state["blocked_until"], until)
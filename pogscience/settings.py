@@ -9,6 +9,7 @@ https://docs.djangoproject.com/en/3.2/topics/settings/
 For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.2/ref/settings/
 """
+import os
 from datetime import timedelta
 
 import toml
@@ -39,6 +40,10 @@ except IOError as e:
     HOST = "localhost:8000"
     ALLOWED_HOSTS = []
 
+# Load stand-in server URL: if set, every Twitch and Google API request is sent
+# to this local stand-in server instead (see `./manage.py standin`).
+STANDIN_URL = os.environ.get("POG_STANDIN_URL", "").rstrip("/") or None
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/3.2/howto/deployment/checklist/
 
@@ -120,7 +125,13 @@ DATABASES = {
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.dummy.DummyCache",
-    }
+    },
+    # Shared by every process, to store the Twitch access token and API
+    # responses.
+    "twitch": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / ".cache" / "twitch",
+    },
 }
 
 # Password validation
@@ -194,6 +205,33 @@ AUTH_USER_MODEL = "streamers.User"
 
 POG_TWITCH_ENABLED = "twitch" in secrets
 
+POG_TWITCH = {
+    "HELIX_URL": f"{STANDIN_URL}/helix/" if STANDIN_URL else "https://api.twitch.tv/helix/",
+    "OAUTH_URL": f"{STANDIN_URL}/oauth2/" if STANDIN_URL else "https://id.twitch.tv/oauth2/",
+    # The Helix points budget, shared by every process using the Twitch client.
+    # https://dev.twitch.tv/docs/api/guide#twitch-rate-limits
+    "RATELIMIT_POINTS": 800,
+    "RATELIMIT_PERIOD": 60,
+    "RATELIMIT_STATE_FILE": BASE_DIR / ".twitch-ratelimit",
+    # How many times a rate-limited (429) request is retried before giving up.
+    "MAX_RETRIES": 5,
+    # How many requests a single call can send in parallel (e.g. batched calls
+    # split into chunks of 100 IDs).
+    "CONCURRENCY": 4,
+    # The app access token and the API responses are stored in this cache.
+    "CACHE": "twitch",
+    # How long API responses are cached, in seconds, per endpoint.
+    "CACHE_TTL": {
+        "streams": 30,
+        "users": 300,
+        "users-by-login": 300,
+    },
+    # The app access token is renewed this long before it expires, by a single
+    # process at once.
+    "TOKEN_RENEWAL_MARGIN": timedelta(minutes=10),
+    "TOKEN_LOCK_FILE": BASE_DIR / ".twitch-token.lock",
+}
+
 SOCIAL_AUTH_TWITCH_KEY = secrets["twitch"]["client_id"]
 SOCIAL_AUTH_TWITCH_SECRET = secrets["twitch"]["client_secret"]
 
@@ -236,8 +274,69 @@ REST_FRAMEWORK = {
 
 POG_SCHEDULE = {
     "FETCH_UNTIL": timedelta(days=180),
-    "GOOGLE_CALENDAR_ID": secrets["google"].get("calendar_id"),
-    "GOOGLE_API_KEY": secrets["google"].get("api_key"),
+    "GOOGLE_CALENDAR_ID": secrets["google"].get("calendar_id") or ("standin" if STANDIN_URL else None),
+    "GOOGLE_API_KEY": secrets["google"].get("api_key") or ("standin" if STANDIN_URL else None),
+    # The Google Calendar API base URL, if not the default one.
+    "GOOGLE_API_ENDPOINT": f"{STANDIN_URL}/calendar/v3/" if STANDIN_URL else None,
+    # Google Calendar events are synced incrementally, with a full sync at
+    # least this often, for the events entering the `FETCH_UNTIL` window.
+    "GOOGLE_FULL_SYNC_PERIOD": timedelta(days=1),
+    # If set, web processes sync the schedules this often in the background
+    # (see `streamers.sync.engine`), instead of relying on a cron job running
+    # the `syncschedules` command.
+    "SYNC_PERIOD": None,
+    # Only one sync runs at once, per host.
+    "SYNC_LOCK_FILE": BASE_DIR / ".schedules-sync.lock",
 }
 
 POG_PREVIEWS = {"WIDTH": 1280, "HEIGHT": 720}
+
+# Media downloaded from Twitch are stored with their content hash in their
+# name (see `pogscience.storage`), so they can be served with long-term cache
+# headers. Replaced files are kept during the grace period, for already loaded
+# pages.
+POG_MEDIA = {
+    "CONTENT_HASHED": True,
+    "SUPERSEDED_GRACE_PERIOD": timedelta(minutes=15),
+}
+
+# Resized versions of the images downloaded from Twitch, generated for each
+# format supported by PIL, so browsers can download the smallest one they need;
+# see `streamers.images`.
+POG_IMAGES = {
+    "FORMATS": ["avif", "webp"],  # best first
+    "QUALITY": 75,
+    # Live previews change every few minutes, and are stored while syncing
+    # the live streams: they are not resized, as encoding them would slow the
+    # sync down.
+    "WIDTHS": {
+        "profile_image": [64, 128, 256],
+        "background_image": [640, 1280],
+    },
+}
+
+# Outgoing HTTP requests (Twitch API, Twitch CDN…) share a pool of keep-alive
+# connections; see `pogscience.http`.
+POG_HTTP = {
+    "POOL_SIZE": 20,
+    "TIMEOUT": (3.05, 15),  # (connect, read), in seconds
+    "RETRIES": 3,
+    "BACKOFF_FACTOR": 0.3,
+}
+
+# Slow operations triggered by requests (e.g. fetching a stream data from
+# Twitch when it starts) run in a pool of background threads; see
+# `pogscience.background`.
+POG_BACKGROUND = {"WORKERS": 4}
+
+# Viewers counts are sampled by `synclivestreams`, then rolled up per minute,
+# hour and day. Each level is deleted after its retention period (None to keep
+# it forever), once rolled up into the next one; see `streamers.viewers`.
+POG_VIEWERS = {
+    "RETENTION": {
+        "sample": timedelta(days=2),
+        "minute": timedelta(days=14),
+        "hour": timedelta(days=400),
+        "day": None,
+    },
+}
@@ -0,0 +1,573 @@
+import base64
+import hashlib
+import json
+import random
+import re
+import struct
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timedelta, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from requests import RequestException
+
+from pogscience.http import get_http_session
+
+# Where the stand-in server forwards requests to, when recording, per path
+# prefix.
+UPSTREAMS = {
+    "/helix/": "https://api.twitch.tv/helix/",
+    "/oauth2/": "https://id.twitch.tv/oauth2/",
+    "/calendar/v3/": "https://www.googleapis.com/calendar/v3/",
+}
+
+# Query parameters never recorded, nor used to match recorded responses.
+SECRET_PARAMS = {"key", "client_id", "client_secret"}
+
+FORWARDED_HEADERS = {"authorization", "client-id", "content-type", "if-none-match", "if-modified-since"}
+RECORDED_HEADERS = {
+    "content-type",
+    "etag",
+    "last-modified",
+    "ratelimit-limit",
+    "ratelimit-remaining",
+    "ratelimit-reset",
+}
+
+GAMES = ["Science & Technology", "Just Chatting", "Software and Game Development", "Makers & Crafting", "Talk Shows"]
+TITLES = ["Astronomie en direct", "On code un jeu", "Questions-réponses", "Revue de presse scientifique", "Chimie"]
+NAMES = ["Science", "Astro", "Pog", "Quantum", "Bio", "Geo", "Chimie", "Maths", "Physique", "Robot"]
+
+
+def isoformat(date: datetime) -> str:
+    return date.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def precise_isoformat(date: datetime) -> str:
+    """Formats dates with a nanosecond precision, like the EventSub ones."""
+    return date.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f000Z")
+
+
+def solid_png(rgb, size=16) -> bytes:
+    """
+    Encodes a small PNG image filled with the given colour, for the profile
+    pictures and live previews served by the stand-in.
+    """
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    row = b"\x00" + bytes(rgb) * size
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(row * size))
+        + chunk(b"IEND", b"")
+    )
+
+
+class SyntheticRoster:
+    """
+    A deterministic (for a given seed) set of streamers, with their live
+    streams, Twitch schedules, and Google Calendar events.
+    """
+
+    def __init__(self, size: int, base_url: str, live_ratio: float = 0.2, weeks: int = 26, seed: int = 42):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+        week_start = now - timedelta(days=now.weekday(), hours=now.hour)
+
+        self.users = []
+        self.streams = {}
+        self.schedules = {}
+        self.calendar_events = []
+
+        for index in range(size):
+            user_id = str(100000 + index)
+            display_name = f"{rng.choice(NAMES)}{rng.choice(NAMES)}{index}"
+            login = display_name.lower()
+
+            self.users.append(
+                {
+                    "id": user_id,
+                    "login": login,
+                    "display_name": display_name,
+                    "type": "",
+                    "broadcaster_type": "affiliate",
+                    "description": f"La chaîne de {display_name}.",
+                    "profile_image_url": f"{base_url}/images/profile/{login}.png",
+                    "offline_image_url": f"{base_url}/images/offline/{login}.png",
+                    "view_count": rng.randint(0, 100000),
+                    "created_at": "2016-01-01T00:00:00Z",
+                }
+            )
+
+            if rng.random() < live_ratio:
+                self.streams[user_id] = {
+                    "id": str(4000000 + index),
+                    "user_id": user_id,
+                    "user_login": login,
+                    "user_name": display_name,
+                    "game_id": str(rng.randint(1, 1000)),
+                    "game_name": rng.choice(GAMES),
+                    "type": "live",
+                    "title": rng.choice(TITLES),
+                    "viewer_count": rng.randint(1, 2000),
+                    "started_at": isoformat(now - timedelta(minutes=rng.randint(1, 240))),
+                    "language": "fr",
+                    "thumbnail_url": f"{base_url}/images/previews/live_user_{login}-{{width}}x{{height}}.png",
+                    "tag_ids": [],
+                    "is_mature": False,
+                }
+
+            if rng.random() < 0.3:
+                continue  # no schedule for this streamer
+
+            segments = []
+            for _ in range(rng.randint(1, 3)):
+                slot_id = str(uuid.UUID(int=rng.getrandbits(128)))
+                first = week_start + timedelta(days=rng.randint(0, 6), hours=rng.randint(10, 21))
+                duration = timedelta(hours=rng.randint(1, 4))
+                title = rng.choice(TITLES)
+                category = rng.choice(GAMES)
+
+                for week in range(weeks):
+                    start = first + timedelta(weeks=week)
+                    if start + duration < now:
+                        continue
+
+                    iso_year, iso_week, _ = start.isocalendar()
+                    segment_id = json.dumps({"segmentID": slot_id, "isoYear": iso_year, "isoWeek": iso_week})
+                    segments.append(
+                        {
+                            "id": base64.b64encode(segment_id.encode()).decode(),
+                            "start_time": isoformat(start),
+                            "end_time": isoformat(start + duration),
+                            "title": title,
+                            "canceled_until": None,
+                            "category": {"id": "1", "name": category},
+                            "is_recurring": True,
+                        }
+                    )
+
+                    # Some streams are announced on the Google Calendar too.
+                    if rng.random() < 0.2:
+                        self.calendar_events.append(self._calendar_event(rng, display_name, login, title, start))
+
+            for _ in range(rng.randint(0, 3)):
+                start = now + timedelta(days=rng.randint(0, weeks * 7), hours=rng.randint(0, 23))
+                segment_id = json.dumps({"segmentID": str(uuid.UUID(int=rng.getrandbits(128)))})
+                segments.append(
+                    {
+                        "id": base64.b64encode(segment_id.encode()).decode(),
+                        "start_time": isoformat(start),
+                        "end_time": isoformat(start + timedelta(hours=2)) if rng.random() < 0.8 else None,
+                        "title": rng.choice(TITLES),
+                        "canceled_until": None,
+                        "category": None,
+                        "is_recurring": False,
+                    }
+                )
+
+            # And some are only announced on the Google Calendar.
+            for _ in range(rng.randint(0, 2)):
+                start = now + timedelta(days=rng.randint(0, weeks * 7), hours=rng.randint(0, 23))
+                self.calendar_events.append(self._calendar_event(rng, display_name, login, rng.choice(TITLES), start))
+
+            segments.sort(key=lambda segment: segment["start_time"])
+            self.schedules[user_id] = segments
+
+        self.calendar_events.sort(key=lambda event: event["start"]["dateTime"])
+
+    @staticmethod
+    def _calendar_event(rng, display_name, login, title, start):
+        summary = rng.choice([f"{display_name} - {title}", f"{display_name} : {title}", f"{title} avec {display_name}"])
+        event = {
+            "kind": "calendar#event",
+            "id": uuid.UUID(int=rng.getrandbits(128)).hex,
+            "status": "confirmed",
+            "summary": summary,
+            "updated": isoformat(datetime.now(timezone.utc)),
+            "start": {"dateTime": isoformat(start), "timeZone": "UTC"},
+            "end": {"dateTime": isoformat(start + timedelta(hours=2)), "timeZone": "UTC"},
+        }
+        if rng.random() < 0.3:
+            event["location"] = f"https://twitch.tv/{login}"
+        return event
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    A local HTTP server standing in for the Twitch Helix endpoints (users,
+    streams, schedule, eventsub/subscriptions), the Twitch OAuth token endpoint,
+    and the Google Calendar events list, to run and benchmark the sync commands
+    without hitting the real services.
+
+    Responses come from a synthetic roster, or from a file of responses
+    recorded from the real services (see `record_to`).
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address,
+        roster: SyntheticRoster = None,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit: int = 800,
+        error_rate: float = 0.0,
+        record_to: str = None,
+        replay_from: str = None,
+    ):
+        """
+        :param address: The (host, port) to listen to.
+        :param roster: The synthetic roster served.
+        :param latency: The delay added to every response, in seconds.
+        :param jitter: A random delay up to this added to every response, in
+                       seconds.
+        :param rate_limit: The Helix points budget per minute; requests over it
+                           are answered with 429 errors.
+        :param error_rate: The probability to answer a Helix request with a 429
+                           error anyway.
+        :param record_to: If set, requests are forwarded to the real services,
+                          and the responses recorded into this file.
+        :param replay_from: If set, responses are served from this file of
+                            recorded responses.
+        """
+        super(StandInServer, self).__init__(address, StandInRequestHandler)
+
+        self.roster = roster
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.record_to = record_to
+
+        self.rate_limit = rate_limit
+        self._rate_limit_remaining = rate_limit
+        self._rate_limit_reset = time.time() + 60
+
+        self.subscriptions = {}
+        # The roster never changes, so a single sync token is valid: others
+        # are expired, so a full sync is needed.
+        self.calendar_sync_token = uuid.uuid4().hex
+        self.recorded = []
+        self.replayed = {}
+        self.requests_count = 0
+        self._lock = threading.Lock()
+
+        if replay_from:
+            with open(replay_from) as f:
+                for entry in json.load(f):
+                    self.replayed.setdefault(entry["key"], []).append(entry)
+
+    @staticmethod
+    def request_key(method, path, query):
+        params = sorted((k, v) for k, values in parse_qs(query).items() if k not in SECRET_PARAMS for v in values)
+        return f"{method} {path}?{urlencode(params)}"
+
+    def take_rate_limit_point(self):
+        """
+        :return: The rate limit headers, and False if the request is over the
+                 limit.
+        """
+        with self._lock:
+            self.requests_count += 1
+
+            now = time.time()
+            if now >= self._rate_limit_reset:
+                self._rate_limit_remaining = self.rate_limit
+                self._rate_limit_reset = now + 60
+
+            allowed = self._rate_limit_remaining > 0 and random.random() >= self.error_rate
+            if allowed:
+                self._rate_limit_remaining -= 1
+
+            return {
+                "Ratelimit-Limit": str(self.rate_limit),
+                "Ratelimit-Remaining": str(self._rate_limit_remaining),
+                "Ratelimit-Reset": str(int(self._rate_limit_reset)),
+            }, allowed
+
+    def record(self, entry):
+        with self._lock:
+            self.recorded.append(entry)
+            with open(self.record_to, "w") as f:
+                json.dump(self.recorded, f, indent=2)
+
+
+class StandInRequestHandler(BaseHTTPRequestHandler):
+    server: StandInServer
+
+    protocol_version = "HTTP/1.1"
+
+    ROUTES = [
+        ("POST", re.compile(r"^/oauth2/token$"), "token"),
+        ("GET", re.compile(r"^/helix/users$"), "users"),
+        ("GET", re.compile(r"^/helix/streams$"), "streams"),
+        ("GET", re.compile(r"^/helix/schedule$"), "schedule"),
+        ("GET", re.compile(r"^/helix/eventsub/subscriptions$"), "list_subscriptions"),
+        ("POST", re.compile(r"^/helix/eventsub/subscriptions$"), "create_subscription"),
+        ("DELETE", re.compile(r"^/helix/eventsub/subscriptions$"), "delete_subscription"),
+        ("GET", re.compile(r"^/calendar/v3/calendars/(?P<calendar_id>[^/]+)/events$"), "calendar_events"),
+        ("GET", re.compile(r"^/images/(?P<kind>[a-z]+)/(?P<name>[^/]+)\.png$"), "image"),
+    ]
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        self.query = parse_qs(url.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(length) if length else b""
+
+        if self.server.latency or self.server.jitter:
+            time.sleep(self.server.latency + random.random() * self.server.jitter)
+
+        if self.server.record_to:
+            return self.forward(method, url)
+
+        if self.server.replayed:
+            return self.replay(method, url)
+
+        extra_headers = {}
+        if url.path.startswith("/helix/"):
+            extra_headers, allowed = self.server.take_rate_limit_point()
+            if not allowed:
+                return self.send_json(
+                    {"error": "Too Many Requests", "status": 429}, HTTPStatus.TOO_MANY_REQUESTS, extra_headers
+                )
+
+        for route_method, pattern, handler in self.ROUTES:
+            match = pattern.match(url.path)
+            if route_method == method and match:
+                return getattr(self, handler)(extra_headers=extra_headers, **match.groupdict())
+
+        self.send_json({"error": "Not Found", "status": 404}, HTTPStatus.NOT_FOUND)
+
+    def send_body(self, body: bytes, status=HTTPStatus.OK, headers=None, content_type="application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=HTTPStatus.OK, headers=None):
+        self.send_body(json.dumps(data).encode(), status, headers)
+
+    def param(self, name, default=None):
+        return self.query.get(name, [default])[0]
+
+    def paginate(self, items, page_size):
+        """
+        :return: The items of the page requested through the `after` parameter,
+                 and the pagination object.
+        """
+        offset = int(self.param("after") or 0)
+        page = items[offset : offset + page_size]
+        cursor = str(offset + page_size) if offset + page_size < len(items) else None
+        return page, ({"cursor": cursor} if cursor else {})
+
+    # Record & replay
+
+    def forward(self, method, url):
+        prefix = next((prefix for prefix in UPSTREAMS if url.path.startswith(prefix)), None)
+        if prefix is None:
+            return self.send_json({"error": "Not Found", "status": 404}, HTTPStatus.NOT_FOUND)
+
+        try:
+            response = get_http_session().request(
+                method,
+                UPSTREAMS[prefix] + url.path[len(prefix) :] + (f"?{url.query}" if url.query else ""),
+                headers={name: value for name, value in self.headers.items() if name.lower() in FORWARDED_HEADERS},
+                data=self.body or None,
+            )
+        except RequestException as e:
+            return self.send_json({"error": "Bad Gateway", "status": 502, "message": str(e)}, HTTPStatus.BAD_GATEWAY)
+
+        headers = {name: value for name, value in response.headers.items() if name.lower() in RECORDED_HEADERS}
+        content_type = headers.pop("Content-Type", "application/json")
+        body = response.content
+
+        # Access tokens are secrets too.
+        if url.path.endswith("/oauth2/token") and response.ok:
+            body = json.dumps({**response.json(), "access_token": "recorded-access-token"}).encode()
+
+        self.server.record(
+            {
+                "key": self.server.request_key(method, url.path, url.query),
+                "status": response.status_code,
+                "headers": headers,
+                "content_type": content_type,
+                "body": base64.b64encode(body).decode(),
+            }
+        )
+        self.send_body(body, response.status_code, headers, content_type)
+
+    def replay(self, method, url):
+        entries = self.server.replayed.get(self.server.request_key(method, url.path, url.query))
+        if not entries:
+            return self.send_json({"error": "Not Recorded", "status": 404}, HTTPStatus.NOT_FOUND)
+
+        # Identical requests are answered with the recorded responses in order,
+        # then the last one again and again.
+        entry = entries.pop(0) if len(entries) > 1 else entries[0]
+        self.send_body(base64.b64decode(entry["body"]), entry["status"], entry["headers"], entry["content_type"])
+
+    # Synthetic responses
+
+    def token(self, extra_headers):
+        self.send_json({"access_token": uuid.uuid4().hex, "expires_in": 5000000, "token_type": "bearer"})
+
+    def users(self, extra_headers):
+        ids = set(self.query.get("id", []))
+        logins = {login.lower() for login in self.query.get("login", [])}
+        users = [user for user in self.server.roster.users if user["id"] in ids or user["login"] in logins]
+        self.send_json({"data": users}, headers=extra_headers)
+
+    def streams(self, extra_headers):
+        user_ids = self.query.get("user_id", [])
+        streams = [self.server.roster.streams[user_id] for user_id in user_ids if user_id in self.server.roster.streams]
+        page, pagination = self.paginate(streams, int(self.param("first", 20)))
+        self.send_json({"data": page, "pagination": pagination}, headers=extra_headers)
+
+    def schedule(self, extra_headers):
+        broadcaster_id = self.param("broadcaster_id")
+        segments = self.server.roster.schedules.get(broadcaster_id)
+        if not segments:
+            return self.send_json(
+                {"error": "Not Found", "status": 404, "message": "segments were either all canceled or not found"},
+                HTTPStatus.NOT_FOUND,
+                extra_headers,
+            )
+
+        start_time = self.param("start_time")
+        if start_time:
+            start_time = isoformat(datetime.fromisoformat(start_time.replace("Z", "+00:00")))
+            segments = [segment for segment in segments if (segment["end_time"] or segment["start_time"]) >= start_time]
+
+        page, pagination = self.paginate(segments, int(self.param("first", 20)))
+        user = next(user for user in self.server.roster.users if user["id"] == broadcaster_id)
+        self.send_json(
+            {
+                "data": {
+                    "segments": page or None,
+                    "broadcaster_id": broadcaster_id,
+                    "broadcaster_name": user["display_name"],
+                    "broadcaster_login": user["login"],
+                    "vacation": None,
+                },
+                "pagination": pagination,
+            },
+            headers=extra_headers,
+        )
+
+    def list_subscriptions(self, extra_headers):
+        subscriptions = list(self.server.subscriptions.values())
+        page, pagination = self.paginate(subscriptions, int(self.param("first", 100)))
+        self.send_json(
+            {
+                "data": page,
+                "total": len(subscriptions),
+                "total_cost": 0,
+                "max_total_cost": 10000,
+                "pagination": pagination,
+            },
+            headers=extra_headers,
+        )
+
+    def create_subscription(self, extra_headers):
+        request = json.loads(self.body)
+        subscription = {
+            "id": str(uuid.uuid4()),
+            "status": "webhook_callback_verification_pending",
+            "type": request["type"],
+            "version": request["version"],
+            "cost": 0,
+            "condition": request["condition"],
+            "transport": {"method": "webhook", "callback": request["transport"]["callback"]},
+            "created_at": precise_isoformat(datetime.now(timezone.utc)),
+        }
+        self.server.subscriptions[subscription["id"]] = subscription
+        self.send_json(
+            {"data": [subscription], "total": len(self.server.subscriptions), "total_cost": 0, "max_total_cost": 10000},
+            HTTPStatus.ACCEPTED,
+            extra_headers,
+        )
+
+    def delete_subscription(self, extra_headers):
+        if self.server.subscriptions.pop(self.param("id"), None) is None:
+            return self.send_json({"error": "Not Found", "status": 404}, HTTPStatus.NOT_FOUND, extra_headers)
+        self.send_body(b"", HTTPStatus.NO_CONTENT, extra_headers)
+
+    def calendar_events(self, extra_headers, calendar_id):
+        sync_token = self.param("syncToken")
+        if sync_token:
+            if sync_token != self.server.calendar_sync_token:
+                return self.send_json(
+                    {
+                        "error": {
+                            "code": 410,
+                            "message": "Sync token is no longer valid, a full sync is required.",
+                            "errors": [{"domain": "calendar", "reason": "fullSyncRequired"}],
+                        }
+                    },
+                    HTTPStatus.GONE,
+                )
+
+            # Nothing changed since the token was issued.
+            return self.send_json(
+                {"kind": "calendar#events", "summary": calendar_id, "items": [], "nextSyncToken": sync_token}
+            )
+
+        events = self.server.roster.calendar_events
+
+        time_min = self.param("timeMin")
+        if time_min:
+            time_min = isoformat(datetime.fromisoformat(time_min.replace("Z", "+00:00")))
+            events = [event for event in events if event["end"]["dateTime"] >= time_min]
+
+        time_max = self.param("timeMax")
+        if time_max:
+            time_max = isoformat(datetime.fromisoformat(time_max.replace("Z", "+00:00")))
+            events = [event for event in events if event["start"]["dateTime"] < time_max]
+
+        offset = int(self.param("pageToken") or 0)
+        page_size = int(self.param("maxResults") or 250)
+        response = {"kind": "calendar#events", "summary": calendar_id, "items": events[offset : offset + page_size]}
+        if offset + page_size < len(events):
+            response["nextPageToken"] = str(offset + page_size)
+        else:
+            response["nextSyncToken"] = self.server.calendar_sync_token
+
+        self.send_json(response)
+
+    def image(self, extra_headers, kind, name):
+        rgb = hashlib.md5(f"{kind}/{name}".encode()).digest()[:3]
+        body = solid_png(rgb)
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_body(body, headers={"ETag": etag}, content_type="image/png")
@@ -1,4 +1,10 @@
+import hashlib
+import os
+import re
+
+from django.conf import settings
 from django.core.files.storage import get_storage_class
+from django.utils import timezone
 
 
 class OverwriteStorage(get_storage_class()):
@@ -9,3 +15,102 @@ class OverwriteStorage(get_storage_class()):
     def get_available_name(self, name, max_length=None):
         self.delete(name)
         return super().get_available_name(name, max_length)
+
+
+class ContentHashedStorage(get_storage_class()):
+    """
+    Storage class adding the content hash to the files names (e.g.
+    `twitch/profile/name.0123456789ab.png`), so an URL always serves the same
+    content, and can be cached forever by browsers.
+
+    Saving the same content again reuses the existing file. Older versions of a
+    file (same name, other hash) are deleted once they have been superseded for
+    longer than the grace period, so already loaded pages can still display
+    them.
+    """
+
+    HASH_LENGTH = 12
+
+    def __init__(self, *args, grace_period=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.grace_period = grace_period or settings.POG_MEDIA["SUPERSEDED_GRACE_PERIOD"]
+
+    @classmethod
+    def is_hashed(cls, name) -> bool:
+        """Checks if the given file name contains a content hash."""
+        return re.search(rf"\.[0-9a-f]{{{cls.HASH_LENGTH}}}\.[^./]+$", name) is not None
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+
+        sha256 = hashlib.sha256()
+        for chunk in content.chunks():
+            sha256.update(chunk)
+
+        root, ext = os.path.splitext(name)
+        name = f"{root}.{sha256.hexdigest()[:self.HASH_LENGTH]}{ext}"
+
+        # An older version saved again (e.g. a reverted image) is written again,
+        # so it supersedes the newer versions from now on.
+        if self.exists(name):
+            modified_time = self.get_modified_time(name)
+            if any(version_time > modified_time for version_time, _ in self.other_versions(name)):
+                self.delete(name)
+
+        if not self.exists(name):
+            name = super().save(name, content, max_length)
+
+        self.delete_superseded(name)
+        return name
+
+    def other_versions(self, name):
+        """
+        Lists the other versions of the given file (same name, other hash).
+
+        :param name: A version name.
+        :return: The `(modified time, name)` couples of the other versions,
+                 oldest first.
+        """
+        directory, filename = os.path.split(name)
+        root, ext = os.path.splitext(filename)
+        stem = root[: -self.HASH_LENGTH - 1]
+        re_version = re.compile(rf"^{re.escape(stem)}\.[0-9a-f]{{{self.HASH_LENGTH}}}{re.escape(ext)}$")
+
+        try:
+            _, filenames = self.listdir(directory)
+        except FileNotFoundError:
+            return []
+
+        return sorted(
+            (self.get_modified_time(path), path)
+            for path in (os.path.join(directory, filename) for filename in filenames if re_version.match(filename))
+            if path != name
+        )
+
+    def delete_superseded(self, name):
+        """
+        Deletes the older versions of the given file, superseded for longer
+        than the grace period.
+
+        :param name: The current version name.
+        """
+        versions = self.other_versions(name)
+
+        # Each version was superseded when the next one was written; the last
+        # one, by the current version.
+        now = timezone.now()
+        for (_, path), (superseded_at, _) in zip(versions, versions[1:] + [(self.get_modified_time(name), name)]):
+            if superseded_at < now - self.grace_period:
+                self.delete(path)
+
+
+def get_media_storage():
+    """
+    Returns the storage to use for media downloaded and updated automatically
+    (e.g. Twitch images), according to `POG_MEDIA`.
+    """
+    if settings.POG_MEDIA["CONTENT_HASHED"]:
+        return ContentHashedStorage()
+
+    return OverwriteStorage()
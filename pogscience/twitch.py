@@ -1,17 +1,25 @@
 import datetime
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 from pprint import pprint
 from urllib.parse import urljoin
 
 import pytz
-import requests
+from dateutil.parser import isoparse
 from django.conf import settings
+from django.core.cache import caches
 from django.utils import timezone
 from requests import codes
 from twitch import TwitchHelix as TwitchHelixOriginal
-from twitch.constants import BASE_HELIX_URL
-from twitch.exceptions import TwitchAttributeException
-from twitch.helix.base import APICursor, TwitchAPIMixin
-from twitch.resources import TwitchObject
+from twitch.exceptions import TwitchAttributeException, TwitchOAuthException
+from twitch.helix.base import APICursor, APIGet, TwitchAPIMixin
+from twitch.resources import Stream, TwitchObject, User
+
+from pogscience.http import get_http_session
+from pogscience.locks import file_lock
+from pogscience.ratelimit import SharedTokenBucket
 
 
 class Schedule(TwitchObject):
@@ -22,72 +30,214 @@ class EventSubSubscriptionCreated(TwitchObject):
     pass
 
 
-class ScheduleAPICursor(APICursor):
+class EventSubSubscriptionListed(dict):
     """
-    The API response is not of the same format for schedule calls.
+    EventSub subscriptions are kept as returned by Twitch: the `twitch` lib
+    cannot parse their dates, which have a nanosecond precision.
+    """
+
+    @classmethod
+    def construct_from(cls, values):
+        return cls(values)
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> SharedTokenBucket:
+    """
+    Returns the Helix rate limiter, shared by every process of this host using
+    the Twitch client, so they pace their requests together instead of each
+    one finding out about the limit through 429 responses.
+    """
+    global _rate_limiter
+
+    if _rate_limiter is None:
+        with _rate_limiter_lock:
+            if _rate_limiter is None:
+                _rate_limiter = SharedTokenBucket(
+                    path=settings.POG_TWITCH["RATELIMIT_STATE_FILE"],
+                    capacity=settings.POG_TWITCH["RATELIMIT_POINTS"],
+                    period=settings.POG_TWITCH["RATELIMIT_PERIOD"],
+                )
+
+    return _rate_limiter
+
+
+_prefetch_executor = None
+_prefetch_executor_lock = threading.Lock()
+
+
+def get_prefetch_executor() -> ThreadPoolExecutor:
+    """
+    Returns the thread pool fetching the next pages of cursors in the
+    background, while the current one is consumed.
+    """
+    global _prefetch_executor
+
+    if _prefetch_executor is None:
+        with _prefetch_executor_lock:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    max_workers=settings.POG_TWITCH["CONCURRENCY"], thread_name_prefix="twitch-prefetch"
+                )
+
+    return _prefetch_executor
+
+
+class PooledTwitchAPIMixin(TwitchAPIMixin):
+    """
+    Sends the Helix requests through the shared HTTP session, so they reuse
+    pooled keep-alive connections instead of opening a new one each time. The
+    requests are paced by the shared rate limiter.
+
+    If the Helix client is given, an expired access token (401 response) is
+    renewed, and the request retried, once.
     """
 
-    def __init__(self, client_id, path, resource, oauth_token=None, cursor=None, params=None):
-        self._last_page = False
-        super(ScheduleAPICursor, self).__init__(client_id, path, resource, oauth_token, cursor, params)
+    def __init__(self, *args, helix=None, **kwargs):
+        self._helix = helix
+        super(PooledTwitchAPIMixin, self).__init__(*args, **kwargs)
+
+    def _request(self, method, path, **kwargs):
+        rate_limiter = get_rate_limiter()
+        token_renewed = False
+
+        for _ in range(settings.POG_TWITCH["MAX_RETRIES"] + 1):
+            rate_limiter.acquire()
+            self._response = get_http_session().request(
+                method, urljoin(settings.POG_TWITCH["HELIX_URL"], path), headers=self._get_request_headers(), **kwargs
+            )
+
+            remaining = self._response.headers.get("Ratelimit-Remaining")
+            reset = self._response.headers.get("Ratelimit-Reset")
+
+            # If status code is 429, someone else consumed the budget: we wait for the reset
+            # announced by Twitch before retrying.
+            if self._response.status_code == codes.TOO_MANY_REQUESTS:
+                rate_limiter.block(until=int(reset) if reset else time.time() + 1)
+                continue
+
+            if (
+                self._response.status_code == codes.UNAUTHORIZED
+                and self._helix is not None
+                and self._helix.can_renew_oauth
+                and not token_renewed
+            ):
+                self._oauth_token = self._helix.renew_oauth(expired_token=self._oauth_token)
+                token_renewed = True
+                continue
+
+            if remaining:
+                rate_limiter.sync(remaining=int(remaining), reset=int(reset) if reset else None)
+
+            break
+
+        self._response.raise_for_status()
+        return self._response
+
+    def _request_get(self, path, params=None):
+        return self._request("GET", path, params=params).json()
+
+
+class HelixAPICursor(PooledTwitchAPIMixin, APICursor):
+    """
+    Unlike the original cursor, stops when Twitch does not return a cursor to
+    the next page, instead of fetching the first page again.
+    """
+
+    _last_page = False
 
     def next_page(self):
-        if self._cursor:
-            self._params["after"] = self._cursor
-        elif self._last_page:
+        if self._last_page:
             return None
 
-        response = self._request_get(self._path, params=self._params)
+        queue = super(HelixAPICursor, self).next_page()
+        if not self._cursor:
+            self._last_page = True
+
+        return queue
+
+
+class HelixAPIGet(PooledTwitchAPIMixin, APIGet):
+    pass
+
+
+class ScheduleAPICursor(HelixAPICursor):
+    """
+    The API response is not of the same format for schedule calls.
+
+    Twitch cannot end the schedule at some date, so if `end_time` is given,
+    the cursor stops by itself at the first segment starting after it, without
+    fetching the next pages. While a page is consumed, the next one is fetched
+    in the background.
+    """
 
-        if response["data"]["segments"] is None:
+    def __init__(self, *args, end_time: datetime.datetime = None, prefetch=True, **kwargs):
+        self._end_time = end_time
+        self._prefetch = prefetch
+        self._next_page = None
+
+        # The first page is fetched by the parent constructor, and the second
+        # one, prefetched.
+        super(ScheduleAPICursor, self).__init__(*args, **kwargs)
+
+    def _cancel_prefetch(self):
+        """
+        Cancels the next page prefetch, if any: once the end time is reached,
+        no page after it is needed.
+        """
+        if self._next_page is not None:
+            self._next_page.cancel()
+            self._next_page = None
+
+    def _fetch_page(self, cursor):
+        params = {**self._params, "after": cursor} if cursor else self._params
+        return self._request_get(self._path, params=params)
+
+    def next_page(self):
+        if self._next_page is not None:
+            response = self._next_page.result()
+            self._next_page = None
+        elif self._last_page:
             return None
+        else:
+            response = self._fetch_page(self._cursor)
 
-        self._queue = [self._resource.construct_from(data) for data in response["data"]["segments"]]
+        segments = response["data"]["segments"] or []
         self._cursor = response["pagination"].get("cursor")
         self._total = response.get("total")
 
+        # Segments are sorted by start time, so the window ends at the first
+        # one starting after the end time.
+        if self._end_time is not None:
+            in_window = [segment for segment in segments if isoparse(segment["start_time"]) < self._end_time]
+            if len(in_window) < len(segments):
+                segments = in_window
+                self._cursor = None
+                self._cancel_prefetch()
+
         if not self._cursor:
             self._last_page = True
+        elif self._prefetch:
+            self._next_page = get_prefetch_executor().submit(self._fetch_page, self._cursor)
 
+        self._queue = [self._resource.construct_from(data) for data in segments]
         return self._queue
 
 
-class APIEventSub(TwitchAPIMixin):
-    def __init__(self, client_id, path, resource=None, oauth_token=None, params=None):
-        super(APIEventSub, self).__init__()
+class APIEventSub(PooledTwitchAPIMixin):
+    def __init__(self, client_id, path, resource=None, oauth_token=None, params=None, helix=None):
+        super(APIEventSub, self).__init__(helix=helix)
         self._path = path
         self._resource = resource
         self._client_id = client_id
         self._oauth_token = oauth_token
         self._params = params
 
-        self._url = urljoin(BASE_HELIX_URL, path)
-        self._headers = self._get_request_headers()
-
-    def _rate_limit_exceeded(self):
-        remaining = self._response.headers.get("Ratelimit-Remaining")
-        if remaining:
-            self._rate_limit_remaining = int(remaining)
-
-        reset = self._response.headers.get("Ratelimit-Reset")
-        if reset:
-            self._rate_limit_resets.add(int(reset))
-
-        return self._response.status_code == codes.TOO_MANY_REQUESTS
-
     def _request_post(self, path, params=None):
-        self._headers["Content-Type"] = "application/json"
-
-        self._wait_for_rate_limit_reset()
-        self._response = requests.post(self._url, json=params, headers=self._headers)
-
-        # If status code is 429, re-run _request_post which will wait for the appropriate time
-        # to obey the rate limit
-        if self._rate_limit_exceeded():
-            return self._request_post(path, params=params)
-
-        self._response.raise_for_status()
-        return self._response.json()
+        return self._request("POST", path, json=params).json()
 
     def post(self):
         response = self._request_post(self._path, params=self._params)
@@ -97,16 +247,7 @@ class APIEventSub(TwitchAPIMixin):
         # return [self._resource.construct_from(data) for data in response["data"]]
 
     def _request_delete(self, path, params=None):
-        self._wait_for_rate_limit_reset()
-        self._response = requests.delete(self._url, params=params, headers=self._headers)
-
-        # If status code is 429, re-run _request_post which will wait for the appropriate time
-        # to obey the rate limit
-        if self._rate_limit_exceeded():
-            return self._request_delete(path, params=params)
-
-        self._response.raise_for_status()
-        return self._response
+        return self._request("DELETE", path, params=params)
 
     def delete(self):
         return self._request_delete(self._path, params=self._params)
@@ -118,18 +259,312 @@ class TwitchHelix(TwitchHelixOriginal):
     to extend the `twitch` lib API.
     """
 
+    def __init__(self, *args, **kwargs):
+        super(TwitchHelix, self).__init__(*args, **kwargs)
+        self._oauth_expires_at = None
+        self._cache_stats = Counter()
+        self._cache_stats_lock = threading.Lock()
+
+    @property
+    def cache_stats(self):
+        """
+        The responses cache hits and misses counters of this client, per
+        endpoint (e.g. `{"streams.hits": 70, "streams.misses": 10}`).
+        """
+        with self._cache_stats_lock:
+            return dict(self._cache_stats)
+
+    def _cached_lookup(self, endpoint, keys, fetch, key_of):
+        """
+        Looks up Helix objects by key (e.g. user ID) through the shared cache.
+        Each object is cached under its own key for the endpoint's TTL (see
+        `POG_TWITCH["CACHE_TTL"]`), so only the keys not in the cache are
+        fetched. Keys Twitch returned nothing for are cached too, as e.g. most
+        streamers are offline most of the time.
+
+        :param endpoint: The endpoint name, used for cache keys, TTL, and stats.
+        :param keys: The keys to look up.
+        :param fetch: A function fetching the objects for the given keys (not in
+                      the cache) from Twitch.
+        :param key_of: A function returning the key of an object fetched.
+        :return: The list of objects found, in the keys order.
+        """
+        cache = caches[settings.POG_TWITCH["CACHE"]]
+        cache_keys = {str(key): f"twitch-{endpoint}:{key}" for key in keys}
+
+        cached = cache.get_many(cache_keys.values())
+        objects = {key: cached[cache_key] for key, cache_key in cache_keys.items() if cache_key in cached}
+        missing = [key for key in cache_keys if key not in objects]
+
+        with self._cache_stats_lock:
+            self._cache_stats[f"{endpoint}.hits"] += len(objects)
+            self._cache_stats[f"{endpoint}.misses"] += len(missing)
+
+        if missing:
+            fetched = {str(key_of(obj)): obj for obj in fetch(missing)}
+            cache.set_many(
+                {cache_keys[key]: fetched.get(key) for key in missing},
+                timeout=settings.POG_TWITCH["CACHE_TTL"][endpoint],
+            )
+            objects.update(fetched)
+
+        return [objects[key] for key in cache_keys if objects.get(key) is not None]
+
+    @staticmethod
+    def _fetch_in_chunks(keys, fetch_chunk, chunk_size=100):
+        """
+        Fetches objects for many keys from an endpoint accepting at most
+        `chunk_size` keys per request. The chunks are fetched concurrently.
+
+        :param keys: The keys (e.g. user IDs).
+        :param fetch_chunk: A function fetching the objects for up to
+                            `chunk_size` keys.
+        :param chunk_size: The maximal amount of keys per request.
+        :return: The list of objects fetched, in the chunks order.
+        """
+        keys = list(keys)
+        chunks = [keys[i : i + chunk_size] for i in range(0, len(keys), chunk_size)]
+
+        if len(chunks) <= 1:
+            return [obj for chunk in chunks for obj in fetch_chunk(chunk)]
+
+        with ThreadPoolExecutor(max_workers=min(len(chunks), settings.POG_TWITCH["CONCURRENCY"])) as executor:
+            return [obj for objects in executor.map(lambda chunk: list(fetch_chunk(chunk)), chunks) for obj in objects]
+
+    def _get_streams_by_ids(self, user_ids):
+        return self._fetch_in_chunks(
+            user_ids, lambda chunk: self.get_streams(user_ids=chunk, page_size=100, use_cache=False)
+        )
+
+    def _get_users_by_ids(self, ids):
+        return self._fetch_in_chunks(ids, lambda chunk: self.get_users(ids=chunk, use_cache=False))
+
+    def _get_users_by_logins(self, login_names):
+        return self._fetch_in_chunks(login_names, lambda chunk: self.get_users(login_names=chunk, use_cache=False))
+
     @property
     def has_oauth(self):
-        return self._oauth_token is not None
+        """
+        True if this client has an access token not about to expire.
+        """
+        if self._oauth_token is None:
+            return False
+
+        return (
+            self._oauth_expires_at is None
+            or self._oauth_expires_at - settings.POG_TWITCH["TOKEN_RENEWAL_MARGIN"] > timezone.now()
+        )
+
+    @property
+    def can_renew_oauth(self):
+        return bool(self._client_id and self._client_secret)
+
+    @property
+    def oauth_token(self):
+        """
+        The access token to use, renewed first if this client can do it and the
+        current one is about to expire.
+        """
+        if self.can_renew_oauth and not self.has_oauth:
+            self.ensure_oauth()
+        return self._oauth_token
+
+    @property
+    def _oauth_cache_key(self):
+        return f"twitch-app-access-token:{self._client_id}"
+
+    def get_oauth(self):
+        """
+        Requests a new app access token from Twitch, and uses it for this client.
+        Prefer `ensure_oauth`, which shares the token with other processes.
+        """
+        if not self.can_renew_oauth:
+            raise TwitchOAuthException("Client Id and Client Secret are not both present.")
+
+        params = {
+            "client_id": self._client_id,
+            "client_secret": self._client_secret,
+            "grant_type": "client_credentials",
+        }
+        if self._scopes:
+            params["scope"] = " ".join(self._scopes)
+
+        response = get_http_session().post(urljoin(settings.POG_TWITCH["OAUTH_URL"], "token"), params=params).json()
+
+        if "access_token" in response:
+            self._oauth_token = response["access_token"]
+            self._oauth_expires_at = timezone.now() + datetime.timedelta(seconds=response["expires_in"])
+        elif "message" in response:
+            raise TwitchOAuthException(response["message"])
+        else:
+            raise TwitchOAuthException()
+
+    def _load_cached_oauth(self, unless_token=None):
+        """
+        Uses the app access token stored in the shared cache, if it's still
+        valid and not `unless_token`.
+
+        :return: True if the cached token was used.
+        """
+        cached = caches[settings.POG_TWITCH["CACHE"]].get(self._oauth_cache_key)
+        if not cached or cached["token"] == unless_token:
+            return False
+
+        self._oauth_token = cached["token"]
+        self._oauth_expires_at = cached["expires_at"]
+        return self.has_oauth
+
+    def _request_and_cache_oauth(self, unless_token=None):
+        """
+        Requests a new app access token, then stores it in the shared cache, so
+        other processes can use it. Only one thread or process of this host
+        requests it at once; the others wait, then use the new token.
+        """
+        with file_lock(settings.POG_TWITCH["TOKEN_LOCK_FILE"]):
+            # Someone else may have renewed the token while we were waiting.
+            if self._load_cached_oauth(unless_token=unless_token):
+                return self._oauth_token
+
+            self.get_oauth()
+            caches[settings.POG_TWITCH["CACHE"]].set(
+                self._oauth_cache_key,
+                {"token": self._oauth_token, "expires_at": self._oauth_expires_at},
+                timeout=(self._oauth_expires_at - timezone.now()).total_seconds(),
+            )
+
+        return self._oauth_token
+
+    def ensure_oauth(self):
+        """
+        Ensures this client has a valid app access token, loading it from the
+        shared cache or requesting a new one if it's missing or about to expire.
+
+        :return: The access token.
+        """
+        if self.has_oauth or self._load_cached_oauth():
+            return self._oauth_token
+
+        return self._request_and_cache_oauth()
+
+    def renew_oauth(self, expired_token):
+        """
+        Renews the app access token after Twitch refused it, unless another
+        thread or process already did.
+
+        :param expired_token: The token Twitch refused.
+        :return: The new access token.
+        """
+        return self._request_and_cache_oauth(unless_token=expired_token)
+
+    def get_streams(
+        self,
+        after=None,
+        before=None,
+        community_ids=None,
+        page_size=20,
+        game_ids=None,
+        languages=None,
+        user_ids=None,
+        user_logins=None,
+        use_cache=True,
+    ):
+        """
+        Same as the original `get_streams`, but requests are sent through the
+        shared HTTP session.
+
+        If only `user_ids` are given, streams are looked up through the shared
+        cache (unless `use_cache` is False), any number of IDs can be given (they
+        are requested by chunks of 100, concurrently), and a list is returned
+        instead of a cursor.
+        """
+        if user_ids and not any((after, before, community_ids, game_ids, languages, user_logins)):
+            if use_cache:
+                return self._cached_lookup(
+                    "streams",
+                    user_ids,
+                    fetch=self._get_streams_by_ids,
+                    key_of=lambda stream: stream["user_id"],
+                )
+            elif len(user_ids) > 100:
+                return self._get_streams_by_ids(user_ids)
+
+        for name, values in (
+            ("Community IDs", community_ids),
+            ("Game IDs", game_ids),
+            ("languages", languages),
+            ("User IDs", user_ids),
+            ("User login names", user_logins),
+        ):
+            if values and len(values) > 100:
+                raise TwitchAttributeException(f"Maximum of 100 {name} can be supplied")
+        if page_size > 100:
+            raise TwitchAttributeException("Maximum number of objects to return is 100")
+
+        params = {
+            "after": after,
+            "before": before,
+            "community_id": community_ids,
+            "first": page_size,
+            "game_id": game_ids,
+            "language": languages,
+            "user_id": user_ids,
+            "user_login": user_logins,
+        }
+
+        return HelixAPICursor(
+            client_id=self._client_id,
+            oauth_token=self.oauth_token,
+            helix=self,
+            path="streams",
+            resource=Stream,
+            params=params,
+        )
+
+    def get_users(self, login_names=None, ids=None, use_cache=True):
+        """
+        Same as the original `get_users`, but requests are sent through the
+        shared HTTP session, users are looked up through the shared cache
+        (unless `use_cache` is False), and any number of logins and IDs can be
+        given (they are requested by chunks of 100, concurrently).
+        https://dev.twitch.tv/docs/api/reference#get-users
+        """
+        login_names = list(login_names or [])
+        ids = list(ids or [])
+
+        if use_cache:
+            users = self._cached_lookup("users", ids, fetch=self._get_users_by_ids, key_of=lambda user: user["id"])
+            users_by_login = self._cached_lookup(
+                "users-by-login",
+                [login.lower() for login in login_names],
+                fetch=self._get_users_by_logins,
+                key_of=lambda user: user["login"],
+            )
+        elif len(login_names) + len(ids) > 100:
+            users = self._get_users_by_ids(ids)
+            users_by_login = self._get_users_by_logins(login_names)
+        else:
+            return HelixAPIGet(
+                client_id=self._client_id,
+                oauth_token=self.oauth_token,
+                helix=self,
+                path="users",
+                resource=User,
+                params={"login": login_names, "id": ids},
+            ).fetch()
+
+        users_ids = {user["id"] for user in users}
+        return users + [user for user in users_by_login if user["id"] not in users_ids]
 
     def get_schedule(
         self,
         broadcaster_id,
         segments_ids=None,
         start_time: datetime.datetime = None,
+        end_time: datetime.datetime = None,
         tz=None,
         page_size=20,
         after=None,
+        prefetch=True,
     ):
         """
         Loads the broadcaster's schedule.
@@ -138,46 +573,63 @@ class TwitchHelix(TwitchHelixOriginal):
         :param segments_ids: The ID of the stream segment to return (maximum 100).
         :param start_time: A date to start returning stream segments from. If not
                            specified, the current date and time is used.
+        :param end_time: A date to stop returning stream segments at: segments
+                         starting at or after this date are not returned, and
+                         the next pages are not fetched. If not specified, the
+                         whole schedule is returned.
         :param tz: A pytz timezone.
                    This is recommended to ensure stream segments are returned for
-                   the correct week. If not specified, GMT is used.
-        :param page_size: Maximum number of stream segments to return.
+                   the correct week. If not specified, GMT is used. Also used for
+                   naive start and end dates.
+        :param page_size: Maximum number of stream segments to return (maximum 25).
         :param after: Cursor for forward pagination: tells the server where to start
                       fetching the next set of results in a multi-page response.
                       The cursor value specified here is from the pagination response
                       field of a prior query.
+        :param prefetch: If True, the next page is fetched in the background
+                         while the current one is consumed.
 
         :return: APICursor containing broadcaster schedule segments; see the structure
                  in the Twitch docs.
                  https://dev.twitch.tv/docs/api/reference#get-channel-stream-schedule
         """
-        if page_size > 100:
-            raise TwitchAttributeException("Maximum number of objects to return is 100")
+        if page_size > 25:
+            raise TwitchAttributeException("Maximum number of objects to return is 25")
 
         if tz is None:
             tz = pytz.UTC
 
+        def make_aware(date):
+            if isinstance(date, str):
+                date = datetime.datetime.fromisoformat(date)
+            if not timezone.is_aware(date):
+                date = timezone.make_aware(date, tz)
+            return date
+
         if start_time is not None:
-            if isinstance(start_time, datetime.datetime) and not timezone.is_aware(start_time):
-                start_time = timezone.make_aware(start_time, tz)
-            elif isinstance(start_time, str):
-                start_time = timezone.make_aware(datetime.datetime.fromisoformat(start_time), tz)
+            start_time = make_aware(start_time)
+        if end_time is not None:
+            end_time = make_aware(end_time)
 
         params = {
             "broadcaster_id": broadcaster_id,
             "id": segments_ids,
-            "start_time": start_time.toisoformat() if start_time is not None else None,
-            "utc_offset": tz.utcoffset(pytz.UTC).seconds // 60,
+            # Twitch expects a RFC 3339 date in UTC.
+            "start_time": start_time.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ") if start_time else None,
+            "utc_offset": int((start_time or timezone.now()).astimezone(tz).utcoffset().total_seconds() // 60),
             "after": after,
             "first": page_size,
         }
 
         return ScheduleAPICursor(
             client_id=self._client_id,
-            oauth_token=self._oauth_token,
+            oauth_token=self.oauth_token,
+            helix=self,
             path="schedule",
             resource=Schedule,
             params=params,
+            end_time=end_time,
+            prefetch=prefetch,
         )
 
     def eventsub_subscribe(
@@ -224,7 +676,8 @@ class TwitchHelix(TwitchHelixOriginal):
 
         return APIEventSub(
             client_id=self._client_id,
-            oauth_token=self._oauth_token,
+            oauth_token=self.oauth_token,
+            helix=self,
             path="eventsub/subscriptions",
             resource=EventSubSubscriptionCreated,
             params=params,
@@ -239,23 +692,52 @@ class TwitchHelix(TwitchHelixOriginal):
         """
         return APIEventSub(
             client_id=self._client_id,
-            oauth_token=self._oauth_token,
+            oauth_token=self.oauth_token,
+            helix=self,
             path="eventsub/subscriptions",
             params={"id": str(uuid)},
         ).delete()
 
+    def eventsub_list_subscriptions(self, status=None, event_type=None):
+        """
+        Lists the EventSub subscriptions of the application, whatever their
+        callback URL.
+
+        :param status: Only returns subscriptions with this status (e.g. `enabled`).
+        :param event_type: Only returns subscriptions of this type.
+        :return: APICursor containing the subscriptions, as plain dicts (dates
+                 are not parsed); see the structure in the Twitch docs.
+                 https://dev.twitch.tv/docs/api/reference#get-eventsub-subscriptions
+        """
+        return HelixAPICursor(
+            client_id=self._client_id,
+            oauth_token=self.oauth_token,
+            helix=self,
+            path="eventsub/subscriptions",
+            resource=EventSubSubscriptionListed,
+            params={"status": status, "type": event_type},
+        )
+
 
-_client = TwitchHelix(
-    client_id=settings.SOCIAL_AUTH_TWITCH_KEY,
-    client_secret=settings.SOCIAL_AUTH_TWITCH_SECRET,
-    scopes=[],
-)
+_client = None
+_client_lock = threading.Lock()
 
 
 def get_twitch_client():
     """
-    Returns a configured Twitch Helix client, with a valid access token.
+    Returns a configured Twitch Helix client, with a valid access token. The
+    client is created on first use.
     """
-    if not _client.has_oauth:
-        _client.get_oauth()
+    global _client
+
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = TwitchHelix(
+                    client_id=settings.SOCIAL_AUTH_TWITCH_KEY,
+                    client_secret=settings.SOCIAL_AUTH_TWITCH_SECRET,
+                    scopes=[],
+                )
+
+    _client.ensure_oauth()
     return _client
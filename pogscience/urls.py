@@ -32,5 +32,18 @@ urlpatterns = [
 # Serves media in debug mode
 if settings.DEBUG:
     from django.conf.urls.static import static
+    from django.views.static import serve
 
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    from pogscience.storage import ContentHashedStorage
+
+    def serve_media(request, path, document_root=None, show_indexes=False):
+        """
+        Serves media like the production web server should: files named after
+        their content can be cached forever.
+        """
+        response = serve(request, path, document_root, show_indexes)
+        if ContentHashedStorage.is_hashed(path):
+            response["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+    urlpatterns += static(settings.MEDIA_URL, view=serve_media, document_root=settings.MEDIA_ROOT)
@@ -10,7 +10,7 @@ from django.utils.html import format_html
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from streamers.models import EventSubSubscription, User, Streamer, ScheduledStream
+from streamers.models import EventSubSubscription, User, Streamer, ScheduledStream, RecurringStream
 
 admin.site.register(User, UserAdmin)
 admin.site.register(EventSubSubscription)
@@ -91,12 +91,13 @@ class StreamerAdmin(admin.ModelAdmin):
         return format_html(
             """
             <div style="display: flex; flex-direction: row; align-items: center;">
-                <figure style="margin: 4px"><img src="{}{}" alt="{}" style="border-radius: 31415926535px; width: 60px; height: 60px;" /></figure>
+                <figure style="margin: 4px"><img src="{}{}" srcset="{}" sizes="60px" alt="{}" style="border-radius: 31415926535px; width: 60px; height: 60px;" /></figure>
                 <p style="flex: 4">{}<br /><span style="color: #ccc; font-weight: normal;">@{}</span><br/>{}</p>
             </div>
             """,
             settings.MEDIA_URL,
             instance.profile_image,
+            instance.profile_image_srcset.get("webp", ""),
             instance.name,
             instance.name,
             instance.twitch_login,
@@ -175,3 +176,15 @@ class ScheduledStreamAdmin(admin.ModelAdmin):
         return format_html(
             '<a href="{}">{}</a>', f"https://twitch.tv/{instance.streamer.twitch_login}", instance.streamer.name
         )
+
+
+@admin.register(RecurringStream)
+class RecurringStreamAdmin(admin.ModelAdmin):
+    list_display = ("title", "streamer_link", "category", "start", "until", "duration")
+    list_filter = ("streamer", "category")
+    list_select_related = ("streamer",)
+    ordering = ("start",)
+    search_fields = ("title", "streamer__name", "streamer__twitch_login", "category")
+    readonly_fields = ("twitch_segment_id", "skipped")
+
+    streamer_link = ScheduledStreamAdmin.streamer_link
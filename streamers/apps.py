@@ -1,6 +1,17 @@
+from datetime import timedelta
+
 from django.apps import AppConfig
+from django.conf import settings
+
+from pogscience.background import register_periodic_task
 
 
 class StreamersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "streamers"
+
+    def ready(self):
+        # Every web process checks each minute whether a sync is due; the
+        # last sync time is shared by all of them (see `sync_schedules_if_due`).
+        if settings.POG_SCHEDULE["SYNC_PERIOD"] is not None:
+            register_periodic_task("streamers.sync.engine.sync_schedules_if_due", timedelta(minutes=1))
@@ -0,0 +1,201 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from uuid import UUID
+
+from django.conf import settings
+from django.core.management.utils import get_random_secret_key
+from django.urls import reverse
+from requests import HTTPError, RequestException, codes
+
+from streamers.models import EventSubSubscription, Streamer
+
+# Twitch statuses of the subscriptions delivering (or about to deliver)
+# notifications, with the corresponding local status.
+HEALTHY_STATUSES = {
+    "enabled": EventSubSubscription.SUBSCRIBED,
+    "webhook_callback_verification_pending": EventSubSubscription.PENDING,
+}
+
+
+def get_callback_url():
+    """Returns the URL Twitch must send the EventSub notifications to."""
+    return f"https://{settings.HOST}{reverse('streamers:eventsub-ingest')}"
+
+
+class ReconciliationPlan:
+    """
+    The changes needed for Twitch and the database to agree on exactly one
+    healthy subscription per streamer and event type.
+    """
+
+    def __init__(self):
+        # (streamer, event type) couples to subscribe to.
+        self.to_create = []
+
+        # (UUID, local subscription or None, Twitch subscription) triplets to
+        # delete from Twitch, and from the database if known there.
+        self.to_delete = []
+
+        # Local subscriptions unknown to Twitch, to delete from the database.
+        self.to_forget = []
+
+        # (local subscription, status) couples, for healthy subscriptions with
+        # an out-of-date status in the database.
+        self.to_update = []
+
+        # The count of healthy subscriptions, already up-to-date.
+        self.unchanged = 0
+
+    @property
+    def api_calls(self) -> int:
+        """The number of Twitch API calls needed to apply the plan."""
+        return len(self.to_create) + len(self.to_delete)
+
+    def __bool__(self):
+        return bool(self.to_create or self.to_delete or self.to_forget or self.to_update)
+
+
+def plan_reconciliation(client, callback_url=None) -> ReconciliationPlan:
+    """
+    Lists the subscriptions known by Twitch, and diffs them against the ones
+    stored in the database and the expected ones (see
+    `Streamer.EVENTSUB_SUBSCRIPTIONS`).
+
+    A stored subscription is kept if Twitch knows it with a healthy status and
+    our callback URL; else it is deleted and subscribed again. Twitch
+    subscriptions to our callback URL we don't know are deleted, as we cannot
+    authenticate their notifications without their secret. Twitch subscriptions
+    to other URLs are left alone, unless they are stored in the database (e.g.
+    the callback URL changed), as they may belong to another installation using
+    the same Twitch application.
+
+    :param client: The Twitch client.
+    :param callback_url: Our callback URL; if not given, the current one.
+    :return: The reconciliation plan.
+    """
+    callback_url = callback_url or get_callback_url()
+    plan = ReconciliationPlan()
+
+    remote_subscriptions = {sub["id"]: sub for sub in client.eventsub_list_subscriptions()}
+    kept = set()
+
+    for sub in EventSubSubscription.objects.select_related("streamer"):
+        uuid = str(sub.uuid)
+        remote_sub = remote_subscriptions.pop(uuid, None)
+
+        if remote_sub is None:
+            plan.to_forget.append(sub)
+        elif (
+            remote_sub["status"] in HEALTHY_STATUSES
+            and remote_sub["transport"].get("callback") == callback_url
+            and sub.type in Streamer.EVENTSUB_SUBSCRIPTIONS
+            and (sub.streamer_id, sub.type) not in kept
+        ):
+            kept.add((sub.streamer_id, sub.type))
+            status = HEALTHY_STATUSES[remote_sub["status"]]
+            if sub.status != status:
+                plan.to_update.append((sub, status))
+            else:
+                plan.unchanged += 1
+        else:
+            plan.to_delete.append((uuid, sub, remote_sub))
+
+    for uuid, remote_sub in remote_subscriptions.items():
+        if remote_sub["transport"].get("callback") == callback_url:
+            plan.to_delete.append((uuid, None, remote_sub))
+
+    for streamer in Streamer.objects.all():
+        for event_type in Streamer.EVENTSUB_SUBSCRIPTIONS:
+            if (streamer.pk, event_type) not in kept:
+                plan.to_create.append((streamer, event_type))
+
+    return plan
+
+
+def _subscribe(client, streamer: Streamer, event_type: str, callback_url: str) -> EventSubSubscription:
+    """
+    Subscribes to a streamer's event. Runs in a worker thread, so the returned
+    subscription is not saved.
+    """
+    secret = get_random_secret_key()
+    sub = client.eventsub_subscribe(
+        event_type=event_type,
+        callback_url=callback_url,
+        secret=secret,
+        event_condition={"broadcaster_user_id": str(streamer.twitch_id)},
+    )[0]
+
+    return EventSubSubscription(
+        streamer=streamer,
+        type=sub["type"],
+        uuid=UUID(sub["id"]),
+        secret=secret,
+        status=EventSubSubscription.PENDING,
+    )
+
+
+def _check_error(future, missing_ok=False):
+    """
+    Returns the error raised by the given future, if any. Only HTTP errors are
+    returned, others are raised again. If `missing_ok`, a 404 response is not an
+    error (e.g. the subscription to delete is already gone).
+    """
+    error = future.exception()
+    if error is None:
+        return None
+
+    if not isinstance(error, RequestException):
+        raise error
+
+    if missing_ok and isinstance(error, HTTPError) and error.response.status_code == codes.NOT_FOUND:
+        return None
+
+    return error
+
+
+def apply_reconciliation(client, plan: ReconciliationPlan, callback_url=None, concurrency=8):
+    """
+    Applies a reconciliation plan. Subscriptions are deleted first, so the new
+    ones don't conflict with the broken ones they replace. The Twitch API calls
+    are sent concurrently, and the database updated from this thread as they
+    complete.
+
+    :param client: The Twitch client.
+    :param plan: The plan to apply, from `plan_reconciliation`.
+    :param callback_url: Our callback URL; if not given, the current one.
+    :param concurrency: How many Twitch API calls are sent in parallel.
+    :return: A generator yielding, for each Twitch API call completed, a
+             `(action, description, error)` triplet, `action` being either
+             `"delete"` or `"create"`, and `error` an HTTP error, or None if the
+             call succeeded.
+    """
+    callback_url = callback_url or get_callback_url()
+
+    for sub, status in plan.to_update:
+        sub.status = status
+    EventSubSubscription.objects.bulk_update([sub for sub, _ in plan.to_update], ["status"])
+    EventSubSubscription.objects.filter(pk__in=[sub.pk for sub in plan.to_forget]).delete()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(client.eventsub_delete_subscription, uuid=uuid): (sub, remote_sub)
+            for uuid, sub, remote_sub in plan.to_delete
+        }
+        for future in as_completed(futures):
+            sub, remote_sub = futures[future]
+            error = _check_error(future, missing_ok=True)
+            if error is None and sub is not None:
+                sub.delete()
+
+            yield "delete", f"{remote_sub['type']} {remote_sub['condition'].get('broadcaster_user_id')}", error
+
+        futures = {
+            executor.submit(_subscribe, client, streamer, event_type, callback_url): (streamer, event_type)
+            for streamer, event_type in plan.to_create
+        }
+        for future in as_completed(futures):
+            streamer, event_type = futures[future]
+            error = _check_error(future)
+            if error is None:
+                future.result().save()
+
+            yield "create", f"{event_type} {streamer.name}", error
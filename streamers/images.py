@@ -0,0 +1,100 @@
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+from pogscience.storage import ContentHashedStorage
+
+
+def supported_formats():
+    """
+    Returns the configured derivatives formats supported by this installation
+    of PIL (e.g. AVIF needs a recent version, or a plugin), best ones first.
+    """
+    # PIL is slow to import, and only needed when images are stored.
+    from PIL import Image
+
+    Image.init()
+    return [fmt for fmt in settings.POG_IMAGES["FORMATS"] if fmt.upper() in Image.SAVE]
+
+
+def generate_derivatives(field) -> dict:
+    """
+    Generates resized versions of the image stored in the given image field,
+    in each supported format, for each width configured for this field in
+    `POG_IMAGES`. Images are never enlarged: if the original is smaller than
+    every width, a single derivative is generated at the original size. Images
+    without widths configured (e.g. live previews) have no derivatives.
+
+    The derivatives are stored next to the original, with the same storage
+    (so they replace the previous ones, see `pogscience.storage`).
+
+    :param field: The image field file (e.g. `streamer.profile_image`).
+    :return: A dict ready to be stored as JSON, with, for each format, a dict
+             associating the derivatives widths (as strings) to their names in
+             the storage.
+    """
+    widths = settings.POG_IMAGES["WIDTHS"].get(field.field.name, [])
+    if not field or not widths:
+        return {}
+
+    from PIL import Image
+
+    with field.open("rb") as original_file:
+        original = Image.open(original_file)
+        original.load()
+
+    # WebP and AVIF encoders only accept RGB(A) images (e.g. not palettes).
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+    widths = [width for width in widths if width <= original.width] or [original.width]
+    # Derivatives are named after the original name, as the storage may have
+    # added a content hash to the stored one.
+    root, _ = os.path.splitext(field.field.generate_filename(field.instance, os.path.basename(field.name)))
+    derivatives = {}
+
+    for width in widths:
+        height = round(original.height * width / original.width)
+        resized = original.resize((width, height), Image.LANCZOS) if width != original.width else original
+
+        for fmt in supported_formats():
+            content = BytesIO()
+            resized.save(content, fmt.upper(), quality=settings.POG_IMAGES["QUALITY"])
+
+            name = field.storage.save(f"{root}-{width}w.{fmt}", ContentFile(content.getvalue()))
+            derivatives.setdefault(fmt, {})[str(width)] = name
+
+    return derivatives
+
+
+def srcsets(field, metadata) -> dict:
+    """
+    Builds the `srcset` attributes listing the derivatives of an image.
+
+    Content-hashed derivatives (see `ContentHashedStorage`) never change, so
+    their URLs are used as is. Others are overwritten when the image changes,
+    so their URLs are versioned with the image content `sha256`.
+
+    :param field: The image field file (e.g. `streamer.profile_image`).
+    :param metadata: The image metadata, with its `derivatives` (see
+                     `generate_derivatives`) and its content `sha256`.
+    :return: A dict associating each format to its `srcset` (e.g. `{"webp":
+             "/media/….0123456789ab.webp 64w, /media/….456789abcdef.webp
+             128w"}`), best formats first.
+    """
+    if not field or not metadata.get("derivatives"):
+        return {}
+
+    version = metadata.get("sha256", "")[:12]
+
+    def url(name):
+        if ContentHashedStorage.is_hashed(name):
+            return field.storage.url(name)
+        return f"{field.storage.url(name)}?v={version}"
+
+    return {
+        fmt: ", ".join(f"{url(name)} {width}w" for width, name in derivatives.items())
+        for fmt, derivatives in metadata["derivatives"].items()
+    }
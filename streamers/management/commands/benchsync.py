@@ -0,0 +1,234 @@
+import itertools
+import re
+import time
+import tracemalloc
+
+import djclick as click
+
+from pogscience.standin import SyntheticRoster
+from streamers.models import Streamer
+from streamers.sync.matching import StreamerMatcher, streamer_aliases
+from streamers.sync.engine import StageTimer, match_calendar, merge, normalize_calendar, normalize_twitch
+from streamers.sync.merging import ScheduleMerger
+
+
+def naive_match_event(aliases, summary, location=None):
+    """
+    The reference matching, testing every alias against the event; used to
+    check the results of `StreamerMatcher.match_event`, and compare timings.
+    """
+    candidates = []
+    names_in_summary = []
+
+    def add_candidate(streamer, weight):
+        if not any(streamer.name == candidate.name for candidate, _ in candidates):
+            candidates.append((streamer, weight))
+
+    match = StreamerMatcher.RE_TWITCH_LINK.search(location) if location else None
+    streamer = aliases.get(match.group("twitch_login").lower()) if match else None
+    if streamer:
+        add_candidate(streamer, StreamerMatcher.LOCATION_WEIGHT)
+        names_in_summary.extend([streamer.name, streamer.twitch_login])
+
+    for name, streamer in aliases.items():
+        if summary.startswith(name):
+            add_candidate(streamer, StreamerMatcher.START_WEIGHT)
+            names_in_summary.append(name)
+
+    for name, streamer in aliases.items():
+        if name in summary:
+            add_candidate(streamer, StreamerMatcher.ANYWHERE_WEIGHT)
+            names_in_summary.append(name)
+            break
+
+    title = summary
+    for name in names_in_summary:
+        title, n = re.subn(r"^" + re.escape(name) + r"\s{0,3}[/:–—-]", "", summary)
+        if n > 0:
+            title = title.strip()
+            break
+
+    return sorted(candidates, key=lambda candidate: candidate[1], reverse=True), title
+
+
+def naive_merge_events(twitch_events, gcal_events):
+    """
+    The reference merge, scanning every Twitch event of each candidate
+    streamer; used to check the results of `ScheduleMerger`, and compare
+    timings. On conflicts, the last Google Calendar event (by start) wins.
+    """
+    twitch_events_by_streamer = {}
+    for event in twitch_events:
+        twitch_events_by_streamer.setdefault(event.streamer.twitch_login, []).append(event)
+
+    merged = {}
+    unique_gcal_events = []
+    for gcal_event in gcal_events:
+        merge_with = None
+        for potential_streamer, _ in gcal_event.candidates:
+            for twitch_event in sorted(
+                twitch_events_by_streamer.get(potential_streamer.twitch_login, []), key=lambda event: event.start
+            ):
+                if twitch_event.start <= gcal_event.end and twitch_event.end >= gcal_event.start:
+                    merge_with = twitch_event
+                    break
+            if merge_with:
+                break
+
+        if merge_with:
+            winner = gcal_event
+            if id(merge_with) in merged:
+                winner = max(
+                    merged[id(merge_with)], gcal_event, key=lambda event: (event.start, event.google_calendar_event_id)
+                )
+            merged[id(merge_with)] = winner
+            merge_with.google_calendar_event_id = winner.google_calendar_event_id
+        else:
+            unique_gcal_events.append(gcal_event)
+
+    return unique_gcal_events
+
+
+def timed(label, func, count=None, unit=None):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+
+    click.echo(f"  {label}: {elapsed * 1000:.1f} ms", nl=False)
+    click.echo(f" ({count / elapsed:,.0f} {unit}/s)" if count and elapsed else "")
+    return result
+
+
+@click.command()
+@click.option("--streamers", default=1000, show_default=True, help="The size of the synthetic roster.")
+@click.option("--events", default=5000, show_default=True, help="How many Google Calendar events are matched.")
+@click.option("--seed", default=42, show_default=True, help="The synthetic roster random seed.")
+@click.option(
+    "--compare",
+    is_flag=True,
+    help="Also runs the reference implementation of each stage, and checks both agree.",
+)
+def command(streamers, events, seed, compare):
+    """
+    Benchmarks the schedules sync stages.
+
+    Runs each stage of the schedules sync engine (see `streamers.sync.engine`)
+    on a synthetic roster (the same one the `standin` command serves), without
+    any network or database access, and prints its timings; then runs them all
+    at once, as the engine streams them, with the time spent in each one.
+    """
+    click.secho("Generating the synthetic roster...", fg="cyan", bold=True, nl=False)
+    roster = SyntheticRoster(size=streamers, base_url="http://standin", seed=seed)
+    roster_streamers = [
+        Streamer(pk=int(user["id"]), name=user["display_name"], twitch_login=user["login"], twitch_id=int(user["id"]))
+        for user in roster.users
+    ]
+    streamers_by_id = {str(streamer.twitch_id): streamer for streamer in roster_streamers}
+    twitch_schedules = [(streamers_by_id[user_id], segments) for user_id, segments in roster.schedules.items()]
+    gcal_events = list(itertools.islice(itertools.cycle(roster.calendar_events), events))
+    click.secho(" OK", fg="green", bold=True)
+    click.echo(
+        f"  {len(roster_streamers)} streamers, {sum(len(segments) for _, segments in twitch_schedules)} Twitch "
+        f"events, {len(gcal_events)} Google Calendar events."
+    )
+
+    click.secho("Normalizing events...", fg="cyan", bold=True)
+    twitch_records = timed("Twitch", lambda: list(normalize_twitch(twitch_schedules)))
+    gcal_records = timed("Google Calendar", lambda: list(normalize_calendar(gcal_events)))
+    twitch_events = [event for _, schedule in twitch_records for event in schedule]
+
+    click.secho("Matching Google Calendar events with streamers...", fg="cyan", bold=True)
+    matcher = timed("Building the matcher", lambda: StreamerMatcher(roster_streamers))
+    click.echo(f"  {len(matcher.aliases)} aliases.")
+
+    matched = timed(
+        "Matching",
+        lambda: [matcher.match_event(event.title, event.location) for event in gcal_records],
+        count=len(gcal_records),
+        unit="events",
+    )
+    click.echo(f"  {sum(1 for candidates, _ in matched if candidates)} events matched.")
+
+    if compare:
+        aliases = {}
+        for streamer in roster_streamers:
+            for alias in streamer_aliases(streamer):
+                if alias:
+                    aliases[alias] = streamer
+
+        reference = timed(
+            "Matching (reference)",
+            lambda: [naive_match_event(aliases, event.title, event.location) for event in gcal_records],
+            count=len(gcal_records),
+            unit="events",
+        )
+
+        differences = sum(1 for result, expected in zip(matched, reference) if tuple(result) != expected)
+        if differences:
+            click.secho(f"  {differences} events matched differently!", fg="red", bold=True)
+        else:
+            click.secho("  Same results.", fg="green", bold=True)
+
+    def matched_records():
+        """Fresh records, as the merge updates them in place."""
+        return list(match_calendar(normalize_calendar(gcal_events), matcher, [])), list(
+            normalize_twitch(twitch_schedules)
+        )
+
+    click.secho("Merging Twitch and Google Calendar events...", fg="cyan", bold=True)
+    merged_gcal_events, merged_schedules = matched_records()
+    merged_twitch_events = [event for _, schedule in merged_schedules for event in schedule]
+    merged_gcal_ids = {id(event) for event in merged_gcal_events}
+    merger = ScheduleMerger(merged_gcal_events)
+    schedules = timed(
+        "Merging",
+        lambda: list(merge(merged_schedules, merger)),
+        count=len(twitch_events) + len(merged_gcal_events),
+        unit="events",
+    )
+    unique_gcal_events = [event for _, schedule in schedules for event in schedule if id(event) in merged_gcal_ids]
+    click.echo(f"  Google Calendar events: {merger.stats}.")
+
+    if compare:
+        reference_gcal_events, reference_schedules = matched_records()
+        reference_twitch_events = [event for _, schedule in reference_schedules for event in schedule]
+        reference = timed(
+            "Merging (reference)",
+            lambda: naive_merge_events(reference_twitch_events, reference_gcal_events),
+            count=len(twitch_events) + len(reference_gcal_events),
+            unit="events",
+        )
+
+        def merge_result(twitch_events, unique_gcal_events):
+            # Schedules are released in the order the merge completes them.
+            return (
+                [event.google_calendar_event_id for event in twitch_events],
+                sorted(event.google_calendar_event_id for event in unique_gcal_events),
+            )
+
+        if merge_result(merged_twitch_events, unique_gcal_events) != merge_result(reference_twitch_events, reference):
+            click.secho("  Events merged differently!", fg="red", bold=True)
+        else:
+            click.secho("  Same results.", fg="green", bold=True)
+
+    def run_pipeline(timer):
+        pipeline_gcal_events = list(
+            timer.wrap("match", match_calendar(timer.wrap("normalize", normalize_calendar(gcal_events)), matcher, []))
+        )
+        pipeline = timer.wrap("normalize", normalize_twitch(twitch_schedules))
+        pipeline = timer.wrap("merge", merge(pipeline, ScheduleMerger(pipeline_gcal_events)))
+        for _ in pipeline:
+            pass
+
+    click.secho("Streaming every stage at once...", fg="cyan", bold=True)
+    timer = StageTimer()
+    run_pipeline(timer)
+    for stage, seconds in timer.timings.items():
+        click.echo(f"  {stage}: {seconds * 1000:.1f} ms")
+
+    # Measured apart, as tracing allocations slows everything down.
+    tracemalloc.start()
+    run_pipeline(StageTimer())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    click.echo(f"  Peak memory: {peak / 1024 / 1024:.1f} MiB (excluding the roster).")
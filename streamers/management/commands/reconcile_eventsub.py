@@ -0,0 +1,52 @@
+import djclick as click
+
+from pogscience.twitch import get_twitch_client
+from streamers.eventsub import apply_reconciliation, plan_reconciliation
+
+
+@click.command()
+@click.option("--dry-run", default=False, is_flag=True, help="Only displays the changes, without applying them.")
+@click.option(
+    "--concurrency",
+    default=8,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="How many Twitch API calls are sent in parallel.",
+)
+def command(dry_run, concurrency):
+    """
+    Reconciles the Twitch EventSub subscriptions with the database.
+
+    Lists the subscriptions known by Twitch, compares them with the stored
+    ones, then only creates, deletes or repairs the missing, unknown or broken
+    subscriptions. Use this instead of `unsubscribe` then `subscribe` when the
+    callback URL changes.
+    """
+    client = get_twitch_client()
+
+    click.secho("Loading EventSub subscriptions from Twitch...", fg="cyan", bold=True, nl=False)
+    plan = plan_reconciliation(client)
+    click.secho(" OK", fg="green", bold=True)
+
+    click.echo(f"  {plan.unchanged} subscriptions up-to-date.")
+    click.echo(f"  {len(plan.to_update)} subscriptions with an out-of-date status.")
+    click.echo(f"  {len(plan.to_forget)} subscriptions unknown to Twitch.")
+    click.echo(f"  {len(plan.to_delete)} subscriptions to delete from Twitch.")
+    click.echo(f"  {len(plan.to_create)} subscriptions to create.")
+
+    if dry_run or not plan:
+        return
+
+    errors = []
+    with click.progressbar(
+        apply_reconciliation(client, plan, concurrency=concurrency),
+        length=plan.api_calls,
+        label=click.style("Reconciling subscriptions...", fg="cyan", bold=True),
+        item_show_func=lambda result: result[1] if result is not None else None,
+    ) as bar:
+        for action, description, error in bar:
+            if error is not None:
+                errors.append((action, description, error))
+
+    for action, description, error in errors:
+        click.echo(click.style(f"* {action} {description}... ERR", fg="red", bold=True) + f" {error}")
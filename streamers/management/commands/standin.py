@@ -0,0 +1,98 @@
+import djclick as click
+from django.db import transaction
+
+from pogscience.standin import StandInServer, SyntheticRoster
+from streamers.models import Streamer
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", show_default=True, help="The interface to listen to.")
+@click.option("--port", default=8321, show_default=True, help="The port to listen to.")
+@click.option("--streamers", default=100, show_default=True, help="The size of the synthetic roster.")
+@click.option("--live-ratio", default=0.2, show_default=True, help="The part of the roster currently live.")
+@click.option("--seed", default=42, show_default=True, help="The synthetic roster random seed.")
+@click.option("--latency", default=0, show_default=True, help="The delay added to every response, in milliseconds.")
+@click.option("--jitter", default=0, show_default=True, help="A random delay added to every response, in milliseconds.")
+@click.option("--rate-limit", default=800, show_default=True, help="The Helix points budget per minute.")
+@click.option(
+    "--error-rate", default=0.0, show_default=True, help="The probability of a Helix request to fail with 429."
+)
+@click.option(
+    "--populate",
+    is_flag=True,
+    help="Replaces the streamers in the database with the synthetic roster, so the sync commands use it.",
+)
+@click.option(
+    "--record",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Forwards requests to the real Twitch and Google APIs, and records the responses into this file.",
+)
+@click.option(
+    "--replay",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Serves the responses recorded in this file instead of the synthetic roster.",
+)
+def command(host, port, streamers, live_ratio, seed, latency, jitter, rate_limit, error_rate, populate, record, replay):
+    """
+    Runs a local stand-in for the Twitch and Google Calendar APIs.
+
+    Serves a synthetic roster of streamers, with their streams, schedules and
+    Google Calendar events, with configurable latency and rate limit errors; or
+    records real responses to replay them later. To send the API requests of
+    any other command to the stand-in, run it with the POG_STANDIN_URL
+    environment variable set to the URL printed.
+    """
+    url = f"http://{host}:{port}"
+    roster = SyntheticRoster(size=streamers, base_url=url, live_ratio=live_ratio, seed=seed)
+
+    if populate:
+        click.secho("Replacing streamers with the synthetic roster...", fg="cyan", bold=True, nl=False)
+        with transaction.atomic():
+            Streamer.objects.all().delete()
+            # bulk_create does not send the save signals, so nothing is requested
+            # to the stand-in before it runs.
+            Streamer.objects.bulk_create(
+                [
+                    Streamer(
+                        name=user["display_name"],
+                        twitch_login=user["login"],
+                        twitch_id=user["id"],
+                        description=user["description"],
+                    )
+                    for user in roster.users
+                ]
+            )
+        click.secho(" OK", fg="green", bold=True)
+
+    server = StandInServer(
+        (host, port),
+        roster=roster,
+        latency=latency / 1000,
+        jitter=jitter / 1000,
+        rate_limit=rate_limit,
+        error_rate=error_rate,
+        record_to=record,
+        replay_from=replay,
+    )
+
+    if record:
+        click.echo(f"Forwarding requests to Twitch and Google, recording responses into {record}.")
+    elif replay:
+        click.echo(f"Replaying responses recorded in {replay}.")
+    else:
+        click.echo(
+            f"Serving {len(roster.users)} streamers ({len(roster.streams)} live), "
+            f"{sum(map(len, roster.schedules.values()))} Twitch schedule segments, "
+            f"and {len(roster.calendar_events)} Google Calendar events."
+        )
+
+    click.secho(f"Stand-in API server listening on {url}", fg="green", bold=True)
+    click.echo(f"Run other commands with POG_STANDIN_URL={url} to use it. Quit with Ctrl+C.")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        click.echo(f"\n{server.requests_count} Helix requests served.")
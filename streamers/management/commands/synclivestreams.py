@@ -1,8 +1,10 @@
 import djclick as click
 from django.db import transaction
+from django.utils import timezone
 
 from pogscience.twitch import get_twitch_client
-from streamers.models import Streamer
+from streamers import viewers
+from streamers.models import Streamer, ViewerCountSample
 
 
 @click.command()
@@ -10,21 +12,34 @@ from streamers.models import Streamer
 @transaction.atomic
 def command(full):
     """
-    Updates the live stream preview (and stream data) for live streamers.
-    If no one is live, outputs nothing.
+    Updates the live stream preview (and stream data) for live streamers, and
+    samples their viewers count. If no one is live, outputs nothing.
     """
     client = get_twitch_client()
 
     if full:
         click.secho(f"Checking for streams status (--full)...", fg="cyan", bold=True, nl=False)
-        Streamer.full_twitch_sync()
+        # Every live stream is updated below.
+        Streamer.full_twitch_sync(update_streams=False)
         click.secho(" OK", fg="green", bold=True)
 
     streamers = {str(streamer.twitch_id): streamer for streamer in Streamer.objects.filter(live=True)}
-    if not streamers:
-        return
+    if streamers:
+        sync_streams(client, streamers)
 
+    # Also run when no one is live, to roll up the periods that just ended.
+    viewers.rollup()
+    viewers.compact()
+
+
+def sync_streams(client, streamers):
+    """
+    Updates the streams of the given streamers (by Twitch ID), and stores
+    their viewers counts samples, all at once.
+    """
     streams = client.get_streams(user_ids=streamers.keys())
+    now = timezone.now()
+    samples = []
 
     for stream in streams:
         click.secho(f"Updating {stream['user_name']}'s stream preview and data...", fg="cyan", bold=True, nl=False)
@@ -33,8 +48,11 @@ def command(full):
             streamer: Streamer = streamers[stream["user_id"]]
             if not streamer:
                 raise ValueError(f"Streamer {stream['user_name']} returned by Twitch but unknown to us.")
+            samples.append(ViewerCountSample(streamer=streamer, time=now, viewers=stream["viewer_count"]))
             streamer.update_stream_from_twitch_data(stream)
             streamer.save()
             click.secho(" OK", fg="green", bold=True)
         except Exception as e:
             click.echo(click.style(" ERR", fg="red", bold=True) + f" {e}")
+
+    ViewerCountSample.objects.bulk_create(samples)
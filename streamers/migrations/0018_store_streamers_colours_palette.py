@@ -0,0 +1,76 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:20
+
+import binascii
+import colorsys
+from itertools import zip_longest
+
+from django.db import migrations, models
+
+# The helpers below are copies of `streamers.utils` ones as of this migration,
+# so later changes to them don't change what it does.
+
+
+def grouper(iterable, n, fillvalue=None):
+    args = [iter(iterable)] * n
+    return zip_longest(*args, fillvalue=fillvalue)
+
+
+def colours_palette(colours):
+    rgb = [[float(c) for c in colour] for colour in colours]
+    hsl = []
+    for colour in rgb:
+        h, l, s = colorsys.rgb_to_hls(*[c / 255.0 for c in colour])
+        hsl.append([h * 360, s * 100, l * 100])
+
+    return {
+        "rgb": rgb,
+        "hex": ["#" + binascii.hexlify(bytearray(int(c) for c in colour)).decode("ascii") for colour in rgb],
+        "hsl": hsl,
+        "hsl_css": [f"hsl({h}, {s}%, {l}%)" for h, s, l in hsl],
+    }
+
+
+def compute_palettes(apps, schema_editor):
+    Streamer = apps.get_model("streamers", "Streamer")
+
+    streamers = list(Streamer.objects.exclude(_colours__isnull=True).exclude(_colours=""))
+    for streamer in streamers:
+        streamer.palette = colours_palette(grouper(map(float, streamer._colours.split(",")), 3))
+
+    Streamer.objects.bulk_update(streamers, ["palette"])
+
+
+def restore_colours(apps, schema_editor):
+    Streamer = apps.get_model("streamers", "Streamer")
+
+    streamers = list(Streamer.objects.exclude(palette__isnull=True))
+    for streamer in streamers:
+        streamer._colours = ",".join(str(value) for colour in streamer.palette["rgb"] for value in colour)
+
+    Streamer.objects.bulk_update(streamers, ["_colours"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0017_add_stream_end_and_done"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamer",
+            name="palette",
+            field=models.JSONField(
+                blank=True,
+                editable=False,
+                help_text="Trois couleurs principales à utiliser pour habiller ce/cette streamer/euse, extraites de son image de profil. Chaque couleur est stockée sous plusieurs notations (RGB, hexadécimale, HSL, et HSL pour CSS), calculées une fois pour toutes.",
+                null=True,
+                verbose_name="couleurs",
+            ),
+        ),
+        migrations.RunPython(compute_palettes, restore_colours),
+        migrations.RemoveField(
+            model_name="streamer",
+            name="_colours",
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0018_store_streamers_colours_palette"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="streamer",
+            name="images_metadata",
+            field=models.JSONField(
+                blank=True,
+                default=dict,
+                editable=False,
+                help_text="Pour chaque image téléchargée depuis Twitch, son URL, les en-têtes HTTP ETag et Last-Modified, et le hash de son contenu, pour ne pas la télécharger ni la stocker à nouveau si elle n'a pas changé.",
+                verbose_name="métadonnées des images",
+            ),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:27
+
+from django.db import migrations, models
+import pogscience.storage
+import streamers.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0019_store_streamers_images_metadata"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="streamer",
+            name="background_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=pogscience.storage.get_media_storage,
+                upload_to=streamers.models.background_image_upload_to,
+                verbose_name="image de fond",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="streamer",
+            name="live_preview",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=pogscience.storage.get_media_storage,
+                upload_to=streamers.models.live_preview_image_upload_to,
+                verbose_name="aperçu du live",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="streamer",
+            name="profile_image",
+            field=models.ImageField(
+                blank=True,
+                null=True,
+                storage=pogscience.storage.get_media_storage,
+                upload_to=streamers.models.profile_image_upload_to,
+                verbose_name="image de profil",
+            ),
+        ),
+    ]
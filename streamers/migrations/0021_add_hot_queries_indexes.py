@@ -0,0 +1,63 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0020_store_twitch_images_with_content_hash"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="eventsubsubscription",
+            name="uuid",
+            field=models.UUIDField(unique=True, verbose_name="subscription UUID"),
+        ),
+        migrations.AlterField(
+            model_name="streamer",
+            name="twitch_id",
+            field=models.PositiveBigIntegerField(
+                help_text="Utilisé pour récupérer les informations automatiquement",
+                unique=True,
+                verbose_name="identifiant numérique Twitch",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="streamer",
+            name="twitch_login",
+            field=models.CharField(
+                help_text="Utilisé pour récupérer les informations automatiquement",
+                max_length=64,
+                unique=True,
+                verbose_name="nom d'utilisateur Twitch",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledstream",
+            index=models.Index(fields=["streamer", "start", "end"], name="scheduled_streamer_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledstream",
+            index=models.Index(fields=["end", "start"], name="scheduled_end_start_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledstream",
+            index=models.Index(
+                condition=models.Q(("done", False)), fields=["end", "start"], name="scheduled_upcoming_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledstream",
+            index=models.Index(fields=["twitch_segment_id"], name="scheduled_twitch_segment_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="scheduledstream",
+            index=models.Index(fields=["google_calendar_event_id"], name="scheduled_gcal_event_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="streamer",
+            index=models.Index(condition=models.Q(("live", True)), fields=["live"], name="streamer_live_idx"),
+        ),
+    ]
@@ -0,0 +1,83 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0021_add_hot_queries_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ViewerCountSample",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("time", models.DateTimeField(verbose_name="heure")),
+                ("viewers", models.PositiveIntegerField(verbose_name="spectateurs")),
+                (
+                    "streamer",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="viewers_samples",
+                        to="streamers.streamer",
+                        verbose_name="streamer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "échantillon de spectateurs",
+                "verbose_name_plural": "échantillons de spectateurs",
+            },
+        ),
+        migrations.CreateModel(
+            name="ViewerCountRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "resolution",
+                    models.CharField(
+                        choices=[("minute", "Minute"), ("hour", "Heure"), ("day", "Jour")],
+                        max_length=6,
+                        verbose_name="résolution",
+                    ),
+                ),
+                ("start", models.DateTimeField(verbose_name="début de la période")),
+                ("samples", models.PositiveIntegerField(verbose_name="nombre d'échantillons")),
+                ("viewers_sum", models.PositiveBigIntegerField(verbose_name="somme des spectateurs")),
+                ("viewers_min", models.PositiveIntegerField(verbose_name="minimum de spectateurs")),
+                ("viewers_max", models.PositiveIntegerField(verbose_name="maximum de spectateurs")),
+                (
+                    "streamer",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="viewers_rollups",
+                        to="streamers.streamer",
+                        verbose_name="streamer",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "agrégat de spectateurs",
+                "verbose_name_plural": "agrégats de spectateurs",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="viewercountsample",
+            index=models.Index(fields=["time"], name="viewers_sample_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="viewercountrollup",
+            index=models.Index(fields=["resolution", "start"], name="viewers_rollup_start_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="viewercountrollup",
+            constraint=models.UniqueConstraint(
+                fields=("streamer", "resolution", "start"), name="viewers_rollup_unique"
+            ),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:40
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def remove_duplicate_source_ids(apps, schema_editor):
+    """
+    Previous syncs could store a source event more than once (e.g. when its
+    start changed). We keep the last stored row; others are deleted, or only
+    lose their source ID if the stream is done, to keep the statistics.
+    """
+    ScheduledStream = apps.get_model("streamers", "ScheduledStream")
+
+    for field in ("twitch_segment_id", "google_calendar_event_id"):
+        duplicated = (
+            ScheduledStream.objects.exclude(**{f"{field}__isnull": True})
+            .values(field)
+            .annotate(count=Count("pk"))
+            .filter(count__gt=1)
+            .values_list(field, flat=True)
+        )
+
+        for source_id in duplicated:
+            duplicates = ScheduledStream.objects.filter(**{field: source_id}).order_by("-pk")[1:]
+            pks = [scheduled.pk for scheduled in duplicates]
+            ScheduledStream.objects.filter(pk__in=pks, done=False).delete()
+            ScheduledStream.objects.filter(pk__in=pks).update(**{field: None})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0022_add_viewers_counts_time_series"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="scheduledstream",
+            name="scheduled_twitch_segment_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="scheduledstream",
+            name="scheduled_gcal_event_idx",
+        ),
+        migrations.AddField(
+            model_name="scheduledstream",
+            name="synced_at",
+            field=models.DateTimeField(
+                blank=True,
+                editable=False,
+                help_text="Heure de la dernière synchronisation ayant trouvé ce stream dans ses sources ; les streams à venir non trouvés par une synchronisation sont supprimés",
+                null=True,
+                verbose_name="dernière synchronisation",
+            ),
+        ),
+        migrations.RunPython(remove_duplicate_source_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="scheduledstream",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("twitch_segment_id__isnull", False)),
+                fields=("twitch_segment_id",),
+                name="scheduled_twitch_segment_unique",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="scheduledstream",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("google_calendar_event_id__isnull", False)),
+                fields=("google_calendar_event_id",),
+                name="scheduled_gcal_event_unique",
+            ),
+        ),
+    ]
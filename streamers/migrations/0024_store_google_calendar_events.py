@@ -0,0 +1,53 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0023_upsert_scheduled_streams_by_source_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GoogleCalendarEvent",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("event_id", models.CharField(max_length=1024, unique=True, verbose_name="identifiant de l'événement")),
+                ("start", models.DateTimeField(verbose_name="début")),
+                ("end", models.DateTimeField(verbose_name="fin")),
+                ("data", models.JSONField(verbose_name="données de l'événement")),
+            ],
+            options={
+                "verbose_name": "événement Google Calendar",
+                "verbose_name_plural": "événements Google Calendar",
+            },
+        ),
+        migrations.CreateModel(
+            name="GoogleCalendarSync",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "calendar_id",
+                    models.CharField(max_length=1024, unique=True, verbose_name="identifiant du calendrier"),
+                ),
+                (
+                    "sync_token",
+                    models.CharField(blank=True, max_length=1024, null=True, verbose_name="jeton de synchronisation"),
+                ),
+                (
+                    "full_sync_at",
+                    models.DateTimeField(blank=True, null=True, verbose_name="dernière synchronisation complète"),
+                ),
+            ],
+            options={
+                "verbose_name": "synchronisation Google Calendar",
+                "verbose_name_plural": "synchronisations Google Calendar",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="googlecalendarevent",
+            index=models.Index(fields=["end", "start"], name="gcal_event_end_start_idx"),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0024_store_google_calendar_events"),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name="scheduledstream",
+            name="synced_at",
+        ),
+        migrations.AddField(
+            model_name="scheduledstream",
+            name="content_hash",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Le hash de l'événement source lors de sa dernière synchronisation ; le stream n'est mis à jour que si l'événement a changé",
+                max_length=64,
+                verbose_name="empreinte du contenu",
+            ),
+        ),
+        migrations.AddField(
+            model_name="streamer",
+            name="schedule_digest",
+            field=models.CharField(
+                blank=True,
+                default="",
+                editable=False,
+                help_text="Le hash des streams planifiés de ce/cette streamer/euse lors de la dernière synchronisation, pour ne pas les relire ni les écrire à nouveau s'ils n'ont pas changé.",
+                max_length=64,
+                verbose_name="empreinte du planning",
+            ),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.25 on 2026-10-18 07:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("streamers", "0025_skip_unchanged_scheduled_streams"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RecurringStream",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("title", models.CharField(max_length=140, verbose_name="titre du stream programmé")),
+                (
+                    "category",
+                    models.CharField(blank=True, max_length=140, null=True, verbose_name="catégorie du stream"),
+                ),
+                ("start", models.DateTimeField(verbose_name="heure de début de la première occurrence")),
+                ("duration", models.DurationField(verbose_name="durée de chaque occurrence")),
+                ("until", models.DateTimeField(verbose_name="heure de début de la dernière occurrence")),
+                (
+                    "time_zone",
+                    models.CharField(
+                        help_text="Les occurrences ont lieu chaque semaine à la même heure dans ce fuseau horaire",
+                        max_length=64,
+                        verbose_name="fuseau horaire",
+                    ),
+                ),
+                (
+                    "skipped",
+                    models.JSONField(
+                        blank=True,
+                        default=list,
+                        editable=False,
+                        help_text="Les heures de début (UTC) des occurrences annulées ou déplacées, ou enregistrées comme streams planifiés une fois terminées",
+                        verbose_name="occurrences sautées",
+                    ),
+                ),
+                (
+                    "twitch_segment_id",
+                    models.CharField(
+                        editable=False,
+                        help_text="Commun à toutes les occurrences du segment",
+                        max_length=128,
+                        unique=True,
+                        verbose_name="identifiant interne du segment Twitch",
+                    ),
+                ),
+                (
+                    "streamer",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recurring_schedule",
+                        to="streamers.streamer",
+                        verbose_name="streamer ayant programmé le stream",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Stream récurrent",
+                "verbose_name_plural": "Streams récurrents",
+            },
+        ),
+        migrations.AddIndex(
+            model_name="recurringstream",
+            index=models.Index(fields=["until"], name="recurring_until_idx"),
+        ),
+    ]
@@ -1,28 +1,30 @@
-import binascii
-import colorsys
+import hashlib
 import os
 from datetime import timedelta
+from datetime import timezone as dt_timezone
 from io import BytesIO
 from urllib.error import HTTPError
 from uuid import UUID
+from zoneinfo import ZoneInfo
 
-import requests
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.models import AbstractUser
 from django.core import files
 from django.core.management.utils import get_random_secret_key
-from django.db import models
-from django.db.models import Q
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
+from django.db import models, transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
+from requests import codes
 
-from pogscience.storage import OverwriteStorage
+from pogscience.background import run_after_commit
+from pogscience.http import get_http_session
+from pogscience.storage import get_media_storage
 from pogscience.twitch import get_twitch_client
-from streamers.utils import extract_main_colours, grouper
+from streamers.images import generate_derivatives, srcsets
+from streamers.utils import colours_palette, extract_main_colours
 
 
 class User(AbstractUser):
@@ -71,6 +73,10 @@ class Streamer(models.Model):
         verbose_name = _("streamer")
         verbose_name_plural = _("streamers")
         ordering = ["name", "twitch_login"]
+        indexes = [
+            # Only a few streamers are live at once.
+            models.Index(fields=["live"], condition=Q(live=True), name="streamer_live_idx"),
+        ]
 
     EVENTSUB_SUBSCRIPTIONS = ["stream.online", "stream.offline", "channel.update"]
 
@@ -92,10 +98,12 @@ class Streamer(models.Model):
         verbose_name=_("nom d'utilisateur Twitch"),
         max_length=64,
         help_text=_("Utilisé pour récupérer les informations automatiquement"),
+        unique=True,
     )
     twitch_id = models.PositiveBigIntegerField(
         verbose_name=_("identifiant numérique Twitch"),
         help_text=_("Utilisé pour récupérer les informations automatiquement"),
+        unique=True,
     )
     description = models.CharField(
         verbose_name=_("courte description"),
@@ -110,30 +118,51 @@ class Streamer(models.Model):
     )
     profile_image = models.ImageField(
         verbose_name=_("image de profil"),
-        storage=OverwriteStorage(),
+        storage=get_media_storage,
         upload_to=profile_image_upload_to,
         null=True,
         blank=True,
     )
     background_image = models.ImageField(
         verbose_name=_("image de fond"),
-        storage=OverwriteStorage(),
+        storage=get_media_storage,
         upload_to=background_image_upload_to,
         null=True,
         blank=True,
     )
-    _colours = models.CharField(
+    palette = models.JSONField(
         verbose_name=_("couleurs"),
         help_text=_(
-            "Liste de trois couleurs principales à utiliser pour habiller ce/cette streamer/euse. Les valeurs "
-            "sont stockées sous la forme d'une liste de nombres flottants, dont chaque triplet forme une "
-            "couleur RGB."
+            "Trois couleurs principales à utiliser pour habiller ce/cette streamer/euse, extraites de son image de "
+            "profil. Chaque couleur est stockée sous plusieurs notations (RGB, hexadécimale, HSL, et HSL pour CSS), "
+            "calculées une fois pour toutes."
         ),
-        # max 7 chars per rgb value, three rgb tuples, and 8 comma separators
-        max_length=71,  # 7*3*3 + 8
         blank=True,
         null=True,
-        db_column="colours",
+        editable=False,
+    )
+
+    images_metadata = models.JSONField(
+        verbose_name=_("métadonnées des images"),
+        help_text=_(
+            "Pour chaque image téléchargée depuis Twitch, son URL, les en-têtes HTTP ETag et Last-Modified, et le "
+            "hash de son contenu, pour ne pas la télécharger ni la stocker à nouveau si elle n'a pas changé."
+        ),
+        default=dict,
+        blank=True,
+        editable=False,
+    )
+
+    schedule_digest = models.CharField(
+        verbose_name=_("empreinte du planning"),
+        help_text=_(
+            "Le hash des streams planifiés de ce/cette streamer/euse lors de la dernière synchronisation, pour ne "
+            "pas les relire ni les écrire à nouveau s'ils n'ont pas changé."
+        ),
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
     )
 
     live = models.BooleanField(
@@ -166,7 +195,7 @@ class Streamer(models.Model):
     )
     live_preview = models.ImageField(
         verbose_name=_("aperçu du live"),
-        storage=OverwriteStorage(),
+        storage=get_media_storage,
         upload_to=live_preview_image_upload_to,
         null=True,
         blank=True,
@@ -191,49 +220,93 @@ class Streamer(models.Model):
 
     @property
     def colours(self):
-        return list(map(tuple, grouper(map(float, self._colours.split(",")), 3)))
+        return [tuple(colour) for colour in self.palette["rgb"]] if self.palette else []
 
     @colours.setter
     def colours(self, value):
-        flat = [val for colour in value for val in colour]
-        self._colours = ",".join(map(str, flat))
+        self.palette = colours_palette(value)
 
     @colours.deleter
     def colours(self):
-        self._colours = None
+        self.palette = None
 
     @property
     def colours_hex(self):
-        return list(
-            map(lambda colour: "#" + binascii.hexlify(bytearray(int(c) for c in colour)).decode("ascii"), self.colours)
-        )
+        return self.palette["hex"] if self.palette else []
 
     @property
     def colours_hsl(self):
-        def rgb_to_hsl(colour):
-            h, l, s = colorsys.rgb_to_hls(*map(lambda c: c / 255.0, colour))
-            return h * 360, s * 100, l * 100
-
-        return list(map(rgb_to_hsl, self.colours))
+        return self.palette["hsl"] if self.palette else []
 
     @property
     def colours_hsl_css(self):
-        hsl = self.colours_hsl
-        return list(map(lambda hsl: f"hsl({hsl[0]}, {hsl[1]}%, {hsl[2]}%)", hsl))
+        return self.palette["hsl_css"] if self.palette else []
 
-    @staticmethod
-    def _download_and_store_image(url, field):
-        if not url:
-            return
+    @property
+    def profile_image_srcset(self):
+        return srcsets(self.profile_image, self.images_metadata.get("profile_image", {}))
 
-        res_image = requests.get(url)
-        if not res_image.ok:
-            return
+    @property
+    def background_image_srcset(self):
+        return srcsets(self.background_image, self.images_metadata.get("background_image", {}))
 
-        image = BytesIO()
-        image.write(res_image.content)
-        filename = f"image{os.path.splitext(url)[1]}"
-        field.save(filename, files.File(image), save=False)
+    def _download_and_store_image(self, url, field) -> bool:
+        """
+        Downloads the image at the given URL, and stores it into the given image
+        field. Does not save the instance.
+
+        The download is skipped if the image did not change since the last one:
+        the request is conditional (using the previous response `ETag` and
+        `Last-Modified` headers), and if the server sends it anyway, its content
+        hash is compared to the stored image one. When the image changes, its
+        resized versions are generated too (see `streamers.images`).
+
+        :return: True if the stored image changed.
+        """
+        if not url:
+            return False
+
+        # The metadata describes the stored image: it is ignored if none is stored.
+        metadata = self.images_metadata.get(field.field.name, {}) if field.name else {}
+
+        headers = {}
+        if metadata.get("url") == url:
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+
+        res_image = get_http_session().get(url, headers=headers)
+
+        if res_image.status_code == codes.NOT_MODIFIED:
+            changed = False
+        elif res_image.ok:
+            sha256 = hashlib.sha256(res_image.content).hexdigest()
+            changed = sha256 != metadata.get("sha256")
+
+            if changed:
+                image = BytesIO()
+                image.write(res_image.content)
+                filename = f"image{os.path.splitext(url)[1]}"
+                field.save(filename, files.File(image), save=False)
+
+            metadata = {
+                "url": url,
+                "etag": res_image.headers.get("ETag"),
+                "last_modified": res_image.headers.get("Last-Modified"),
+                "sha256": sha256,
+                "derivatives": None if changed else metadata.get("derivatives"),
+            }
+        else:
+            return False
+
+        # Derivatives are also generated for images stored before they existed.
+        if metadata.get("derivatives") is None:
+            metadata = {**metadata, "derivatives": generate_derivatives(field)}
+
+        self.images_metadata = {**self.images_metadata, field.field.name: metadata}
+
+        return changed
 
     def update_from_twitch_data(self, twitch_data):
         """
@@ -249,9 +322,11 @@ class Streamer(models.Model):
 
         self.description = twitch_data["description"]
 
-        self._download_and_store_image(twitch_data.get("profile_image_url"), self.profile_image)
+        profile_image_changed = self._download_and_store_image(twitch_data.get("profile_image_url"), self.profile_image)
         self._download_and_store_image(twitch_data.get("offline_image_url"), self.background_image)
-        self.update_colours()
+
+        if profile_image_changed or not self.palette:
+            self.update_colours()
 
     def update_stream_from_twitch_data(self, twitch_data):
         """
@@ -271,18 +346,51 @@ class Streamer(models.Model):
 
         self._download_and_store_image(thumbnail, self.live_preview)
 
-    def update_stream(self):
+    def update_stream(self) -> bool:
         """
         Updates this streamer's current stream (if the streamer is live and
-        Twitch returns a stream for it).
+        Twitch returns a stream for it). Does not save the instance.
+
+        :return: True if the stream was updated.
         """
         client = get_twitch_client()
-        streams = client.get_streams(user_ids=[self.twitch_id])
+        # The stream may have just started, so a cached answer could be outdated.
+        streams = client.get_streams(user_ids=[self.twitch_id], use_cache=False)
         try:
             self.update_stream_from_twitch_data(streams[0])
+            return True
         except IndexError:
             # The streamer is not live: Twitch returned nothing about its stream.
-            pass
+            return False
+
+    def update_stream_later(self):
+        """
+        Updates this streamer's current stream in the background, once the
+        current transaction is committed. To be called when the streamer goes
+        live, so the caller doesn't wait for Twitch.
+        """
+        run_after_commit(Streamer._update_stream_in_background, self.pk)
+
+    @classmethod
+    def _update_stream_in_background(cls, pk, twitch_data=None):
+        """
+        Updates a streamer's current stream, using the given Twitch stream data
+        if any, else fetching it from Twitch.
+        """
+        streamer = cls.objects.filter(pk=pk, live=True).first()
+        if streamer is None:
+            return
+
+        if twitch_data is not None:
+            streamer.update_stream_from_twitch_data(twitch_data)
+        elif not streamer.update_stream():
+            return
+
+        # Only the stream fields are saved, so concurrent changes to the
+        # streamer (e.g. going offline) are not reverted.
+        streamer.save(
+            update_fields=["live_title", "live_game_name", "live_spectators", "live_preview", "images_metadata"]
+        )
 
     def start_stream(self):
         """
@@ -301,6 +409,13 @@ class Streamer(models.Model):
         self.live = False
 
         if self.live_started_at:
+            # Occurrences of recurring streams are only stored when they happen;
+            # they are then marked as done below, like any scheduled stream.
+            RecurringStream.materialize_all(
+                (recurring_stream, self.live_started_at, timezone.now())
+                for recurring_stream in self.recurring_schedule.all()
+            )
+
             scheduled_streams_count = ScheduledStream.objects.filter(
                 streamer=self, start__lte=timezone.now(), end__gte=self.live_started_at
             ).update(done=True, start=self.live_started_at, end=timezone.now())
@@ -322,8 +437,9 @@ class Streamer(models.Model):
 
     def update_colours(self):
         """
-        Updates the streamer's main colors from its profile picture. Does not
-        save the instance.
+        Updates the streamer's main colors from its profile picture, with every
+        notation used to display them (see `colours_palette`). Does not save the
+        instance.
         """
         if not self.profile_image:
             return
@@ -395,29 +511,82 @@ class Streamer(models.Model):
         return result
 
     @classmethod
-    def full_twitch_sync(cls):
-        """Checks for every channel current live status, and updates every registered channel accordingly."""
+    @transaction.atomic
+    def full_twitch_sync(cls, update_streams=True):
+        """
+        Checks for every channel current live status, and updates every registered channel accordingly.
+
+        Only the streamers whose live status changed are updated, with a constant number of queries whatever the
+        number of streamers.
+
+        :param update_streams: If True, the streams of the streamers who went live are updated in the background (see
+                               `update_stream_later`).
+        """
         client = get_twitch_client()
-        streams = client.get_streams(user_ids=[streamer.twitch_id for streamer in cls.objects.all()])
+        # This sync is authoritative for the live status, so cached answers
+        # (which may be outdated) are not used.
+        streams = client.get_streams(
+            user_ids=list(cls.objects.values_list("twitch_id", flat=True)), page_size=100, use_cache=False
+        )
         online_streamers_ids = [int(stream["user_id"]) for stream in streams]
+        now = timezone.now()
+
+        went_live = list(
+            cls.objects.filter(twitch_id__in=online_streamers_ids, live=False).values_list("pk", "twitch_id")
+        )
 
         # For lives with a stored start date, we don't alter it. But we add one for those who don't.
         cls.objects.filter(twitch_id__in=online_streamers_ids, live_started_at__isnull=True).update(
-            live=True, live_started_at=timezone.now()
+            live=True, live_started_at=now
+        )
+        cls.objects.filter(twitch_id__in=online_streamers_ids, live=False).update(live=True)
+
+        # For the streams that just ended, we do the same as `end_stream`, for all streamers at once: we mark as done
+        # the corresponding scheduled streams, and create one for streams that were not scheduled.
+        offline_streamers = cls.objects.exclude(twitch_id__in=online_streamers_ids)
+        ended_streamers = offline_streamers.filter(live_started_at__isnull=False)
+
+        ended_recurring_streams = RecurringStream.objects.filter(streamer__in=ended_streamers)
+        RecurringStream.materialize_all(
+            (recurring_stream, recurring_stream.streamer.live_started_at, now)
+            for recurring_stream in ended_recurring_streams.select_related("streamer")
+        )
+
+        ended_scheduled_streams = ScheduledStream.objects.filter(
+            streamer__in=ended_streamers, start__lte=now, end__gte=F("streamer__live_started_at")
+        )
+
+        ScheduledStream.objects.bulk_create(
+            [
+                ScheduledStream(
+                    streamer=streamer,
+                    title=streamer.live_title,
+                    category=streamer.live_game_name,
+                    start=streamer.live_started_at,
+                    end=now,
+                    weekly=False,
+                    done=True,
+                )
+                for streamer in ended_streamers.filter(
+                    ~Exists(ended_scheduled_streams.filter(streamer=OuterRef("pk")))
+                ).only("live_title", "live_game_name", "live_started_at")
+            ]
         )
-        cls.objects.filter(twitch_id__in=online_streamers_ids, live_started_at__isnull=False).update(live=True)
 
-        # For offline streams, we have to call the end_stream method for each of them, as this will mark as done
-        # corresponding scheduled streams, if any.
-        offline_streamers = list(cls.objects.filter(~Q(twitch_id__in=online_streamers_ids)))
-        for streamer in offline_streamers:
-            streamer.end_stream()
-        cls.objects.bulk_update(offline_streamers, ["live", "live_started_at"])
+        ended_scheduled_streams.update(
+            done=True,
+            start=Subquery(cls.objects.filter(pk=OuterRef("streamer_id")).values("live_started_at")),
+            end=now,
+        )
 
+        offline_streamers.filter(Q(live=True) | Q(live_started_at__isnull=False)).update(
+            live=False, live_started_at=None
+        )
 
-@receiver(pre_save, sender=Streamer)
-def update_stream_when_streamer_goes_live(sender, instance: Streamer, **kwargs):
-    instance.update_stream()
+        if update_streams:
+            streams_by_id = {int(stream["user_id"]): stream for stream in streams}
+            for pk, twitch_id in went_live:
+                run_after_commit(cls._update_stream_in_background, pk, streams_by_id[twitch_id])
 
 
 class EventSubSubscription(models.Model):
@@ -448,6 +617,7 @@ class EventSubSubscription(models.Model):
 
     uuid = models.UUIDField(
         verbose_name=_("subscription UUID"),
+        unique=True,
     )
 
     secret = models.CharField(
@@ -486,6 +656,27 @@ class ScheduledStream(models.Model):
     class Meta:
         verbose_name = _("Stream planifié")
         verbose_name_plural = _("Streams planifiés")
+        indexes = [
+            # Streams of a streamer at some time (e.g. `end_stream`).
+            models.Index(fields=["streamer", "start", "end"], name="scheduled_streamer_start_idx"),
+            # Streams in a time range (e.g. the calendar).
+            models.Index(fields=["end", "start"], name="scheduled_end_start_idx"),
+            # Upcoming streams not done yet (e.g. the home page).
+            models.Index(fields=["end", "start"], condition=Q(done=False), name="scheduled_upcoming_idx"),
+        ]
+        constraints = [
+            # A source event is stored once, so the sync can upsert by source ID.
+            models.UniqueConstraint(
+                fields=["twitch_segment_id"],
+                condition=Q(twitch_segment_id__isnull=False),
+                name="scheduled_twitch_segment_unique",
+            ),
+            models.UniqueConstraint(
+                fields=["google_calendar_event_id"],
+                condition=Q(google_calendar_event_id__isnull=False),
+                name="scheduled_gcal_event_unique",
+            ),
+        ]
 
     streamer = models.ForeignKey(
         Streamer,
@@ -517,6 +708,22 @@ class ScheduledStream(models.Model):
 
     done = models.BooleanField(_("terminé ?"), default=False)
 
+    content_hash = models.CharField(
+        _("empreinte du contenu"),
+        help_text=_(
+            "Le hash de l'événement source lors de sa dernière synchronisation ; le stream n'est mis à jour que si "
+            "l'événement a changé"
+        ),
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+    )
+
+    # Set on the occurrences of recurring streams, which are not stored in the
+    # database (see `RecurringStream.occurrences`), to identify them.
+    occurrence_key = None
+
     @property
     @admin.display(description=_("Durée"))
     def duration(self):
@@ -526,5 +733,278 @@ class ScheduledStream(models.Model):
     def now(self):
         return self.start < timezone.now() < self.end
 
+    @property
+    def key(self):
+        return self.pk if self.pk is not None else self.occurrence_key
+
     def __str__(self):
         return f"{self.title} ({self.streamer}, {self.start} → {self.end})"
+
+
+class RecurringStream(models.Model):
+    """
+    A streamer's weekly planned stream, loaded from Twitch. The recurrence is
+    stored once, and its occurrences computed when needed (see `occurrences`),
+    except the skipped ones: cancelled or moved on Twitch, or stored as
+    scheduled streams when they happened (see `materialize`).
+    """
+
+    class Meta:
+        verbose_name = _("Stream récurrent")
+        verbose_name_plural = _("Streams récurrents")
+        indexes = [
+            # Recurring streams still happening (e.g. the home page).
+            models.Index(fields=["until"], name="recurring_until_idx"),
+        ]
+
+    streamer = models.ForeignKey(
+        Streamer,
+        verbose_name=_("streamer ayant programmé le stream"),
+        related_name="recurring_schedule",
+        on_delete=models.CASCADE,
+    )
+
+    title = models.CharField(_("titre du stream programmé"), max_length=140)
+    category = models.CharField(_("catégorie du stream"), max_length=140, blank=True, null=True)
+
+    start = models.DateTimeField(_("heure de début de la première occurrence"))
+    duration = models.DurationField(_("durée de chaque occurrence"))
+    until = models.DateTimeField(_("heure de début de la dernière occurrence"))
+    time_zone = models.CharField(
+        _("fuseau horaire"),
+        help_text=_("Les occurrences ont lieu chaque semaine à la même heure dans ce fuseau horaire"),
+        max_length=64,
+    )
+
+    skipped = models.JSONField(
+        _("occurrences sautées"),
+        help_text=_(
+            "Les heures de début (UTC) des occurrences annulées ou déplacées, ou enregistrées comme streams planifiés "
+            "une fois terminées"
+        ),
+        default=list,
+        blank=True,
+        editable=False,
+    )
+
+    twitch_segment_id = models.CharField(
+        _("identifiant interne du segment Twitch"),
+        help_text=_("Commun à toutes les occurrences du segment"),
+        max_length=128,
+        unique=True,
+        editable=False,
+    )
+
+    @staticmethod
+    def skip_key(start) -> str:
+        """The key of an occurrence in `skipped`: its start, in UTC."""
+        return start.astimezone(dt_timezone.utc).isoformat()
+
+    def starts(self, since=None):
+        """
+        Yields the start of every occurrence (skipped ones and ones after
+        `until` included), from the first one starting at `since`, or after.
+        """
+        tz = ZoneInfo(self.time_zone)
+        # Occurrences happen at the same local time, whatever the DST.
+        first = self.start.astimezone(tz).replace(tzinfo=None)
+
+        # We jump to a week before `since`, in case of a DST change in-between.
+        week = max(0, (since - self.start) // timedelta(weeks=1) - 1) if since is not None else 0
+
+        while True:
+            start = (first + timedelta(weeks=week)).replace(tzinfo=tz).astimezone(dt_timezone.utc)
+            if since is None or start >= since:
+                yield start
+            week += 1
+
+    def occurrence(self, start) -> ScheduledStream:
+        """Returns the occurrence starting at the given time, not stored."""
+        scheduled = ScheduledStream(
+            streamer=self.streamer,
+            title=self.title,
+            start=start,
+            end=start + self.duration,
+            category=self.category,
+            weekly=True,
+        )
+        scheduled.occurrence_key = f"{self.pk}-{int(start.timestamp())}"
+        return scheduled
+
+    def occurrences(self, start=None, end=None):
+        """
+        Yields the occurrences overlapping the given time range (bounds
+        included, both optional), skipped ones excluded, by start. They are
+        computed as they are consumed, and not stored.
+        """
+        skipped = set(self.skipped)
+
+        for occurrence_start in self.starts(start - self.duration if start is not None else None):
+            if occurrence_start > self.until or (end is not None and occurrence_start > end):
+                return
+            if self.skip_key(occurrence_start) not in skipped:
+                yield self.occurrence(occurrence_start)
+
+    def materialize(self, start, end) -> list:
+        """
+        Stores the occurrences overlapping the given time range as scheduled
+        streams (e.g. when they actually happened, see `Streamer.end_stream`),
+        and skips them from now on. Saves the instance.
+
+        :return: The stored scheduled streams.
+        """
+        return RecurringStream.materialize_all([(self, start, end)])
+
+    @classmethod
+    def materialize_all(cls, ranges) -> list:
+        """
+        Like `materialize`, for several recurring streams at once, with a
+        constant number of queries.
+
+        :param ranges: The `(recurring_stream, start, end)` time ranges.
+        :return: The stored scheduled streams.
+        """
+        occurrences = []
+        changed = []
+
+        for recurring_stream, start, end in ranges:
+            stream_occurrences = list(recurring_stream.occurrences(start, end))
+            if stream_occurrences:
+                recurring_stream.skipped = sorted(
+                    {*recurring_stream.skipped, *(cls.skip_key(occurrence.start) for occurrence in stream_occurrences)}
+                )
+                occurrences.extend(stream_occurrences)
+                changed.append(recurring_stream)
+
+        ScheduledStream.objects.bulk_create(occurrences)
+        cls.objects.bulk_update(changed, fields=["skipped"])
+
+        return occurrences
+
+    def __str__(self):
+        return f"{self.title} ({self.streamer}, {self.start} → {self.until})"
+
+
+class GoogleCalendarSync(models.Model):
+    """
+    The state of the Google Calendar synchronization of a calendar: the sync
+    token Google gave us, to only fetch the events changed since, and when the
+    last full synchronization happened.
+    """
+
+    class Meta:
+        verbose_name = _("synchronisation Google Calendar")
+        verbose_name_plural = _("synchronisations Google Calendar")
+
+    calendar_id = models.CharField(_("identifiant du calendrier"), max_length=1024, unique=True)
+    sync_token = models.CharField(_("jeton de synchronisation"), max_length=1024, blank=True, null=True)
+    full_sync_at = models.DateTimeField(_("dernière synchronisation complète"), blank=True, null=True)
+
+    def __str__(self):
+        return f"Google Calendar sync ({self.calendar_id})"
+
+
+class GoogleCalendarEvent(models.Model):
+    """
+    A Google Calendar event, as last returned by the API. Events are kept, so
+    later synchronizations only have to fetch the changed ones.
+    """
+
+    class Meta:
+        verbose_name = _("événement Google Calendar")
+        verbose_name_plural = _("événements Google Calendar")
+        indexes = [
+            models.Index(fields=["end", "start"], name="gcal_event_end_start_idx"),
+        ]
+
+    event_id = models.CharField(_("identifiant de l'événement"), max_length=1024, unique=True)
+    start = models.DateTimeField(_("début"))
+    end = models.DateTimeField(_("fin"))
+    data = models.JSONField(_("données de l'événement"))
+
+    def __str__(self):
+        return self.data.get("summary", self.event_id)
+
+
+class ViewerCountSample(models.Model):
+    """
+    A streamer's viewers count at some time, sampled by `synclivestreams`.
+    Samples are rolled up, then deleted after a few days; see
+    `streamers.viewers`.
+    """
+
+    class Meta:
+        verbose_name = _("échantillon de spectateurs")
+        verbose_name_plural = _("échantillons de spectateurs")
+        indexes = [
+            models.Index(fields=["time"], name="viewers_sample_time_idx"),
+        ]
+
+    streamer = models.ForeignKey(
+        Streamer,
+        verbose_name=_("streamer"),
+        related_name="viewers_samples",
+        on_delete=models.CASCADE,
+        # Samples are only read by time range; an index per streamer would
+        # almost double the table size.
+        db_index=False,
+    )
+
+    time = models.DateTimeField(_("heure"))
+    viewers = models.PositiveIntegerField(_("spectateurs"))
+
+    def __str__(self):
+        return f"{self.streamer} ({self.time}): {self.viewers}"
+
+
+class ViewerCountRollup(models.Model):
+    """
+    A streamer's viewers counts samples over a minute, an hour or a day,
+    summarized so statistics can be computed without the samples. The sum and
+    count are stored (instead of the average), so rollups can be rolled up
+    again into coarser ones.
+    """
+
+    MINUTE = "minute"
+    HOUR = "hour"
+    DAY = "day"
+    RESOLUTION_CHOICES = [
+        (MINUTE, _("Minute")),
+        (HOUR, _("Heure")),
+        (DAY, _("Jour")),
+    ]
+
+    class Meta:
+        verbose_name = _("agrégat de spectateurs")
+        verbose_name_plural = _("agrégats de spectateurs")
+        constraints = [
+            models.UniqueConstraint(fields=["streamer", "resolution", "start"], name="viewers_rollup_unique"),
+        ]
+        indexes = [
+            # Rollups of every streamer in a time range (e.g. monthly stats).
+            models.Index(fields=["resolution", "start"], name="viewers_rollup_start_idx"),
+        ]
+
+    streamer = models.ForeignKey(
+        Streamer,
+        verbose_name=_("streamer"),
+        related_name="viewers_rollups",
+        on_delete=models.CASCADE,
+        # The unique constraint starts with the streamer.
+        db_index=False,
+    )
+
+    resolution = models.CharField(_("résolution"), max_length=6, choices=RESOLUTION_CHOICES)
+    start = models.DateTimeField(_("début de la période"))
+
+    samples = models.PositiveIntegerField(_("nombre d'échantillons"))
+    viewers_sum = models.PositiveBigIntegerField(_("somme des spectateurs"))
+    viewers_min = models.PositiveIntegerField(_("minimum de spectateurs"))
+    viewers_max = models.PositiveIntegerField(_("maximum de spectateurs"))
+
+    @property
+    def viewers_average(self):
+        return self.viewers_sum / self.samples
+
+    def __str__(self):
+        return f"{self.streamer} ({self.resolution} {self.start}): {self.viewers_average:.0f}"
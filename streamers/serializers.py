@@ -17,6 +17,9 @@ class StreamerSerializer(serializers.ModelSerializer):
             "twitch_url",
             "description",
             "profile_image",
+            "profile_image_srcset",
+            "background_image",
+            "background_image_srcset",
             "colours_hsl",
             "colours_hsl_css",
             "live",
@@ -32,6 +35,8 @@ class StreamerSerializer(serializers.ModelSerializer):
 
 class ScheduledStreamSerializer(serializers.ModelSerializer):
     streamer = StreamerSerializer(read_only=True)
+    # Occurrences of recurring streams are not stored, so they have a key instead of a primary key.
+    pk = serializers.ReadOnlyField(source="key")
 
     class Meta:
         model = ScheduledStream
@@ -47,7 +52,7 @@ class ScheduledStreamFullCalendarSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance: ScheduledStream):
         return {
-            "id": instance.pk,
+            "id": instance.key,
             "groupId": instance.streamer_id,
             "resourceId": instance.streamer_id,
             "start": instance.start,
@@ -77,3 +82,25 @@ class LiveAndScheduledSerializer(serializers.Serializer):
 
     live = StreamerSerializer(many=True)
     scheduled = ScheduledStreamSerializer(many=True)
+
+
+class ViewersStatsSerializer(serializers.Serializer):
+    """
+    Peak and average viewers of a streamer (see `streamers.viewers`).
+    """
+
+    streamer = serializers.CharField(source="streamer__twitch_login")
+    peak = serializers.IntegerField(allow_null=True)
+    average = serializers.FloatField(allow_null=True)
+
+
+class MonthViewersStatsSerializer(ViewersStatsSerializer):
+    month = serializers.DateTimeField(format="%Y-%m")
+
+
+class StreamViewersStatsSerializer(ViewersStatsSerializer):
+    pk = serializers.IntegerField()
+    streamer = serializers.CharField(source="streamer.twitch_login")
+    title = serializers.CharField()
+    start = serializers.DateTimeField()
+    end = serializers.DateTimeField()
@@ -0,0 +1,522 @@
+"""
+The schedules sync engine, loading the scheduled streams from Twitch and
+Google Calendar into the database.
+
+It runs as a pipeline of generator stages, each one consuming the previous
+one, so streamers flow through it one at a time:
+
+- fetch: the Twitch schedules, a few streamers at once (see
+  `fetch_twitch_schedules`), and the Google Calendar changes (see
+  `streamers.sync.google_calendar`);
+- normalize: the raw events become `ScheduledEvent` records;
+- match: Google Calendar events are associated with their candidate
+  streamers (see `StreamerMatcher`);
+- merge: Google Calendar events are merged into the Twitch events, each
+  streamer's schedule being released once every event it may receive is
+  merged (see `ScheduleMerger`);
+- persist: schedules are saved by batches, each in its own transaction (see
+  `streamers.sync.persisting`).
+
+So only the Google Calendar records, and the Twitch schedules still waited
+for, are kept in memory. The same engine is driven by the `syncschedules`
+command, the administration, and the periodic background task (see
+`sync_schedules_if_due`); runs never overlap, thanks to a lock shared by
+every process of the host.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack, contextmanager
+from datetime import timedelta
+
+import dateutil.parser as dp
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+from requests import HTTPError, RequestException, codes
+
+from pogscience.locks import LockHeld, file_lock
+from pogscience.twitch import get_twitch_client
+from streamers.models import Streamer
+from streamers.sync.google_calendar import apply_changes, fetch_changes, get_sync_state, parse_time, stored_events
+from streamers.sync.matching import StreamerMatcher
+from streamers.sync.merging import MergeStats, ScheduleMerger
+from streamers.sync.persisting import BATCH_SIZE, PersistStats, save_recurrences, save_schedules
+from streamers.sync.recurrences import extract_recurrences
+from streamers.sync.records import ScheduledEvent
+
+logger = logging.getLogger(__name__)
+
+# The duration of Twitch events without an end time (even if they are
+# displayed with a duration on the schedule).
+DEFAULT_DURATION = timedelta(hours=3)
+
+
+class SyncAlreadyRunning(Exception):
+    """Raised when a sync is started while another one is running."""
+
+
+class StageTimer:
+    """
+    Measures the time spent in each stage of a pipeline of generators. As
+    stages pull items from each other, the time is charged to the stage
+    running at any moment, excluding the time spent in the stages it pulls
+    from.
+    """
+
+    def __init__(self):
+        # The time spent in each stage, in seconds, by stage name.
+        self.timings = {}
+        self._stack = []
+        self._since = time.perf_counter()
+
+    def _switch(self, stage=None):
+        now = time.perf_counter()
+        if self._stack:
+            self.timings[self._stack[-1]] = self.timings.get(self._stack[-1], 0) + now - self._since
+        self._since = now
+
+        if stage is None:
+            self._stack.pop()
+        else:
+            self._stack.append(stage)
+
+    @contextmanager
+    def measure(self, stage):
+        """Charges the time spent in this context to the given stage."""
+        self._switch(stage)
+        try:
+            yield
+        finally:
+            self._switch()
+
+    def wrap(self, stage, iterable):
+        """Yields the items of the iterable, charging their production to the given stage."""
+        iterator = iter(iterable)
+        while True:
+            with self.measure(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+
+class SyncReport:
+    """What happened during a schedules sync."""
+
+    def __init__(self):
+        self.streamers = 0
+        self.twitch_events = 0
+
+        # Whether Google Calendar was fully synced, or incrementally (None if
+        # it is not configured), how many events were fetched, and what
+        # `apply_changes` did with them.
+        self.gcal_full = None
+        self.gcal_fetched = 0
+        self.gcal_counts = None
+        self.gcal_events = 0
+
+        # The Google Calendar events summaries no streamer was found for.
+        self.unmatched = []
+
+        # The names of the streamers whose Twitch schedule could not be loaded,
+        # by primary key; their stored schedules are kept.
+        self.failed = {}
+
+        self.merge_stats = MergeStats()
+
+        # Weekly occurrences stored as recurring streams.
+        self.occurrences = 0
+        self.recurrences = 0
+
+        self.stats = PersistStats()
+        self.recurrences_stats = PersistStats()
+
+        # The time spent in each stage, in seconds (see `StageTimer`).
+        self.timings = {}
+
+    def lines(self) -> list:
+        """Returns the report, as lines of text."""
+        lines = [f"{self.twitch_events} scheduled streams loaded from Twitch, for {self.streamers} streamers."]
+        if self.failed:
+            lines.append(f"{len(self.failed)} Twitch schedules could not be loaded: their streamers were skipped.")
+
+        if self.gcal_full is None:
+            lines.append("No streams loaded from Google Calendar: API key or calendar ID not configured.")
+        else:
+            lines += [
+                f"Google Calendar {'full' if self.gcal_full else 'incremental'} sync: "
+                f"{self.gcal_fetched} events fetched, "
+                f"{self.gcal_counts['saved']} saved, {self.gcal_counts['deleted']} deleted.",
+                f"{self.gcal_events} scheduled streams loaded from Google Calendar, "
+                f"{len(self.unmatched)} without streamer.",
+                f"Google Calendar events: {self.merge_stats}.",
+            ]
+
+        return lines + [
+            f"{self.occurrences} weekly occurrences stored as {self.recurrences} recurring streams.",
+            f"Scheduled streams: {self.stats}.",
+            f"Recurring streams: {self.recurrences_stats}.",
+        ]
+
+
+def _fetch_twitch_schedule(client, streamer, now):
+    """
+    Loads the scheduled streams of a streamer from Twitch, up to the configured
+    `FETCH_UNTIL` delay, as returned by Twitch. This runs in a worker thread,
+    so it must not query the database.
+
+    :return: The schedule segments, or None if the schedule could not be
+             loaded.
+    """
+    try:
+        return list(
+            client.get_schedule(
+                streamer.twitch_id,
+                start_time=now,
+                end_time=now + settings.POG_SCHEDULE["FETCH_UNTIL"],
+                page_size=25,
+            )
+        )
+    except RequestException as e:
+        # Twitch answers 404 for streamers without schedule.
+        if isinstance(e, HTTPError) and e.response is not None and e.response.status_code == codes.NOT_FOUND:
+            return []
+
+        logger.warning("Unable to load the Twitch schedule of %s: %s", streamer.name, e)
+        return None
+
+
+def fetch_twitch_schedules(executor, client, streamers, now, window: int):
+    """
+    Loads the Twitch schedules of the given streamers, using the executor's
+    workers. At most `window` schedules are loaded or waiting to be consumed at
+    once, so memory does not grow with the number of streamers. The first ones
+    are requested right away, so they load while the caller does something
+    else.
+
+    :return: A generator yielding the `(streamer, segments)` schedules, in the
+             order they were loaded; `segments` is None if the schedule could
+             not be loaded.
+    """
+    streamers = iter(streamers)
+    pending = {}
+
+    def submit(count):
+        for streamer in streamers:
+            pending[executor.submit(_fetch_twitch_schedule, client, streamer, now)] = streamer
+            count -= 1
+            if not count:
+                break
+
+    submit(window)
+
+    def schedules():
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future.result()
+            submit(len(done))
+
+    return schedules()
+
+
+def normalize_twitch(schedules):
+    """Converts the Twitch segments of `(streamer, segments)` schedules into `ScheduledEvent` records."""
+    for streamer, segments in schedules:
+        events = []
+        for segment in segments:
+            start = dp.isoparse(segment["start_time"])
+            events.append(
+                ScheduledEvent(
+                    streamer=streamer,
+                    title=segment["title"],
+                    start=start,
+                    end=dp.isoparse(segment["end_time"]) if segment["end_time"] else start + DEFAULT_DURATION,
+                    category=segment["category"]["name"] if segment["category"] else None,
+                    weekly=segment["is_recurring"],
+                    twitch_segment_id=segment["id"],
+                )
+            )
+        yield streamer, events
+
+
+def normalize_calendar(events):
+    """Converts Google Calendar events into `ScheduledEvent` records, without streamer yet."""
+    for event in events:
+        yield ScheduledEvent(
+            streamer=None,
+            title=event["summary"],
+            start=parse_time(event["start"]),
+            end=parse_time(event["end"]),
+            weekly="recurringEventId" in event,
+            google_calendar_event_id=event["id"],
+            location=event.get("location"),
+        )
+
+
+def match_calendar(events, matcher: StreamerMatcher, unmatched: list):
+    """
+    Associates Google Calendar records with their candidate streamers, matching
+    channels names (and their alternate names) in the events. The records
+    without any candidate are dropped, and their title added to `unmatched`.
+    """
+    for event in events:
+        candidates, title = matcher.match_event(event.title, event.location)
+
+        if not candidates:
+            unmatched.append(event.title)
+            continue
+
+        event.streamer = candidates[0][0]
+        event.title = title
+        event.location = None
+        event.candidates = candidates
+        yield event
+
+
+def merge(schedules, merger: ScheduleMerger):
+    """Yields the `(streamer, events)` schedules as soon as the merger completes them."""
+    for streamer, events in schedules:
+        yield from merger.add(streamer, events)
+    yield from merger.finish()
+
+
+def persist(schedules, now, report: SyncReport, reset=False, batch_size=BATCH_SIZE):
+    """
+    Saves the schedules by batches of about `batch_size` events (or streamers),
+    each batch in its own transaction. Weekly recurring Twitch events are
+    stored once, rather than once per occurrence (see `extract_recurrences`).
+
+    The streamers whose Twitch schedule could not be loaded (see
+    `SyncReport.failed`) are skipped, so they keep their stored schedule. On
+    reset, each streamer's schedule is replaced along with its batch, so
+    readers never see it empty.
+
+    :return: A generator yielding the saved streamers.
+    """
+    batch = []
+    recurrences = []
+    size = 0
+
+    def save():
+        with transaction.atomic():
+            report.stats += save_schedules(batch, now, reset=reset)
+            report.recurrences_stats += save_recurrences(
+                recurrences, [streamer for streamer, _ in batch], now, reset=reset
+            )
+        batch.clear()
+        recurrences.clear()
+
+    for streamer, events in schedules:
+        if streamer.pk in report.failed:
+            continue
+
+        streamer_recurrences, remaining = extract_recurrences(events)
+        report.occurrences += len(events) - len(remaining)
+        report.recurrences += len(streamer_recurrences)
+
+        batch.append((streamer, remaining))
+        recurrences.extend(streamer_recurrences)
+        size += len(events) + 1
+
+        if size >= batch_size:
+            save()
+            size = 0
+        yield streamer
+
+    if batch:
+        save()
+
+
+def _run(reset, concurrency, on_fetched) -> SyncReport:
+    report = SyncReport()
+    timer = StageTimer()
+
+    now = timezone.now()
+    streamers = list(Streamer.objects.all())
+    report.streamers = len(streamers)
+
+    gcal_enabled = settings.POG_SCHEDULE["GOOGLE_API_KEY"] and settings.POG_SCHEDULE["GOOGLE_CALENDAR_ID"]
+    if gcal_enabled:
+        gcal_state = get_sync_state(now)
+        if reset:
+            gcal_state.sync_token = None
+
+    def fetched(schedules):
+        for streamer, segments in schedules:
+            # Still merged, so the Google Calendar events waiting for this
+            # streamer are released, but not persisted.
+            if segments is None:
+                report.failed[streamer.pk] = streamer.name
+                segments = []
+
+            report.twitch_events += len(segments)
+            if on_fetched is not None:
+                on_fetched(streamer)
+            yield streamer, segments
+
+    # Each worker only does HTTP requests; everything touching the database
+    # stays in this thread. The Twitch client waits by itself if we hit the
+    # rate limit.
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        gcal_future = executor.submit(fetch_changes, gcal_state.sync_token, now) if gcal_enabled else None
+        twitch_schedules = fetch_twitch_schedules(executor, get_twitch_client(), streamers, now, concurrency * 2)
+
+        # Google Calendar events must all be known before merging, as each one
+        # may be merged into any of its candidate streamers' events.
+        gcal_events = []
+        if gcal_enabled:
+            with timer.measure("fetch"):
+                changes = gcal_future.result()
+            with timer.measure("persist"):
+                # Only the changed events are fetched, if Google gave us a sync
+                # token last time; so we store them, then use every stored event.
+                report.gcal_counts = apply_changes(gcal_state, changes, now)
+            report.gcal_full = changes.full
+            report.gcal_fetched = len(changes.events)
+            del changes
+
+            events = timer.wrap("fetch", stored_events(now))
+            events = timer.wrap("normalize", normalize_calendar(events))
+            events = timer.wrap("match", match_calendar(events, StreamerMatcher(streamers), report.unmatched))
+            gcal_events = list(events)
+            report.gcal_events = len(gcal_events)
+
+        schedules = timer.wrap("fetch", fetched(twitch_schedules))
+        schedules = timer.wrap("normalize", normalize_twitch(schedules))
+        schedules = timer.wrap("merge", merge(schedules, ScheduleMerger(gcal_events, report.merge_stats)))
+
+        for _ in timer.wrap("persist", persist(schedules, now, report, reset=reset)):
+            pass
+
+    report.timings = timer.timings
+    return report
+
+
+@contextmanager
+def _sync_lock():
+    """
+    Holds the sync lock, yielding its shared state as a dict (see
+    `SharedTokenBucket`), written back when the context exits.
+
+    :raise SyncAlreadyRunning: If another thread or process holds the lock.
+    """
+    with ExitStack() as stack:
+        try:
+            fd = stack.enter_context(file_lock(settings.POG_SCHEDULE["SYNC_LOCK_FILE"], blocking=False))
+        except LockHeld:
+            raise SyncAlreadyRunning() from None
+
+        try:
+            state = json.loads(os.pread(fd, 4096, 0) or b"{}")
+        except ValueError:
+            state = {}
+
+        try:
+            yield state
+        finally:
+            data = json.dumps(state).encode()
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, data, 0)
+
+
+def _locked_run(state, reset, concurrency, on_fetched) -> SyncReport:
+    state["started_at"] = time.time()
+    report = _run(reset, concurrency, on_fetched)
+    state["finished_at"] = time.time()
+    return report
+
+
+def sync_schedules(reset=False, concurrency=8, on_fetched=None) -> SyncReport:
+    """
+    Syncs the streams schedules from Twitch and Google Calendar.
+
+    Already stored scheduled streams are merged with the synced ones, so this
+    can be called over and over again.
+
+    :param reset: If True, every synced streamer's schedule is replaced, even
+                  if it did not change, its future scheduled streams added by
+                  hand being deleted; and Google Calendar is fully loaded.
+    :param concurrency: How many schedules are fetched in parallel.
+    :param on_fetched: Called with each streamer, once its Twitch schedule is
+                       loaded (e.g. for a progress bar).
+    :raise SyncAlreadyRunning: If another sync is running.
+    :return: The sync report.
+    """
+    with _sync_lock() as state:
+        return _locked_run(state, reset, concurrency, on_fetched)
+
+
+def start_sync_schedules(reset=False, concurrency=8) -> bool:
+    """
+    Starts a sync in a background thread (see `sync_schedules`), without
+    waiting for it to finish: only until it took the lock, or failed to. Its
+    report, or its error, is logged.
+
+    :return: False if another sync is running, so this one did not start.
+    """
+    started = Future()
+
+    def task():
+        try:
+            with _sync_lock() as state:
+                started.set_result(True)
+                report = _locked_run(state, reset, concurrency, on_fetched=None)
+            logger.info("Schedules synced:\n%s", "\n".join(report.lines()))
+        except SyncAlreadyRunning:
+            started.set_result(False)
+        except Exception as e:
+            if not started.done():
+                started.set_exception(e)
+            logger.exception("Schedules sync failed")
+        finally:
+            # Each thread has its own database connections.
+            connections.close_all()
+
+    threading.Thread(target=task, name="schedules-sync", daemon=True).start()
+    return started.result()
+
+
+def _read_state() -> dict:
+    """Reads the shared sync state (see `_sync_lock`) without locking it, so running syncs are not disturbed."""
+    try:
+        with open(settings.POG_SCHEDULE["SYNC_LOCK_FILE"], "rb") as f:
+            return json.loads(f.read() or b"{}")
+    except (OSError, ValueError):
+        return {}
+
+
+def sync_schedules_if_due():
+    """
+    Syncs the streams schedules if the last sync started more than the
+    configured `SYNC_PERIOD` ago, and no other sync is running. Meant to be
+    called periodically (see `pogscience.background.register_periodic_task`).
+
+    :return: The sync report, or None if no sync ran.
+    """
+    period = settings.POG_SCHEDULE["SYNC_PERIOD"]
+
+    def due(state):
+        return period is not None and time.time() >= state.get("started_at", 0) + period.total_seconds()
+
+    # Checked without the lock first, so this does not make a sync started
+    # meanwhile (e.g. by a cron job) fail.
+    if not due(_read_state()):
+        return None
+
+    try:
+        with _sync_lock() as state:
+            # Another process may have synced since.
+            if not due(state):
+                return None
+            report = _locked_run(state, reset=False, concurrency=8, on_fetched=None)
+    except SyncAlreadyRunning:
+        return None
+
+    logger.info("Schedules synced:\n%s", "\n".join(report.lines()))
+    return report
@@ -0,0 +1,171 @@
+"""
+Incremental Google Calendar synchronization.
+
+Events are fetched once (a full synchronization), and stored into the
+database. Later synchronizations only fetch the events changed since, thanks
+to the sync token Google returns with the last page of events. Expired tokens
+fall back to a full synchronization, which also runs periodically (see
+`POG_SCHEDULE`), for the events entering the synchronization window.
+"""
+from collections import namedtuple
+
+import dateutil.parser as dp
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from streamers.models import GoogleCalendarEvent, GoogleCalendarSync
+from streamers.sync.persisting import BATCH_SIZE, batched
+
+# The events fetched from Google Calendar: every event if `full`, else only the
+# changed ones (including cancelled ones); and the token for the next sync.
+CalendarChanges = namedtuple("CalendarChanges", ("events", "sync_token", "full"))
+
+# The number of events per page; the maximum allowed by Google.
+PAGE_SIZE = 2500
+
+
+def get_sync_state(now) -> GoogleCalendarSync:
+    """
+    Returns the synchronization state of the configured calendar. Its sync
+    token is removed if a periodic full synchronization is due.
+    """
+    state, _ = GoogleCalendarSync.objects.get_or_create(calendar_id=settings.POG_SCHEDULE["GOOGLE_CALENDAR_ID"])
+
+    if state.full_sync_at is None or state.full_sync_at + settings.POG_SCHEDULE["GOOGLE_FULL_SYNC_PERIOD"] <= now:
+        state.sync_token = None
+
+    return state
+
+
+def fetch_changes(sync_token, now) -> CalendarChanges:
+    """
+    Loads the events from the configured Google Calendar, following the
+    pagination: only the ones changed since the given sync token if any (or
+    if the token expired), else every event up to the configured
+    `FETCH_UNTIL` delay. This runs in a worker thread, so it must not query
+    the database.
+    """
+    # The Google API client is slow to import, and only needed here.
+    from googleapiclient import discovery
+    from googleapiclient.errors import HttpError
+
+    service = discovery.build(
+        "calendar",
+        "v3",
+        developerKey=settings.POG_SCHEDULE["GOOGLE_API_KEY"],
+        client_options={"api_endpoint": settings.POG_SCHEDULE["GOOGLE_API_ENDPOINT"]},
+    )
+
+    # Incremental synchronizations must use the same parameters as the full
+    # one, except the time bounds (and the order, forbidden in both).
+    params = {
+        "calendarId": settings.POG_SCHEDULE["GOOGLE_CALENDAR_ID"],
+        "singleEvents": True,
+        "maxResults": PAGE_SIZE,
+        "timeZone": "UTC",
+    }
+
+    if sync_token:
+        try:
+            return _fetch_all_pages(service, {**params, "syncToken": sync_token}, full=False)
+        except HttpError as e:
+            # The token expired: a full synchronization is needed.
+            if e.resp.status != 410:
+                raise
+
+    return _fetch_all_pages(
+        service,
+        {
+            **params,
+            "timeMin": now.isoformat(),
+            "timeMax": (now + settings.POG_SCHEDULE["FETCH_UNTIL"]).isoformat(),
+        },
+        full=True,
+    )
+
+
+def _fetch_all_pages(service, params, full) -> CalendarChanges:
+    """Loads every page of events; the sync token comes with the last one."""
+    events = []
+    page_token = None
+
+    while True:
+        response = service.events().list(**params, pageToken=page_token).execute()
+        events.extend(response.get("items", []))
+
+        page_token = response.get("nextPageToken")
+        if not page_token:
+            return CalendarChanges(events=events, sync_token=response.get("nextSyncToken"), full=full)
+
+
+def parse_time(time):
+    """Parses a Google Calendar event time (a date, or a date and time)."""
+    parsed = dp.isoparse(time.get("dateTime", time.get("date")))
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def _stored_event(event, stored_event=None) -> GoogleCalendarEvent:
+    stored_event = stored_event or GoogleCalendarEvent(event_id=event["id"])
+    stored_event.start = parse_time(event["start"])
+    stored_event.end = parse_time(event["end"])
+    stored_event.data = event
+    return stored_event
+
+
+@transaction.atomic
+def apply_changes(state: GoogleCalendarSync, changes: CalendarChanges, now) -> dict:
+    """
+    Stores the fetched events, and the new sync token. A full synchronization
+    replaces every stored event; else the changed events are updated, and the
+    cancelled ones deleted.
+
+    :return: The number of events `saved` and `deleted`.
+    """
+    cancelled_ids = {event["id"] for event in changes.events if event.get("status") == "cancelled"}
+    events = {event["id"]: event for event in changes.events if event["id"] not in cancelled_ids}
+
+    if changes.full:
+        previous_ids = set(GoogleCalendarEvent.objects.values_list("event_id", flat=True))
+        GoogleCalendarEvent.objects.all().delete()
+        GoogleCalendarEvent.objects.bulk_create(
+            [_stored_event(event) for event in events.values()], batch_size=BATCH_SIZE
+        )
+
+        deleted = len(previous_ids - events.keys())
+        state.full_sync_at = now
+
+    else:
+        stored = {}
+        for batch in batched(list(events)):
+            stored.update({event.event_id: event for event in GoogleCalendarEvent.objects.filter(event_id__in=batch)})
+
+        GoogleCalendarEvent.objects.bulk_update(
+            [_stored_event(event, stored[event_id]) for event_id, event in events.items() if event_id in stored],
+            ["start", "end", "data"],
+            batch_size=BATCH_SIZE,
+        )
+        GoogleCalendarEvent.objects.bulk_create(
+            [_stored_event(event) for event_id, event in events.items() if event_id not in stored],
+            batch_size=BATCH_SIZE,
+        )
+
+        deleted = 0
+        for batch in batched(list(cancelled_ids)):
+            deleted += GoogleCalendarEvent.objects.filter(event_id__in=batch).delete()[0]
+
+    state.sync_token = changes.sync_token
+    state.save()
+
+    return {"saved": len(events), "deleted": deleted}
+
+
+def stored_events(now):
+    """
+    Yields the stored events (as returned by Google) happening up to the
+    configured `FETCH_UNTIL` delay, ordered by start, without loading them all
+    at once.
+    """
+    events = GoogleCalendarEvent.objects.filter(end__gte=now, start__lt=now + settings.POG_SCHEDULE["FETCH_UNTIL"])
+    for stored_event in events.order_by("start", "event_id").iterator(chunk_size=BATCH_SIZE):
+        yield stored_event.data
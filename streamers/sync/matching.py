@@ -0,0 +1,208 @@
+import re
+import string
+from collections import deque, namedtuple
+
+# A streamer's alias found in a text, between `start` and `end`.
+Match = namedtuple("Match", ("streamer", "alias", "start", "end", "weight"))
+
+# The streamers an event may belong to, as `(streamer, weight)` couples, the
+# most likely first; and the event title, without the streamer name prefix.
+EventMatch = namedtuple("EventMatch", ("candidates", "title"))
+
+RE_SPLIT_BY_CAPS = re.compile("[A-Z][^A-Z]*")
+
+# We remove those words from isolated detection worlds because they are too
+# broad.
+FORBIDDEN_SOLO_DETECTION_WORDS = {
+    "Space",
+    "Le",
+    "Petit",
+    "Professeur",
+    "Hell",
+    "Tout",
+    "Se",
+    *string.ascii_lowercase,
+    *string.ascii_uppercase,
+}
+
+
+def streamer_aliases(streamer) -> list:
+    """
+    Returns the names a streamer may be called by in an event (e.g.
+    `PogScience`, `pogscience`, `Pog Science`, `Pog_Science`, `Science`…).
+    """
+    words_caps = RE_SPLIT_BY_CAPS.findall(streamer.name)
+    words_underscores = streamer.name.split("_")
+    aliases = [
+        streamer.name,
+        streamer.twitch_login,
+        streamer.name.lower(),
+        streamer.name.capitalize(),
+        streamer.twitch_login.capitalize(),
+    ]
+
+    for words in (words_caps, words_underscores):
+        if words:
+            aliases.extend([" ".join(words), "_".join(words), ".".join(words)])
+            aliases.extend([word for word in words if word not in FORBIDDEN_SOLO_DETECTION_WORDS])
+
+    aliases.extend([alias.lower() for alias in aliases])
+
+    return aliases
+
+
+class AhoCorasick:
+    """
+    An Aho-Corasick automaton, finding every occurrence of a set of patterns in
+    a text in a single scan, whatever the number of patterns.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+
+        # The trie of the patterns: the transitions of each state, by char, and
+        # the patterns ending at each state.
+        self._goto = [{}]
+        self._outputs = [[]]
+
+        for index, pattern in enumerate(self.patterns):
+            state = 0
+            for char in pattern:
+                if char not in self._goto[state]:
+                    self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._outputs.append([])
+                state = self._goto[state][char]
+            self._outputs[state].append(index)
+
+        # The failure links: the state of the longest proper suffix of each
+        # state that is also in the trie. Computed breadth-first, so the links
+        # of shorter states are known first; each state then also outputs the
+        # patterns of its failure state.
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._outputs[next_state] = self._outputs[next_state] + self._outputs[self._fail[next_state]]
+
+    def find_all(self, text: str):
+        """
+        Finds every occurrence of the patterns in the given text, overlapping
+        ones included.
+
+        :return: A generator yielding `(pattern index, start, end)` triplets,
+                 ordered by end position.
+        """
+        goto, fail, outputs, patterns = self._goto, self._fail, self._outputs, self.patterns
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            for index in outputs[state]:
+                yield index, position + 1 - len(patterns[index]), position + 1
+
+
+class StreamerMatcher:
+    """
+    Finds the streamers mentioned in Google Calendar events, using their
+    aliases (see `streamer_aliases`). Built once per sync, then each event is
+    matched in a single scan of its summary.
+    """
+
+    LOCATION_WEIGHT = 100
+    START_WEIGHT = 50
+    ANYWHERE_WEIGHT = 10
+
+    RE_TWITCH_LINK = re.compile(r"https?://(www\.)?twitch\.tv/(?P<twitch_login>[a-zA-Z0-9_]{4,25})")
+    RE_TITLE_SEPARATOR = re.compile(r"\s{0,3}[/:–—-]")
+
+    def __init__(self, streamers):
+        # If streamers share an alias, the last one wins.
+        self.aliases = {}
+        for streamer in streamers:
+            for alias in streamer_aliases(streamer):
+                if alias:
+                    self.aliases[alias] = streamer
+
+        self._streamers = list(self.aliases.values())
+        self._automaton = AhoCorasick(self.aliases)
+
+    def find(self, text: str) -> list:
+        """
+        Finds every streamer alias in the given text. Aliases at the beginning
+        of the text are weighted more, as it's how most events are named (e.g.
+        “Streamer - Title”).
+
+        :return: A list of matches, ordered by end position.
+        """
+        return [
+            Match(
+                streamer=self._streamers[index],
+                alias=self._automaton.patterns[index],
+                start=start,
+                end=end,
+                weight=self.START_WEIGHT if start == 0 else self.ANYWHERE_WEIGHT,
+            )
+            for index, start, end in self._automaton.find_all(text)
+        ]
+
+    def match_event(self, summary: str, location: str = None) -> EventMatch:
+        """
+        Finds the streamers an event may belong to. We first try to match the
+        Twitch link in the event location, then the aliases at the beginning of
+        the summary, and if nothing is found, anywhere in the summary.
+
+        :param summary: The event summary.
+        :param location: The event location, if any.
+        :return: The candidate streamers (none if the event could not be
+                 associated with any), and the event title, i.e. the summary
+                 without the streamer name prefix (e.g. “Streamer - ”), if any.
+        """
+        candidates = []
+        names_in_summary = []
+
+        def add_candidate(streamer, weight):
+            if not any(streamer.name == candidate.name for candidate, _ in candidates):
+                candidates.append((streamer, weight))
+
+        if location:
+            match = self.RE_TWITCH_LINK.search(location)
+            streamer = self.aliases.get(match.group("twitch_login").lower()) if match else None
+            if streamer:
+                add_candidate(streamer, self.LOCATION_WEIGHT)
+                names_in_summary.extend([streamer.name, streamer.twitch_login])
+
+        # Occurrences are sorted by alias index, so the most specific aliases
+        # (e.g. the full name) are used first.
+        occurrences = sorted(self._automaton.find_all(summary))
+
+        for index, start, _ in occurrences:
+            if start == 0:
+                add_candidate(self._streamers[index], self.START_WEIGHT)
+                names_in_summary.append(self._automaton.patterns[index])
+
+        if occurrences:
+            index, _, _ = occurrences[0]
+            add_candidate(self._streamers[index], self.ANYWHERE_WEIGHT)
+            names_in_summary.append(self._automaton.patterns[index])
+
+        title = summary
+        for name in names_in_summary:
+            separator = self.RE_TITLE_SEPARATOR.match(summary, len(name)) if summary.startswith(name) else None
+            if separator:
+                title = summary[separator.end() :].strip()
+                break
+
+        return EventMatch(candidates=sorted(candidates, key=lambda candidate: candidate[1], reverse=True), title=title)
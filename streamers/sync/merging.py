@@ -0,0 +1,223 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from itertools import accumulate
+
+
+class IntervalIndex:
+    """
+    A streamer's events, sorted by start, to find the first one overlapping a
+    time range in O(log n).
+
+    Along with the starts, we keep the running maximum of the ends: it never
+    decreases, so the first event ending after some time is found by bisection
+    too, even if events overlap each other.
+    """
+
+    def __init__(self, events):
+        # The sort is stable, so events starting at the same time stay in
+        # their original order.
+        self.events = sorted(events, key=lambda event: event.start)
+        self._starts = [event.start for event in self.events]
+        self._max_ends = list(accumulate((event.end for event in self.events), max))
+
+    def first_overlapping(self, start, end):
+        """
+        Returns the first event (by start time) overlapping the given time
+        range (bounds included), or None.
+        """
+        # Events starting after the range cannot overlap it...
+        candidates = bisect_right(self._starts, end)
+        # ...and the first event ending after the range start is the first
+        # with a running maximum end after it.
+        index = bisect_left(self._max_ends, start, hi=candidates)
+
+        return self.events[index] if index < candidates else None
+
+
+class MergeStats:
+    """What happened when merging Google Calendar events into Twitch ones."""
+
+    def __init__(self):
+        # Google Calendar events merged with a Twitch event.
+        self.merged = 0
+
+        # Google Calendar events merged with a Twitch event of another streamer
+        # than the most likely one.
+        self.merged_with_fallback = 0
+
+        # Twitch events more than one Google Calendar event was merged into
+        # (the last one, by start, wins).
+        self.conflicts = 0
+
+        # Google Calendar events without any Twitch counterpart, kept as is.
+        self.unmerged = 0
+
+    def __str__(self):
+        return (
+            f"{self.merged} merged (including {self.merged_with_fallback} with another candidate streamer, "
+            f"{self.conflicts} conflicting), {self.unmerged} only on Google Calendar"
+        )
+
+
+class ScheduleMerger:
+    """
+    Merges Google Calendar events into the Twitch events of the same streamer
+    happening at the same time (times must overlap), the Twitch event being the
+    winner on conflicts. Each Google Calendar event tests its candidate
+    streamers, the most likely first.
+
+    Streamers' Twitch events are added one streamer at a time (see `add`), as
+    they are fetched. A Google Calendar event is merged as soon as the events
+    of all its candidate streamers were added, and a streamer's schedule is
+    complete once every Google Calendar event it is a candidate for is merged
+    (or not). So only the schedules waited for are kept in memory.
+
+    Each streamer's Twitch events are indexed once (see `IntervalIndex`), so
+    this runs in O((n + m) log n) for n Twitch and m Google Calendar events.
+    """
+
+    def __init__(self, gcal_events, stats: MergeStats = None):
+        """
+        :param gcal_events: The Google Calendar events, with their candidate
+                            streamers.
+        """
+        self.stats = stats or MergeStats()
+
+        # The Google Calendar events waiting for each streamer's events, and
+        # the number of candidate streamers each one still waits for.
+        self._waiting = {}
+        self._missing = {}
+
+        # How many Google Calendar events not merged yet each streamer is a
+        # candidate for; its schedule is complete when it drops to zero.
+        self._references = Counter()
+
+        # The added schedules not complete yet, by streamer: the streamer, its
+        # events, and the index of its Twitch events.
+        self._added = {}
+
+        # The Google Calendar event merged into each Twitch event, by ID of the
+        # latter, to detect conflicts.
+        self._merged = {}
+
+        for gcal_event in gcal_events:
+            candidates = {candidate.pk for candidate, _ in gcal_event.candidates}
+            self._missing[id(gcal_event)] = len(candidates)
+            self._references.update(candidates)
+            for pk in candidates:
+                self._waiting.setdefault(pk, []).append(gcal_event)
+
+    def add(self, streamer, events):
+        """
+        Adds a streamer's Twitch events (updated in place).
+
+        :return: A generator yielding the complete `(streamer, events)`
+                 schedules, including the Google Calendar events not merged
+                 into a Twitch event, kept as is.
+        """
+        self._added[streamer.pk] = (streamer, events, IntervalIndex(events))
+        completed = {streamer.pk}
+
+        for gcal_event in self._waiting.pop(streamer.pk, ()):
+            self._missing[id(gcal_event)] -= 1
+            if not self._missing[id(gcal_event)]:
+                del self._missing[id(gcal_event)]
+                completed.update(self._merge(gcal_event))
+
+        for pk in completed:
+            if not self._references[pk] and pk in self._added:
+                yield self._complete(pk)
+
+    def finish(self):
+        """
+        Merges the remaining Google Calendar events with the added schedules,
+        i.e. if some of their candidates were never added.
+
+        :return: A generator yielding the remaining `(streamer, events)`
+                 schedules.
+        """
+        for gcal_events in self._waiting.values():
+            for gcal_event in gcal_events:
+                if self._missing.pop(id(gcal_event), None) is not None:
+                    self._merge(gcal_event)
+
+        self._waiting.clear()
+        for pk in list(self._added):
+            yield self._complete(pk)
+
+    def _merge(self, gcal_event):
+        """
+        Merges a Google Calendar event into the first overlapping Twitch event
+        of its candidate streamers, or adds it to the schedule of the most
+        likely one.
+
+        :return: The candidate streamers.
+        """
+        candidates = [candidate for candidate, _ in gcal_event.candidates]
+        gcal_event.candidates = ()
+
+        merge_with = None
+        for rank, candidate in enumerate(candidates):
+            _, _, index = self._added.get(candidate.pk, (None, None, None))
+            merge_with = index.first_overlapping(gcal_event.start, gcal_event.end) if index else None
+
+            if merge_with is not None:
+                self.stats.merged += 1
+                self.stats.merged_with_fallback += rank > 0
+                break
+
+        if merge_with is None:
+            # If the event could not be merged with a Twitch event, it's a new one!
+            self.stats.unmerged += 1
+            _, events, _ = self._added.setdefault(candidates[0].pk, (candidates[0], [], None))
+            events.append(gcal_event)
+
+        else:
+            # On conflicts, the last Google Calendar event (by start) wins, so
+            # the result does not depend on the order streamers are added in.
+            winner = gcal_event
+            merged = self._merged.get(id(merge_with))
+            if merged is not None:
+                self.stats.conflicts += 1
+                winner = max(merged, gcal_event, key=lambda event: (event.start, event.google_calendar_event_id))
+
+            self._merged[id(merge_with)] = winner
+            merge_with.google_calendar_event_id = winner.google_calendar_event_id
+
+        self._references.subtract(candidate.pk for candidate in candidates)
+        return [candidate.pk for candidate in candidates]
+
+    def _complete(self, pk):
+        streamer, events, _ = self._added.pop(pk)
+        del self._references[pk]
+        for event in events:
+            self._merged.pop(id(event), None)
+        return streamer, events
+
+
+def merge_events(twitch_events, gcal_events):
+    """
+    Merges the Google Calendar events into the Twitch ones, all at once (see
+    `ScheduleMerger`).
+
+    :param twitch_events: The Twitch events; updated in place.
+    :param gcal_events: The Google Calendar events, with their candidate
+                        streamers.
+    :return: The Google Calendar events that could not be merged (without
+             their candidate streamers), and the merge statistics.
+    """
+    merger = ScheduleMerger(gcal_events)
+    gcal_ids = {id(event) for event in gcal_events}
+
+    schedules = {}
+    for event in twitch_events:
+        schedules.setdefault(event.streamer.pk, (event.streamer, []))[1].append(event)
+
+    unique_gcal_events = []
+    for streamer, events in schedules.values():
+        for _, schedule in merger.add(streamer, events):
+            unique_gcal_events.extend(event for event in schedule if id(event) in gcal_ids)
+    for _, schedule in merger.finish():
+        unique_gcal_events.extend(event for event in schedule if id(event) in gcal_ids)
+
+    return unique_gcal_events, merger.stats
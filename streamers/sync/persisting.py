@@ -0,0 +1,332 @@
+import hashlib
+import json
+from datetime import timezone as dt_timezone
+from itertools import takewhile
+
+import dateutil.parser as dp
+
+from django.db import transaction
+from django.db.models import Q
+
+from streamers.models import RecurringStream, ScheduledStream, Streamer
+
+# How many rows are read, inserted or updated per query.
+BATCH_SIZE = 500
+
+# The fields updated from the sources.
+SYNCED_FIELDS = [
+    "streamer",
+    "title",
+    "start",
+    "end",
+    "category",
+    "weekly",
+    "twitch_segment_id",
+    "google_calendar_event_id",
+    "content_hash",
+]
+
+# The fields identifying a scheduled stream in its sources; each one is unique.
+SOURCE_FIELDS = ["twitch_segment_id", "google_calendar_event_id"]
+
+# The fields of recurring streams updated from Twitch.
+RECURRENCE_FIELDS = ["streamer", "title", "category", "start", "duration", "until", "time_zone", "skipped"]
+
+
+def batched(items, size=BATCH_SIZE):
+    """Splits the given list in lists of at most `size` items."""
+    return [items[index : index + size] for index in range(0, len(items), size)]
+
+
+def event_hash(event) -> str:
+    """
+    Returns a hash of the synced content of an event, stable across runs (and
+    time zones), to detect the events that changed since the last sync.
+    """
+    content = [
+        event.streamer.pk,
+        event.title,
+        event.start.astimezone(dt_timezone.utc).isoformat(),
+        event.end.astimezone(dt_timezone.utc).isoformat(),
+        event.category,
+        event.weekly,
+        event.twitch_segment_id,
+        event.google_calendar_event_id,
+    ]
+    return hashlib.sha256(json.dumps(content).encode()).hexdigest()
+
+
+def schedule_digest(hashes) -> str:
+    """
+    Returns the digest of a streamer's schedule, from the hashes of its events;
+    empty if there is none.
+    """
+    return hashlib.sha256("".join(sorted(hashes)).encode()).hexdigest() if hashes else ""
+
+
+class PersistStats:
+    """What happened when saving the synced events into the database."""
+
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def __iadd__(self, other):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.deleted += other.deleted
+        return self
+
+    def __str__(self):
+        return f"{self.inserted} inserted, {self.updated} updated, {self.unchanged} unchanged, {self.deleted} deleted"
+
+
+def _load_stored(field, source_ids) -> dict:
+    """Loads the stored scheduled streams with the given source IDs, by ID."""
+    stored = {}
+    for batch in batched(source_ids):
+        for scheduled in ScheduledStream.objects.filter(**{f"{field}__in": batch}):
+            stored[getattr(scheduled, field)] = scheduled
+    return stored
+
+
+@transaction.atomic
+def save_schedules(schedules, now, reset=False) -> PersistStats:
+    """
+    Saves the synced schedules of some streamers into the database, in a
+    constant number of queries per batch of changed events; unchanged ones are
+    neither read nor written.
+
+    Each streamer's schedule digest (see `schedule_digest`) is compared with
+    the stored one: streamers whose schedule did not change are skipped as a
+    whole. For the others, events are identified by their source IDs (Twitch
+    segment ID, or Google Calendar event ID), which are unique, and their
+    content hash is compared with the stored one: changed scheduled streams are
+    updated, new ones are inserted, and the future ones not found in the
+    sources anymore, i.e. deleted from there, are deleted.
+
+    As unchanged streamers are skipped, scheduled streams deleted or edited by
+    hand are only restored when the streamer's schedule changes, or on reset.
+
+    :param schedules: The `(streamer, events)` schedules to save; a streamer
+                      without events loses its future scheduled streams.
+    :param now: The sync time.
+    :param reset: If True, the streamers' schedules are replaced whether they
+                  changed or not, and their future scheduled streams not done
+                  and not in the sources (e.g. added by hand) are deleted too.
+    :return: The saving statistics.
+    """
+    stats = PersistStats()
+
+    events = [event for _, schedule in schedules for event in schedule]
+    hashes = [event_hash(event) for event in events]
+
+    hashes_by_streamer = {streamer.pk: [] for streamer, _ in schedules}
+    for event, content_hash in zip(events, hashes):
+        hashes_by_streamer.setdefault(event.streamer.pk, []).append(content_hash)
+
+    stored_digests = {}
+    for batch in batched(list(hashes_by_streamer)):
+        stored_digests.update(Streamer.objects.filter(pk__in=batch).values_list("pk", "schedule_digest"))
+
+    digests = {pk: schedule_digest(hashes) for pk, hashes in hashes_by_streamer.items()}
+    changed_streamers = {pk for pk, digest in digests.items() if reset or digest != stored_digests.get(pk, "")}
+
+    changed = [
+        (event, content_hash) for event, content_hash in zip(events, hashes) if event.streamer.pk in changed_streamers
+    ]
+    stats.unchanged = len(events) - len(changed)
+
+    by_twitch_id = _load_stored(
+        "twitch_segment_id", [event.twitch_segment_id for event, _ in changed if event.twitch_segment_id]
+    )
+    by_gcal_id = _load_stored(
+        "google_calendar_event_id",
+        [event.google_calendar_event_id for event, _ in changed if event.google_calendar_event_id],
+    )
+
+    to_create = []
+    to_update = {}
+    kept = set()
+    superseded = set()
+    # The stored streams losing a source ID, by field.
+    released = {field: set() for field in SOURCE_FIELDS}
+
+    for event, content_hash in changed:
+        stored_by_twitch_id = by_twitch_id.get(event.twitch_segment_id)
+        stored_by_gcal_id = by_gcal_id.get(event.google_calendar_event_id)
+        scheduled = stored_by_twitch_id or stored_by_gcal_id
+
+        # A Google Calendar event stored alone, now merged with a Twitch event
+        # stored too: the former is replaced by the latter.
+        if stored_by_twitch_id and stored_by_gcal_id and stored_by_twitch_id.pk != stored_by_gcal_id.pk:
+            superseded.add(stored_by_gcal_id.pk)
+
+        if scheduled is None:
+            scheduled = ScheduledStream()
+            to_create.append(scheduled)
+        else:
+            kept.add(scheduled.pk)
+            if not reset and scheduled.content_hash == content_hash:
+                stats.unchanged += 1
+                continue
+            to_update[scheduled.pk] = scheduled
+
+            for field in SOURCE_FIELDS:
+                if getattr(scheduled, field) is not None and getattr(scheduled, field) != getattr(event, field):
+                    released[field].add(scheduled.pk)
+
+        scheduled.streamer = event.streamer
+        scheduled.title = event.title
+        if not scheduled.done:
+            scheduled.start = event.start
+            scheduled.end = event.end
+        scheduled.category = event.category
+        scheduled.weekly = event.weekly
+        scheduled.twitch_segment_id = event.twitch_segment_id
+        scheduled.google_calendar_event_id = event.google_calendar_event_id
+        scheduled.content_hash = content_hash
+
+    superseded -= kept
+
+    # Future streams from a source, of the changed streamers, not found in it
+    # by this sync, were deleted there. Streams added by hand, or by
+    # `Streamer.end_stream`, have no source; they are only deleted on reset, if
+    # not done.
+    stale_filter = Q(twitch_segment_id__isnull=False) | Q(google_calendar_event_id__isnull=False)
+    if reset:
+        stale_filter |= Q(done=False)
+
+    stale = set()
+    for batch in batched(list(changed_streamers)):
+        stale.update(
+            ScheduledStream.objects.filter(stale_filter, streamer__in=batch, end__gte=now).values_list("pk", flat=True)
+        )
+    stale = (stale - kept) | superseded
+
+    # Deleted first, as their source IDs may be reused by the updated streams.
+    for batch in batched(list(stale)):
+        ScheduledStream.objects.filter(pk__in=batch).delete()
+
+    # Source IDs are unique, and the database may check it after each row of a
+    # bulk update: an ID moving from a stream to another one is released first.
+    for field, pks in released.items():
+        for batch in batched(list(pks)):
+            ScheduledStream.objects.filter(pk__in=batch).update(**{field: None})
+
+    ScheduledStream.objects.bulk_update(to_update.values(), fields=SYNCED_FIELDS, batch_size=BATCH_SIZE)
+    ScheduledStream.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+    Streamer.objects.bulk_update(
+        [Streamer(pk=pk, schedule_digest=digests[pk]) for pk in changed_streamers],
+        fields=["schedule_digest"],
+        batch_size=BATCH_SIZE,
+    )
+
+    stats.inserted = len(to_create)
+    stats.updated = len(to_update)
+    stats.deleted = len(stale)
+
+    return stats
+
+
+def _follows(stored: RecurringStream, recurrence: RecurringStream) -> bool:
+    """
+    Whether the synced recurrence continues the stored one, i.e. has the same
+    content, and starts on one of its occurrences.
+    """
+    content = ("streamer_id", "title", "category", "duration", "time_zone")
+    return (
+        all(getattr(stored, field) == getattr(recurrence, field) for field in content)
+        and next(stored.starts(recurrence.start)) == recurrence.start
+    )
+
+
+def _past_occurrences(stored: RecurringStream, now) -> list:
+    """
+    Returns the occurrences of a recurring stream which are over, to store
+    them before it is replaced or deleted, so they are kept in the calendar.
+    The others are returned by Twitch, if still planned.
+    """
+    return list(stored.occurrences(end=now - stored.duration))
+
+
+@transaction.atomic
+def save_recurrences(recurrences, streamers, now, reset=False) -> PersistStats:
+    """
+    Saves the synced recurring streams (see `extract_recurrences`) into the
+    database, identified by their Twitch segment ID.
+
+    Twitch only returns the occurrences which did not end, so a recurring
+    stream continuing the stored one keeps its first occurrence, and the
+    occurrences skipped before the synced ones; the stored occurrences not
+    returned by Twitch and not over yet were cancelled, and are skipped.
+    Otherwise, the stored recurring stream is replaced (or deleted if not
+    synced anymore), and its occurrences which are over are stored as
+    scheduled streams.
+
+    :param recurrences: The recurring streams to save, as `RecurringStream`
+                        instances not saved.
+    :param streamers: The synced streamers; their recurring streams not in
+                      `recurrences` are deleted.
+    :param now: The sync time.
+    :param reset: If True, the streamers' recurring streams are all replaced.
+    :return: The saving statistics.
+    """
+    stats = PersistStats()
+    stored = {}
+    for batch in batched([streamer.pk for streamer in streamers]):
+        for recurring in RecurringStream.objects.filter(streamer__in=batch).select_related("streamer"):
+            stored[recurring.twitch_segment_id] = recurring
+
+    to_create = []
+    to_update = []
+    past_occurrences = []
+
+    for recurrence in recurrences:
+        recurring = None if reset else stored.pop(recurrence.twitch_segment_id, None)
+
+        if recurring is None:
+            to_create.append(recurrence)
+            continue
+
+        # Occurrences which started may have been stored when they happened
+        # (see `RecurringStream.materialize`), even if Twitch still returns them.
+        skipped = [key for key in recurring.skipped if recurrence.start <= dp.isoparse(key) <= now]
+
+        if _follows(recurring, recurrence):
+            cancelled = takewhile(lambda start: start < recurrence.start, recurring.starts(now - recurring.duration))
+            skipped.extend(key for key in recurring.skipped if dp.isoparse(key) < recurrence.start)
+            skipped.extend(RecurringStream.skip_key(start) for start in cancelled)
+            recurrence.start = recurring.start
+        else:
+            past_occurrences.extend(_past_occurrences(recurring, now))
+
+        recurrence.skipped = sorted({*skipped, *recurrence.skipped})
+
+        if all(getattr(recurring, field) == getattr(recurrence, field) for field in RECURRENCE_FIELDS):
+            stats.unchanged += 1
+            continue
+
+        for field in RECURRENCE_FIELDS:
+            setattr(recurring, field, getattr(recurrence, field))
+        to_update.append(recurring)
+
+    # Recurring streams not synced anymore were deleted from Twitch.
+    for recurring in stored.values():
+        past_occurrences.extend(_past_occurrences(recurring, now))
+    for batch in batched([recurring.pk for recurring in stored.values()]):
+        RecurringStream.objects.filter(pk__in=batch).delete()
+
+    ScheduledStream.objects.bulk_create(past_occurrences, batch_size=BATCH_SIZE)
+
+    RecurringStream.objects.bulk_update(to_update, fields=RECURRENCE_FIELDS, batch_size=BATCH_SIZE)
+    RecurringStream.objects.bulk_create(to_create, batch_size=BATCH_SIZE)
+
+    stats.inserted = len(to_create)
+    stats.updated = len(to_update)
+    stats.deleted = len(stored)
+
+    return stats
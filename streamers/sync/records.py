@@ -0,0 +1,49 @@
+class ScheduledEvent:
+    """
+    A scheduled stream from Twitch or Google Calendar, while it is synced.
+    Slotted, as they are many, and a sync only keeps the fields it needs.
+    """
+
+    __slots__ = (
+        "streamer",
+        "title",
+        "start",
+        "end",
+        "category",
+        "weekly",
+        "twitch_segment_id",
+        "google_calendar_event_id",
+        # Google Calendar events only, until matched with a streamer: where it
+        # happens (e.g. a Twitch link), and the candidate streamers, as
+        # `(streamer, weight)` couples, the most likely first.
+        "location",
+        "candidates",
+    )
+
+    def __init__(
+        self,
+        streamer,
+        title,
+        start,
+        end,
+        category=None,
+        weekly=False,
+        twitch_segment_id=None,
+        google_calendar_event_id=None,
+        location=None,
+        candidates=(),
+    ):
+        self.streamer = streamer
+        self.title = title
+        self.start = start
+        self.end = end
+        self.category = category
+        self.weekly = weekly
+        self.twitch_segment_id = twitch_segment_id
+        self.google_calendar_event_id = google_calendar_event_id
+        self.location = location
+        self.candidates = candidates
+
+    def __repr__(self):
+        source = self.twitch_segment_id or self.google_calendar_event_id
+        return f"<ScheduledEvent {self.title!r} ({self.streamer}, {self.start} → {self.end}, {source})>"
@@ -0,0 +1,98 @@
+"""
+Weekly recurring Twitch segments, stored as recurrence rules (see
+`RecurringStream`) rather than as one scheduled stream per occurrence.
+"""
+import base64
+import binascii
+import json
+from collections import Counter
+from itertools import takewhile
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+
+from streamers.models import RecurringStream
+
+# A rule is only worth it if it covers at least this many occurrences.
+MIN_OCCURRENCES = 2
+
+
+def segment_series_id(segment_id: str) -> str:
+    """
+    Returns the ID shared by every occurrence of a recurring Twitch segment.
+    Occurrences IDs are base64-encoded JSON objects, with the segment ID, and
+    the ISO year and week of the occurrence.
+    """
+    try:
+        return json.loads(base64.b64decode(segment_id))["segmentID"]
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return segment_id
+
+
+def _shape(event, tz):
+    """What occurrences of the same rule have in common."""
+    start = event.start.astimezone(tz)
+    return event.title, event.category, event.end - event.start, start.weekday(), start.time()
+
+
+def extract_recurrences(events):
+    """
+    Replaces the weekly recurring Twitch events by recurrence rules.
+
+    For each recurring Twitch segment, the rule follows its most common
+    occurrence: same title, category, duration, weekday and time, either in
+    the site time zone or in UTC (whichever matches more occurrences).
+    Occurrences differing from it (e.g. moved) are kept as events, and the
+    missing ones (e.g. cancelled) are skipped by the rule.
+
+    Occurrences following a rule lose the ID of the Google Calendar event they
+    were merged with, if any: it is only used to identify stored events.
+
+    :param events: The events, as `ScheduledEvent` records.
+    :return: The rules, as `RecurringStream` instances not saved, and the
+             remaining events.
+    """
+    time_zones = [ZoneInfo(name) for name in dict.fromkeys((settings.TIME_ZONE, "UTC"))]
+
+    series = {}
+    remaining = []
+    for event in events:
+        if event.weekly and event.twitch_segment_id:
+            series.setdefault(segment_series_id(event.twitch_segment_id), []).append(event)
+        else:
+            remaining.append(event)
+
+    recurrences = []
+    for series_id, occurrences in series.items():
+        shapes = Counter((tz, _shape(event, tz)) for tz in time_zones for event in occurrences)
+        (tz, shape), count = shapes.most_common(1)[0]
+
+        if count < MIN_OCCURRENCES:
+            remaining.extend(occurrences)
+            continue
+
+        following = sorted(
+            (event for event in occurrences if _shape(event, tz) == shape), key=lambda event: event.start
+        )
+        remaining.extend(event for event in occurrences if _shape(event, tz) != shape)
+
+        recurrence = RecurringStream(
+            streamer=following[0].streamer,
+            title=following[0].title,
+            category=following[0].category,
+            start=following[0].start,
+            duration=shape[2],
+            until=following[-1].start,
+            time_zone=str(tz),
+            twitch_segment_id=series_id,
+        )
+
+        starts = {event.start for event in following}
+        recurrence.skipped = [
+            RecurringStream.skip_key(start)
+            for start in takewhile(lambda start: start <= recurrence.until, recurrence.starts())
+            if start not in starts
+        ]
+        recurrences.append(recurrence)
+
+    return recurrences, remaining
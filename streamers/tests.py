@@ -1,3 +1,1511 @@
-from django.test import TestCase
+import base64
+import io
+import itertools
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import pytz
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Sum
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from requests import HTTPError
+from twitch.resources import User
+
+from pogscience.locks import file_lock
+from pogscience.ratelimit import SharedTokenBucket
+from pogscience.storage import ContentHashedStorage
+from pogscience.twitch import HelixAPIGet, TwitchHelix
+from streamers import viewers
+from streamers.eventsub import apply_reconciliation, plan_reconciliation
+from streamers.images import srcsets
+from streamers.models import (
+    EventSubSubscription,
+    GoogleCalendarEvent,
+    GoogleCalendarSync,
+    RecurringStream,
+    ScheduledStream,
+    Streamer,
+    ViewerCountRollup,
+    ViewerCountSample,
+)
+from streamers.sync.engine import (
+    StageTimer,
+    SyncAlreadyRunning,
+    start_sync_schedules,
+    sync_schedules,
+    sync_schedules_if_due,
+)
+from streamers.sync.google_calendar import CalendarChanges, apply_changes, get_sync_state, stored_events
+from streamers.sync.matching import AhoCorasick, StreamerMatcher
+from streamers.sync.merging import IntervalIndex, ScheduleMerger, merge_events
+from streamers.sync.persisting import save_recurrences, save_schedules
+from streamers.sync.records import ScheduledEvent
+from streamers.sync.recurrences import extract_recurrences
+
+
+class StartupImportsTests(SimpleTestCase):
+    """
+    Workers are restarted often, so their startup must stay fast. This runs the
+    Django setup (which imports every app and its models) in a fresh
+    interpreter, and fails if slow modules are imported by it.
+    """
+
+    # Slow to import, these must only be imported on first use.
+    DEFERRED_MODULES = ["numpy", "scipy", "PIL", "googleapiclient"]
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        result = subprocess.run(
+            [sys.executable, "-c", "import json, sys, django; django.setup(); print(json.dumps(list(sys.modules)))"],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "pogscience.settings"},
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        cls.imports = set(json.loads(result.stdout.splitlines()[-1]))
+
+    def test_heavy_modules_are_deferred(self):
+        for module in self.DEFERRED_MODULES:
+            with self.subTest(module=module):
+                self.assertFalse(module in self.imports, f"{module} is imported at startup")
+
+
+class FullTwitchSyncTests(TestCase):
+    """
+    `Streamer.full_twitch_sync` must update streamers whose live status changed
+    with a constant number of queries, whatever the number of streamers.
+    """
+
+    def create_roster(self, size, recurring=False):
+        """
+        Creates `size` streamers, a third of them offline, a third live with a
+        scheduled stream, and a third live without (or with a recurring one, if
+        `recurring`).
+        """
+        start = timezone.now() - timedelta(hours=1)
+        Streamer.objects.bulk_create(
+            [
+                Streamer(
+                    name=f"Streamer {i}",
+                    twitch_login=f"streamer{i}",
+                    twitch_id=1000 + i,
+                    live=i % 3 > 0,
+                    live_started_at=start if i % 3 > 0 else None,
+                    live_title=f"Stream {i}" if i % 3 > 0 else None,
+                )
+                for i in range(size)
+            ]
+        )
+        streamers = Streamer.objects.order_by("twitch_id")
+        ScheduledStream.objects.bulk_create(
+            [
+                ScheduledStream(
+                    streamer=streamer,
+                    title="Scheduled",
+                    start=start + timedelta(minutes=10),
+                    end=start + timedelta(hours=2),
+                    weekly=False,
+                )
+                for i, streamer in enumerate(streamers)
+                if i % 3 == 1
+            ]
+        )
+        if recurring:
+            RecurringStream.objects.bulk_create(
+                [
+                    RecurringStream(
+                        streamer=streamer,
+                        title="Weekly",
+                        start=start + timedelta(minutes=10),
+                        duration=timedelta(hours=2),
+                        until=start + timedelta(weeks=4),
+                        time_zone=settings.TIME_ZONE,
+                        twitch_segment_id=f"segment-{i}",
+                    )
+                    for i, streamer in enumerate(streamers)
+                    if i % 3 == 2
+                ]
+            )
+        return start
+
+    def sync(self, online_twitch_ids):
+        client = mock.Mock()
+        client.get_streams.return_value = [{"user_id": str(twitch_id)} for twitch_id in online_twitch_ids]
+
+        with mock.patch("streamers.models.get_twitch_client", return_value=client):
+            with CaptureQueriesContext(connection) as queries:
+                Streamer.full_twitch_sync()
+
+        self.assertFalse(client.get_streams.call_args.kwargs["use_cache"])
+        return len(queries)
+
+    def test_ended_streams_are_recorded(self):
+        start = self.create_roster(6)
+        self.sync(online_twitch_ids=[1000, 1004])
+
+        self.assertEqual(
+            list(Streamer.objects.filter(live=True).values_list("twitch_id", flat=True).order_by("twitch_id")),
+            [1000, 1004],
+        )
+        self.assertIsNotNone(Streamer.objects.get(twitch_id=1000).live_started_at)
+        self.assertEqual(Streamer.objects.get(twitch_id=1004).live_started_at, start)
+
+        # The scheduled stream of the streamer who went offline spans the actual stream.
+        scheduled = ScheduledStream.objects.get(streamer__twitch_id=1001)
+        self.assertTrue(scheduled.done)
+        self.assertEqual(scheduled.start, start)
+
+        # The others get a new one, and the scheduled stream of a streamer still live is untouched.
+        recorded = ScheduledStream.objects.get(streamer__twitch_id=1005)
+        self.assertEqual((recorded.title, recorded.start, recorded.done), ("Stream 5", start, True))
+        self.assertFalse(ScheduledStream.objects.get(streamer__twitch_id=1004).done)
+        self.assertFalse(ScheduledStream.objects.filter(streamer__twitch_id__in=[1000, 1003]).exists())
+
+    def test_constant_queries_count(self):
+        self.create_roster(6, recurring=True)
+        small = self.sync(online_twitch_ids=[1000])
+        self.assertEqual(ScheduledStream.objects.filter(title="Weekly", done=True).count(), 2)
+
+        ScheduledStream.objects.all().delete()
+        Streamer.objects.all().delete()
+
+        self.create_roster(60, recurring=True)
+        large = self.sync(online_twitch_ids=range(1000, 1020))
+
+        self.assertEqual(small, large)
+
+
+class StreamUpdateTests(TestCase):
+    """
+    Saving a streamer must not call Twitch: its stream is updated in the
+    background, once the transaction is committed.
+    """
+
+    def setUp(self):
+        patcher = mock.patch("streamers.models.get_twitch_client")
+        self.twitch = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+        self.twitch.get_streams.return_value = [
+            {
+                "title": "Live",
+                "game_name": "Science",
+                "viewer_count": 42,
+                "thumbnail_url": "https://example.com/{width}x{height}.jpg",
+            }
+        ]
+
+        # Background tasks run synchronously, and previews are not downloaded.
+        for patcher in (
+            mock.patch(
+                "pogscience.background.get_background_executor", return_value=mock.Mock(submit=lambda task: task())
+            ),
+            mock.patch.object(Streamer, "_download_and_store_image", return_value=False),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_save_does_not_call_twitch(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            streamer = Streamer.objects.create(name="PogScience", twitch_login="pogscience", twitch_id=1, live=True)
+            streamer.live_title = "Edited"
+            streamer.save()
+
+        self.assertEqual(callbacks, [])
+        self.twitch.get_streams.assert_not_called()
+
+    def test_update_after_commit(self):
+        streamer = Streamer.objects.create(name="PogScience", twitch_login="pogscience", twitch_id=1, live=True)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            streamer.update_stream_later()
+            self.twitch.get_streams.assert_not_called()
+
+        self.assertEqual(len(callbacks), 1)
+        self.twitch.get_streams.assert_called_once_with(user_ids=[1], use_cache=False)
+        streamer.refresh_from_db()
+        self.assertEqual((streamer.live_title, streamer.live_spectators), ("Live", 42))
+
+    def test_no_update_on_rollback(self):
+        streamer = Streamer.objects.create(name="PogScience", twitch_login="pogscience", twitch_id=1, live=True)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                streamer.update_stream_later()
+                raise RuntimeError()
+
+        self.assertEqual(callbacks, [])
+        self.twitch.get_streams.assert_not_called()
+
+
+class ColoursPaletteTests(SimpleTestCase):
+    def test_palette(self):
+        streamer = Streamer(name="PogScience")
+        self.assertEqual((streamer.colours, streamer.colours_hex, streamer.colours_hsl_css), ([], [], []))
+
+        streamer.colours = [(255, 128, 0), (0, 0, 255)]
+        self.assertEqual(streamer.colours, [(255.0, 128.0, 0.0), (0.0, 0.0, 255.0)])
+        self.assertEqual(streamer.colours_hex, ["#ff8000", "#0000ff"])
+        self.assertEqual(
+            [[round(value, 1) for value in hsl] for hsl in streamer.colours_hsl],
+            [[30.1, 100.0, 50.0], [240.0, 100.0, 50.0]],
+        )
+        self.assertEqual(streamer.colours_hsl_css[1], "hsl(240.0, 100.0%, 50.0%)")
+
+        del streamer.colours
+        self.assertIsNone(streamer.palette)
+        self.assertEqual(streamer.colours_hsl, [])
+
+
+class PaletteMigrationTests(TransactionTestCase):
+    before = ("streamers", "0017_add_stream_end_and_done")
+    after = ("streamers", "0018_store_streamers_colours_palette")
+
+    def migrate(self, target=None):
+        """Migrates the database to the given migration, or the latest ones; returns the models registry."""
+        executor = MigrationExecutor(connection)
+        targets = [target] if target else executor.loader.graph.leaf_nodes()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate()
+        super().tearDown()
+
+    def test_colours_are_converted(self):
+        Streamer = self.migrate(self.before).get_model("streamers", "Streamer")
+        Streamer.objects.create(name="Colours", twitch_login="colours", twitch_id=1, _colours="255,128,0,0,0,255")
+        Streamer.objects.create(name="No colours", twitch_login="none", twitch_id=2, _colours="")
+
+        Streamer = self.migrate(self.after).get_model("streamers", "Streamer")
+        palettes = dict(Streamer.objects.values_list("twitch_login", "palette"))
+        self.assertIsNone(palettes["none"])
+        self.assertEqual(palettes["colours"]["rgb"], [[255.0, 128.0, 0.0], [0.0, 0.0, 255.0]])
+        self.assertEqual(palettes["colours"]["hex"], ["#ff8000", "#0000ff"])
+        self.assertEqual(palettes["colours"]["hsl_css"][1], "hsl(240.0, 100.0%, 50.0%)")
+
+        # And back.
+        Streamer = self.migrate(self.before).get_model("streamers", "Streamer")
+        self.assertEqual(Streamer.objects.get(twitch_login="colours")._colours, "255.0,128.0,0.0,0.0,0.0,255.0")
+
+
+@skipUnless(connection.vendor == "sqlite", "Query plans are read using SQLite's EXPLAIN QUERY PLAN.")
+class QueryPlansTests(TestCase):
+    """
+    Past streams are kept for statistics, so the tables grow forever. This runs
+    the code behind the hot queries, and fails if any of them has to scan a
+    whole table instead of using an index.
+    """
+
+    # e.g. `SCAN streamers_streamer`, but not `SCAN streamers_streamer USING INDEX …`.
+    RE_FULL_SCAN = re.compile(r"^SCAN (TABLE )?\S+( AS \S+)?$")
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.live_streamer = Streamer.objects.create(
+            name="Live", twitch_login="live", twitch_id=1, live=True, live_started_at=now - timedelta(hours=1)
+        )
+        cls.offline_streamer = Streamer.objects.create(name="Offline", twitch_login="offline", twitch_id=2)
+
+        for streamer in (cls.live_streamer, cls.offline_streamer):
+            for days in range(-3, 4):
+                ScheduledStream.objects.create(
+                    streamer=streamer,
+                    title="Stream",
+                    start=now + timedelta(days=days),
+                    end=now + timedelta(days=days, hours=2),
+                    weekly=False,
+                    done=days < 0,
+                )
+
+    def assertNoFullScan(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+
+        for query in queries.captured_queries:
+            sql = query["sql"]
+            if not sql.startswith(("SELECT", "UPDATE", "DELETE")):
+                continue
+
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = [row[-1] for row in cursor.fetchall()]
+
+            with self.subTest(sql=sql):
+                self.assertFalse(
+                    any(self.RE_FULL_SCAN.match(step) for step in plan),
+                    "Full table scan:\n" + "\n".join(plan),
+                )
+
+    def test_live_and_upcoming(self):
+        self.assertNoFullScan(lambda: self.client.get(reverse("streamers:api-live-upcoming")))
+
+    def test_scheduled_streams(self):
+        now = timezone.now()
+        self.assertNoFullScan(lambda: self.client.get(reverse("streamers:api-scheduled")))
+        self.assertNoFullScan(
+            lambda: self.client.get(
+                reverse("streamers:api-scheduled"),
+                {"start": (now - timedelta(days=7)).isoformat(), "end": now.isoformat()},
+            )
+        )
+
+    def test_end_stream(self):
+        self.assertNoFullScan(self.live_streamer.end_stream)
+
+    def test_eventsub_ingest(self):
+        payload = {"subscription": {"id": str(uuid.uuid4()), "status": "enabled"}}
+        self.assertNoFullScan(
+            lambda: self.client.post(
+                reverse("streamers:eventsub-ingest"), json.dumps(payload), content_type="application/json"
+            )
+        )
+
+
+class ViewersTimeSeriesTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.streamer = Streamer.objects.create(name="Streamer", twitch_login="streamer", twitch_id=1)
+
+        # A stream sampled every 10 minutes, from 20:00 to 02:00 (so over two days).
+        cls.midnight = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=3)
+        cls.stream_start = cls.midnight + timedelta(hours=20)
+        cls.stream_end = cls.midnight + timedelta(hours=26)
+        ViewerCountSample.objects.bulk_create(
+            ViewerCountSample(streamer=cls.streamer, time=cls.stream_start + timedelta(minutes=10 * i), viewers=100 + i)
+            for i in range(36)
+        )
+        cls.peak = 135
+        cls.average = sum(range(100, 136)) / 36
+
+    def rollups(self, resolution):
+        return ViewerCountRollup.objects.filter(resolution=resolution)
+
+    def test_rollup(self):
+        created = viewers.rollup(now=self.midnight + timedelta(days=2))
+
+        self.assertEqual(created, {"minute": 36, "hour": 6, "day": 2})
+        for resolution in viewers.RESOLUTIONS:
+            totals = self.rollups(resolution).aggregate(samples=Sum("samples"), viewers=Sum("viewers_sum"))
+            self.assertEqual(totals, {"samples": 36, "viewers": sum(range(100, 136))})
+
+        self.assertEqual(viewers.rollup(now=self.midnight + timedelta(days=2)), {"minute": 0, "hour": 0, "day": 0})
+
+    def test_only_complete_periods_are_rolled_up(self):
+        viewers.rollup(now=self.midnight + timedelta(hours=23, minutes=30))
+        self.assertEqual(self.rollups("hour").count(), 3)
+        self.assertEqual(self.rollups("day").count(), 0)
+
+        # Stats include the periods not rolled up into days yet.
+        stats = viewers.stats_per_streamer().get()
+        self.assertEqual(stats["peak"], 120)
+
+        viewers.rollup(now=self.midnight + timedelta(days=2))
+        self.assertEqual(self.rollups("hour").count(), 6)
+        self.assertEqual(self.rollups("day").count(), 2)
+
+    def test_compact(self):
+        now = self.midnight + timedelta(days=30)
+        viewers.rollup(now=now)
+        deleted = viewers.compact(now=now)
+
+        self.assertEqual(deleted, {"sample": 36, "minute": 36, "hour": 0, "day": 0})
+
+        stats = viewers.stats_per_month().get()
+        self.assertEqual(stats["peak"], self.peak)
+        self.assertAlmostEqual(stats["average"], self.average)
+
+    def test_stats_per_stream(self):
+        ScheduledStream.objects.create(
+            streamer=self.streamer,
+            title="Stream",
+            start=self.stream_start,
+            end=self.stream_end,
+            weekly=False,
+            done=True,
+        )
+        viewers.rollup(now=self.midnight + timedelta(days=2))
+
+        response = self.client.get(reverse("streamers:api-stats-viewers"), {"per": "stream"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(response.data[0]["streamer"], "streamer")
+        self.assertEqual(response.data[0]["peak"], self.peak)
+        self.assertAlmostEqual(response.data[0]["average"], self.average)
+
+
+class StreamerMatcherTests(SimpleTestCase):
+    def setUp(self):
+        self.pog = Streamer(pk=1, name="PogScience", twitch_login="pogscience", twitch_id=1)
+        self.astro = Streamer(pk=2, name="Astro_Bio", twitch_login="astrobio", twitch_id=2)
+        self.matcher = StreamerMatcher([self.pog, self.astro])
+
+    def test_automaton_finds_overlapping_patterns(self):
+        automaton = AhoCorasick(["he", "she", "his", "hers"])
+        self.assertEqual(
+            sorted(automaton.find_all("ushers")),
+            [(0, 2, 4), (1, 1, 4), (3, 2, 6)],
+        )
+
+    def test_match_at_start(self):
+        candidates, title = self.matcher.match_event("PogScience - Revue de presse")
+        self.assertEqual(candidates, [(self.pog, StreamerMatcher.START_WEIGHT)])
+        self.assertEqual(title, "Revue de presse")
+
+    def test_match_anywhere(self):
+        candidates, title = self.matcher.match_event("Chimie avec Astro Bio")
+        self.assertEqual(candidates, [(self.astro, StreamerMatcher.ANYWHERE_WEIGHT)])
+        self.assertEqual(title, "Chimie avec Astro Bio")
+
+    def test_location_wins(self):
+        candidates, _ = self.matcher.match_event("PogScience : Astro", location="https://twitch.tv/astrobio")
+        self.assertEqual(
+            candidates, [(self.astro, StreamerMatcher.LOCATION_WEIGHT), (self.pog, StreamerMatcher.START_WEIGHT)]
+        )
+
+    def test_no_match(self):
+        self.assertEqual(self.matcher.match_event("Soirée jeux").candidates, [])
+
+
+class MergeEventsTests(SimpleTestCase):
+    def setUp(self):
+        self.streamer = Streamer(pk=1, name="PogScience", twitch_login="pogscience", twitch_id=1)
+        self.other = Streamer(pk=2, name="AstroBio", twitch_login="astrobio", twitch_id=2)
+        self.now = timezone.now()
+
+    def event(self, start, end, streamer=None, gcal_id=None, candidates=()):
+        return ScheduledEvent(
+            streamer=streamer or self.streamer,
+            title="Stream",
+            start=self.now + timedelta(hours=start),
+            end=self.now + timedelta(hours=end),
+            google_calendar_event_id=gcal_id,
+            candidates=[(candidate, 50) for candidate in candidates],
+        )
+
+    def test_first_overlapping(self):
+        # The long first event overlaps the ones after it.
+        long, short, last = self.event(0, 10), self.event(2, 3), self.event(20, 22)
+        index = IntervalIndex([last, short, long])
+
+        self.assertIs(index.first_overlapping(self.now + timedelta(hours=4), self.now + timedelta(hours=5)), long)
+        self.assertIs(index.first_overlapping(self.now + timedelta(hours=22), self.now + timedelta(hours=23)), last)
+        self.assertIsNone(index.first_overlapping(self.now + timedelta(hours=11), self.now + timedelta(hours=19)))
+
+    def test_merge_events(self):
+        twitch_events = [self.event(0, 2), self.event(24, 26, streamer=self.other)]
+        gcal_events = [
+            self.event(1, 2, gcal_id="a", candidates=[self.streamer]),
+            self.event(24, 25, gcal_id="b", candidates=[self.streamer, self.other]),
+            self.event(48, 50, gcal_id="c", candidates=[self.streamer]),
+        ]
+
+        unique_gcal_events, stats = merge_events(twitch_events, gcal_events)
+
+        self.assertEqual([event.google_calendar_event_id for event in twitch_events], ["a", "b"])
+        self.assertEqual([event.google_calendar_event_id for event in unique_gcal_events], ["c"])
+        self.assertEqual((stats.merged, stats.merged_with_fallback, stats.unmerged), (2, 1, 1))
+
+    def test_schedules_are_released_once_complete(self):
+        third = Streamer(pk=3, name="Third", twitch_login="third", twitch_id=3)
+        gcal_events = [
+            self.event(1, 2, gcal_id="a", candidates=[self.other, self.streamer]),
+            self.event(5, 6, gcal_id="b", candidates=[self.other]),
+            self.event(3, 4, gcal_id="c", candidates=[self.other]),
+        ]
+        merger = ScheduleMerger(gcal_events)
+
+        # The third streamer is not waited for, but the first one is, until
+        # the other one's events are known, as the event may be merged there.
+        self.assertEqual([streamer for streamer, _ in merger.add(third, [])], [third])
+        self.assertEqual(list(merger.add(self.streamer, [self.event(0, 2)])), [])
+
+        # Both events of the other streamer overlap the same Twitch event: the
+        # last one wins.
+        schedules = dict(merger.add(self.other, [self.event(3, 6, streamer=self.other)]))
+        self.assertEqual(set(schedules), {self.streamer, self.other})
+        self.assertEqual(schedules[self.streamer][0].google_calendar_event_id, "a")
+        self.assertEqual(schedules[self.other][0].google_calendar_event_id, "b")
+        self.assertEqual(merger.stats.conflicts, 1)
+        self.assertEqual(list(merger.finish()), [])
+
+
+class SaveEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.streamer = Streamer.objects.create(name="PogScience", twitch_login="pogscience", twitch_id=1)
+
+    def events(self, count, now, twitch=True):
+        return [
+            ScheduledEvent(
+                streamer=self.streamer,
+                title=f"Stream {index}",
+                start=now + timedelta(days=index),
+                end=now + timedelta(days=index, hours=2),
+                weekly=True,
+                twitch_segment_id=f"segment-{index}" if twitch else None,
+                google_calendar_event_id=None if twitch else f"event-{index}",
+            )
+            for index in range(count)
+        ]
+
+    def save(self, events, now, streamers=()):
+        """Saves the events as their streamers' schedules (the given streamers having none)."""
+        schedules = {streamer.pk: (streamer, []) for streamer in streamers}
+        for event in events:
+            schedules.setdefault(event.streamer.pk, (event.streamer, []))[1].append(event)
+        return save_schedules(list(schedules.values()), now)
+
+    def test_upsert(self):
+        now = timezone.now()
+        stats = self.save(self.events(10, now), now)
+        self.assertEqual((stats.inserted, stats.updated, stats.deleted), (10, 0, 0))
+
+        # The second stream was deleted from Twitch, and the third one moved.
+        now += timedelta(minutes=15)
+        events = self.events(10, now)
+        del events[1]
+        events[1].start += timedelta(hours=1)
+
+        stats = self.save(events, now)
+        self.assertEqual((stats.inserted, stats.updated, stats.deleted), (0, 9, 1))
+        self.assertEqual(ScheduledStream.objects.count(), 9)
+        self.assertEqual(ScheduledStream.objects.get(twitch_segment_id="segment-2").start, events[1].start)
+
+    def test_unchanged_events_are_not_written(self):
+        now = timezone.now()
+        other = Streamer.objects.create(name="Other", twitch_login="other", twitch_id=2)
+        events = self.events(10, now)
+        for event in events[5:]:
+            event.streamer = other
+        self.save(events, now)
+
+        with CaptureQueriesContext(connection) as captured:
+            stats = self.save(events, now + timedelta(minutes=15))
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (0, 0, 10, 0))
+        self.assertFalse([query for query in captured if query["sql"].startswith(("INSERT", "UPDATE", "DELETE"))])
+
+        # Only the changed stream is written, and the other streamer's ones not
+        # even read.
+        events[0].title = "Renamed"
+        with CaptureQueriesContext(connection) as captured:
+            stats = self.save(events, now + timedelta(minutes=30))
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (0, 1, 9, 0))
+        self.assertEqual(ScheduledStream.objects.get(twitch_segment_id="segment-0").title, "Renamed")
+        self.assertFalse([query for query in captured if "segment-5" in query["sql"]])
+
+        # A streamer without any event anymore loses its scheduled streams.
+        stats = self.save(events[:5], now + timedelta(minutes=45), streamers=[other])
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (0, 0, 5, 5))
+        self.assertFalse(other.schedule.exists())
+
+    def test_merged_calendar_event_replaces_stored_one(self):
+        now = timezone.now()
+        self.save(self.events(1, now, twitch=False) + self.events(1, now + timedelta(days=1)), now)
+
+        events = self.events(1, now + timedelta(days=1))
+        events[0].google_calendar_event_id = "event-0"
+        stats = self.save(events, now + timedelta(minutes=15))
+
+        self.assertEqual((stats.inserted, stats.updated, stats.deleted), (0, 1, 1))
+        scheduled = ScheduledStream.objects.get()
+        self.assertEqual((scheduled.twitch_segment_id, scheduled.google_calendar_event_id), ("segment-0", "event-0"))
+
+    def test_reset_replaces_only_the_saved_schedules(self):
+        now = timezone.now()
+        other = Streamer.objects.create(name="Other", twitch_login="other", twitch_id=2)
+        self.save(self.events(2, now), now)
+        for streamer in (self.streamer, other):
+            ScheduledStream.objects.create(
+                streamer=streamer,
+                title="By hand",
+                start=now + timedelta(days=3),
+                end=now + timedelta(days=3, hours=1),
+                weekly=False,
+            )
+        ScheduledStream.objects.filter(twitch_segment_id="segment-0").update(title="Edited")
+
+        stats = save_schedules([(self.streamer, self.events(2, now))], now + timedelta(minutes=15), reset=True)
+
+        self.assertEqual((stats.inserted, stats.updated, stats.unchanged, stats.deleted), (0, 2, 0, 1))
+        self.assertEqual(
+            set(ScheduledStream.objects.values_list("streamer__twitch_login", "title")),
+            {("pogscience", "Stream 0"), ("pogscience", "Stream 1"), ("other", "By hand")},
+        )
+
+    def test_calendar_event_moving_to_another_stored_stream(self):
+        now = timezone.now()
+        # The second Twitch stream is stored first, so it is updated first.
+        second, first = self.events(2, now)[::-1]
+        first.google_calendar_event_id = "event-0"
+        self.save([second], now)
+        self.save([second, first], now + timedelta(minutes=15))
+
+        # The Google Calendar event now matches the second stream.
+        first.google_calendar_event_id, second.google_calendar_event_id = None, "event-0"
+        stats = self.save([first, second], now + timedelta(minutes=30))
+
+        self.assertEqual((stats.inserted, stats.updated, stats.deleted), (0, 2, 0))
+        self.assertEqual(
+            dict(ScheduledStream.objects.values_list("twitch_segment_id", "google_calendar_event_id")),
+            {"segment-0": None, "segment-1": "event-0"},
+        )
+
+    def test_constant_queries_count(self):
+        queries = []
+        for count in (10, 200):
+            now = timezone.now()
+            self.save(self.events(count, now), now)
+            with CaptureQueriesContext(connection) as captured:
+                self.save(self.events(count, now), now + timedelta(minutes=15))
+            queries.append(len(captured))
+
+        # Bulk queries may be split to fit the database parameters limit, but
+        # never run per row.
+        self.assertLess(queries[1] - queries[0], 10)
+
+
+@override_settings(POG_SCHEDULE={**settings.POG_SCHEDULE, "GOOGLE_CALENDAR_ID": "calendar"})
+class GoogleCalendarSyncTests(TestCase):
+    def event(self, index, now, status="confirmed"):
+        return {
+            "id": f"event-{index}",
+            "status": status,
+            "summary": f"Stream {index}",
+            "start": {"dateTime": (now + timedelta(days=index)).isoformat()},
+            "end": {"dateTime": (now + timedelta(days=index, hours=2)).isoformat()},
+        }
+
+    def test_incremental_sync(self):
+        now = timezone.now()
+        state = get_sync_state(now)
+        self.assertIsNone(state.sync_token)
+
+        changes = CalendarChanges(events=[self.event(index, now) for index in range(3)], sync_token="1", full=True)
+        self.assertEqual(apply_changes(state, changes, now), {"saved": 3, "deleted": 0})
+
+        # The first event was cancelled, the second one renamed, and another added.
+        state = get_sync_state(now)
+        self.assertEqual(state.sync_token, "1")
+        events = [self.event(0, now, status="cancelled"), self.event(1, now), self.event(3, now)]
+        events[1]["summary"] = "Renamed"
+        changes = CalendarChanges(events=events, sync_token="2", full=False)
+        self.assertEqual(apply_changes(state, changes, now), {"saved": 2, "deleted": 1})
+
+        self.assertEqual(GoogleCalendarSync.objects.get().sync_token, "2")
+        self.assertEqual([event["summary"] for event in stored_events(now)], ["Renamed", "Stream 2", "Stream 3"])
+
+    def test_full_sync_replaces_stored_events(self):
+        now = timezone.now()
+        apply_changes(get_sync_state(now), CalendarChanges(events=[self.event(0, now)], sync_token="1", full=True), now)
+
+        # Past the full sync period, the sync token is dropped.
+        later = now + settings.POG_SCHEDULE["GOOGLE_FULL_SYNC_PERIOD"]
+        state = get_sync_state(later)
+        self.assertIsNone(state.sync_token)
+
+        changes = CalendarChanges(events=[self.event(1, now)], sync_token="2", full=True)
+        self.assertEqual(apply_changes(state, changes, later), {"saved": 1, "deleted": 1})
+        self.assertEqual(list(GoogleCalendarEvent.objects.values_list("event_id", flat=True)), ["event-1"])
+
+
+class SyncEngineTests(SimpleTestCase):
+    def test_stage_timer_charges_exclusive_time(self):
+        timer = StageTimer()
+
+        def slow(items):
+            for item in items:
+                time.sleep(0.01)
+                yield item
+
+        for _ in timer.wrap("outer", slow(timer.wrap("inner", slow(range(5))))):
+            pass
+
+        self.assertEqual(set(timer.timings), {"inner", "outer"})
+        for stage in ("inner", "outer"):
+            self.assertAlmostEqual(timer.timings[stage], 0.05, delta=0.03)
+
+    def test_runs_never_overlap(self):
+        with tempfile.TemporaryDirectory() as directory:
+            lock_file = os.path.join(directory, "sync.lock")
+            schedule_settings = {
+                **settings.POG_SCHEDULE,
+                "SYNC_LOCK_FILE": lock_file,
+                "SYNC_PERIOD": timedelta(minutes=15),
+            }
+            with override_settings(POG_SCHEDULE=schedule_settings):
+                with file_lock(lock_file):
+                    with self.assertRaises(SyncAlreadyRunning):
+                        sync_schedules()
+                    self.assertFalse(start_sync_schedules())
+
+                    # A sync is not due while another one runs, and checking
+                    # it does not take the lock.
+                    with open(lock_file, "w") as f:
+                        json.dump({"started_at": time.time()}, f)
+                    with mock.patch("streamers.sync.engine._sync_lock") as sync_lock:
+                        self.assertIsNone(sync_schedules_if_due())
+                    sync_lock.assert_not_called()
+
+
+class SyncSchedulesTests(TestCase):
+    def test_failed_schedules_are_kept(self):
+        now = timezone.now()
+        # Both were synced before, with one scheduled stream.
+        failing = Streamer.objects.create(name="Failing", twitch_login="failing", twitch_id=1, schedule_digest="a")
+        unscheduled = Streamer.objects.create(
+            name="Unscheduled", twitch_login="unscheduled", twitch_id=2, schedule_digest="b"
+        )
+        for streamer in (failing, unscheduled):
+            ScheduledStream.objects.create(
+                streamer=streamer,
+                title="Stream",
+                start=now + timedelta(days=1),
+                end=now + timedelta(days=1, hours=2),
+                weekly=False,
+                twitch_segment_id=f"segment-{streamer.twitch_id}",
+            )
+
+        # Twitch fails for the first streamer, and answers 404 for streamers
+        # without schedule.
+        def get_schedule(broadcaster_id, **kwargs):
+            raise HTTPError(response=mock.Mock(status_code=500 if broadcaster_id == 1 else 404))
+
+        with tempfile.TemporaryDirectory() as directory:
+            schedule_settings = {
+                **settings.POG_SCHEDULE,
+                "GOOGLE_API_KEY": None,
+                "SYNC_LOCK_FILE": os.path.join(directory, "sync.lock"),
+            }
+            with override_settings(POG_SCHEDULE=schedule_settings), mock.patch(
+                "streamers.sync.engine.get_twitch_client"
+            ) as get_twitch_client:
+                get_twitch_client.return_value.get_schedule.side_effect = get_schedule
+                report = sync_schedules()
+
+        self.assertEqual(report.failed, {failing.pk: "Failing"})
+        self.assertEqual(report.stats.deleted, 1)
+        self.assertEqual(list(ScheduledStream.objects.values_list("streamer__name", flat=True)), ["Failing"])
+
+
+class RecurringStreamsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.streamer = Streamer.objects.create(name="PogScience", twitch_login="pogscience", twitch_id=1)
+
+    def events(self, first, weeks):
+        """Weekly Twitch events, at the same local time (Twitch handles DST)."""
+        first = timezone.localtime(first).replace(tzinfo=None)
+        return [
+            ScheduledEvent(
+                streamer=self.streamer,
+                title="Weekly",
+                start=timezone.make_aware(first + timedelta(weeks=week)),
+                end=timezone.make_aware(first + timedelta(weeks=week, hours=2)),
+                weekly=True,
+                twitch_segment_id=base64.b64encode(
+                    json.dumps({"segmentID": "slot", "isoYear": 2026, "isoWeek": week}).encode()
+                ).decode(),
+            )
+            for week in weeks
+        ]
+
+    def test_extract_recurrences(self):
+        # Across a DST change, with a cancelled occurrence, and a moved one.
+        events = self.events(timezone.make_aware(datetime(2026, 10, 5, 20)), [0, 1, 2, 4, 5, 6])
+        events[4].start += timedelta(hours=1)
+
+        recurrences, remaining = extract_recurrences(events)
+
+        self.assertEqual(remaining, [events[4]])
+        recurrence = recurrences[0]
+        self.assertEqual((recurrence.twitch_segment_id, recurrence.time_zone), ("slot", settings.TIME_ZONE))
+        self.assertEqual((recurrence.start, recurrence.until), (events[0].start, events[5].start))
+        self.assertEqual(
+            recurrence.skipped,
+            [
+                RecurringStream.skip_key(timezone.make_aware(datetime(2026, month, day, 20)))
+                for month, day in [(10, 26), (11, 9)]
+            ],
+        )
+
+        recurrence.save()
+        self.assertEqual(
+            [occurrence.start for occurrence in recurrence.occurrences()],
+            [events[index].start for index in (0, 1, 2, 3, 5)],
+        )
+
+    def test_sync_keeps_past_occurrences(self):
+        now = timezone.now()
+        first = now + timedelta(hours=1)
+        recurrences, _ = extract_recurrences(self.events(first, range(3)))
+        self.assertEqual(save_recurrences(recurrences, [self.streamer], now).inserted, 1)
+
+        # A week later, the first two occurrences are over, so not returned
+        # anymore, and a new one appears; the next one was cancelled.
+        now = self.events(first, [1])[0].end + timedelta(hours=1)
+        recurrences, _ = extract_recurrences(self.events(first, [3, 4]))
+        self.assertEqual(save_recurrences(recurrences, [self.streamer], now).updated, 1)
+
+        recurring_stream = RecurringStream.objects.get()
+        self.assertEqual(
+            [occurrence.start for occurrence in recurring_stream.occurrences()],
+            [event.start for event in self.events(first, [0, 1, 3, 4])],
+        )
+        self.assertFalse(ScheduledStream.objects.exists())
+
+        self.assertEqual(save_recurrences(recurrences, [self.streamer], now).unchanged, 1)
+
+    def test_occurrences_in_api_and_end_stream(self):
+        now = timezone.now()
+        recurrences, _ = extract_recurrences(self.events(now - timedelta(hours=1), range(3)))
+        save_recurrences(recurrences, [self.streamer], now)
+
+        response = self.client.get(reverse("streamers:api-scheduled"), {"start": now.isoformat()})
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(len({event["id"] for event in response.json()}), 3)
+
+        # The current occurrence is stored once it happened.
+        self.streamer.live_started_at = now - timedelta(hours=1)
+        self.streamer.end_stream()
+
+        scheduled = ScheduledStream.objects.get()
+        self.assertTrue(scheduled.done and scheduled.weekly)
+        self.assertEqual(len(list(RecurringStream.objects.get().occurrences(now))), 2)
+
+
+class FakeClock:
+    """
+    Replaces the `time` module: sleeping advances the clock instantly, and the
+    sleeps are recorded.
+    """
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class SharedTokenBucketTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "ratelimit")
+
+        self.clock = FakeClock()
+        patcher = mock.patch("pogscience.ratelimit.time", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        # 10 points, refilled at 1 point per second.
+        self.bucket = SharedTokenBucket(self.path, capacity=10, period=10)
+
+    def acquire(self, times):
+        for _ in range(times):
+            self.bucket.acquire()
+
+    def test_refill_and_pacing(self):
+        self.acquire(10)
+        self.assertEqual(self.clock.slept, [])
+
+        # The bucket is empty: the next request waits for one point.
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [1.0])
+
+        self.clock.now += 5
+        self.bucket.acquire(5)
+        self.assertEqual(self.clock.slept, [1.0])
+
+        # The bucket never holds more than its capacity.
+        self.clock.slept.clear()
+        self.clock.now += 100
+        self.acquire(11)
+        self.assertEqual(self.clock.slept, [1.0])
+
+    def test_block(self):
+        self.bucket.block(until=self.clock.now + 30)
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [30.0])
+
+        # Blocking until an earlier date does not shorten the current block.
+        self.bucket.block(until=self.clock.now + 30)
+        self.bucket.block(until=self.clock.now + 10)
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [30.0, 30.0])
+
+    def test_sync(self):
+        self.bucket.sync(remaining=3)
+        self.acquire(3)
+        self.assertEqual(self.clock.slept, [])
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [1.0])
+
+        # Syncing never adds points.
+        self.bucket.sync(remaining=50)
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [1.0, 1.0])
+
+        # Once the remote budget is exhausted, requests wait for its reset.
+        self.clock.slept.clear()
+        self.bucket.sync(remaining=0, reset=self.clock.now + 20)
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [20.0])
+
+    def test_corrupt_state(self):
+        for data in (b"", b"{not json", b'{"tokens": 3', b"\xff\xfe"):
+            with self.subTest(data=data):
+                with open(self.path, "wb") as f:
+                    f.write(data)
+
+                # The bucket starts again full, and its state is saved again.
+                self.acquire(10)
+                self.assertEqual(self.clock.slept, [])
+                with open(self.path) as f:
+                    self.assertEqual(json.load(f)["tokens"], 0)
+
+    def test_helix_rate_limit_headers(self):
+        responses = [
+            mock.Mock(
+                status_code=429, headers={"Ratelimit-Remaining": "0", "Ratelimit-Reset": str(int(self.clock.now) + 30)}
+            ),
+            mock.Mock(
+                status_code=200, headers={"Ratelimit-Remaining": "2", "Ratelimit-Reset": str(int(self.clock.now) + 60)}
+            ),
+        ]
+        responses[1].json.return_value = {"data": [{"id": "1", "login": "pogscience"}]}
+
+        with mock.patch("pogscience.twitch.get_rate_limiter", return_value=self.bucket), mock.patch(
+            "pogscience.twitch.get_http_session"
+        ) as get_http_session:
+            get_http_session.return_value.request.side_effect = responses
+            users = HelixAPIGet(client_id="client", oauth_token="token", path="users", resource=User, params={}).fetch()
+
+        self.assertEqual([user["login"] for user in users], ["pogscience"])
+
+        # The 429 blocked the bucket until the announced reset, then the
+        # retried request synced it with the remaining budget.
+        self.assertEqual(self.clock.slept, [30.0])
+        self.acquire(2)
+        self.assertEqual(self.clock.slept, [30.0])
+        self.acquire(1)
+        self.assertEqual(self.clock.slept, [30.0, 1.0])
+
+
+def http_response(status_code=200, data=None, headers=None):
+    response = mock.Mock(status_code=status_code, headers=headers or {})
+    response.json.return_value = data
+    if status_code >= 400:
+        response.raise_for_status.side_effect = HTTPError(response=response)
+    return response
+
+
+class TwitchClientMixin:
+    """
+    Runs the Twitch client against a mocked HTTP session, with its own cache
+    and lock files, and without rate limit.
+    """
+
+    def setUp(self):
+        super().setUp()
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        overrides = override_settings(
+            CACHES={
+                **settings.CACHES,
+                "twitch": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": directory.name},
+            },
+            POG_TWITCH={**settings.POG_TWITCH, "TOKEN_LOCK_FILE": os.path.join(directory.name, "token.lock")},
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        patchers = [mock.patch("pogscience.twitch.get_http_session"), mock.patch("pogscience.twitch.get_rate_limiter")]
+        self.http = patchers[0].start().return_value
+        patchers[1].start()
+        for patcher in patchers:
+            self.addCleanup(patcher.stop)
+
+        # Each token requested is a new one.
+        tokens = itertools.count(1)
+
+        def request_token(*args, **kwargs):
+            time.sleep(0.05)
+            return http_response(data={"access_token": f"token-{next(tokens)}", "expires_in": 3600})
+
+        self.http.post.side_effect = request_token
+
+    @staticmethod
+    def helix():
+        return TwitchHelix(client_id="client", client_secret="secret")
+
+
+class TwitchClientTestCase(TwitchClientMixin, SimpleTestCase):
+    pass
+
+
+class TwitchTokenTests(TwitchClientTestCase):
+    def test_concurrent_callers_request_one_token(self):
+        helixes = [self.helix() for _ in range(8)]
+        with ThreadPoolExecutor(max_workers=len(helixes)) as executor:
+            tokens = list(executor.map(lambda helix: helix.ensure_oauth(), helixes))
+
+        self.assertEqual(tokens, ["token-1"] * len(helixes))
+        self.assertEqual(self.http.post.call_count, 1)
+
+        # Once Twitch refused it, concurrent callers renew the token once.
+        with ThreadPoolExecutor(max_workers=len(helixes)) as executor:
+            tokens = list(executor.map(lambda helix: helix.renew_oauth(expired_token="token-1"), helixes))
+
+        self.assertEqual(tokens, ["token-2"] * len(helixes))
+        self.assertEqual(self.http.post.call_count, 2)
+
+    def test_unauthorized_request_is_retried_once(self):
+        helix = self.helix()
+        helix.ensure_oauth()
+
+        self.http.request.side_effect = [http_response(401), http_response(data={"data": [{"id": "1"}]})]
+        self.assertEqual([user["id"] for user in helix.get_users(ids=["1"], use_cache=False)], ["1"])
+
+        self.assertEqual(self.http.post.call_count, 2)
+        self.assertEqual(
+            [call.kwargs["headers"]["Authorization"] for call in self.http.request.call_args_list],
+            ["Bearer token-1", "Bearer token-2"],
+        )
+
+        # If the new token is refused too, we give up instead of renewing it
+        # again and again.
+        self.http.request.reset_mock()
+        self.http.request.side_effect = [http_response(401), http_response(401), http_response(401)]
+        with self.assertRaises(HTTPError):
+            helix.get_users(ids=["1"], use_cache=False)
+
+        self.assertEqual(self.http.request.call_count, 2)
+        self.assertEqual(self.http.post.call_count, 3)
+
+
+class TwitchCacheTests(TwitchClientTestCase):
+    def test_only_missing_keys_are_fetched(self):
+        live = {"1", "3"}
+        requested = []
+
+        def get_streams(method, url, params=None, **kwargs):
+            requested.append(list(params["user_id"]))
+            streams = [
+                {"id": f"stream-{user_id}", "user_id": user_id} for user_id in params["user_id"] if user_id in live
+            ]
+            return http_response(data={"data": streams, "pagination": {}})
+
+        self.http.request.side_effect = get_streams
+        helix = self.helix()
+
+        def live_streamers(user_ids):
+            return [stream["user_id"] for stream in helix.get_streams(user_ids=user_ids)]
+
+        self.assertEqual(live_streamers(["1", "2"]), ["1"])
+        self.assertEqual(requested, [["1", "2"]])
+        self.assertEqual(helix.cache_stats, {"streams.hits": 0, "streams.misses": 2})
+
+        # Only the keys not in the cache are fetched, and the objects are
+        # returned in the keys order.
+        self.assertEqual(live_streamers(["1", "2", "3", "4"]), ["1", "3"])
+        self.assertEqual(requested, [["1", "2"], ["3", "4"]])
+        self.assertEqual(helix.cache_stats, {"streams.hits": 2, "streams.misses": 4})
+
+        # Keys Twitch returned nothing for are cached too.
+        self.assertEqual(live_streamers(["2", "4"]), [])
+        self.assertEqual(requested, [["1", "2"], ["3", "4"]])
+        self.assertEqual(helix.cache_stats, {"streams.hits": 4, "streams.misses": 4})
+
+
+class TwitchChunksTests(SimpleTestCase):
+    def fetch_in_chunks(self, count):
+        keys = [str(key) for key in range(count)]
+        chunks = []
+
+        def fetch_chunk(chunk):
+            chunks.append(chunk)
+            # The first chunks are the slowest, so they complete last.
+            time.sleep(0.05 * (count - int(chunk[0])) / count)
+            return [{"id": key} for key in chunk]
+
+        objects = TwitchHelix._fetch_in_chunks(keys, fetch_chunk)
+        self.assertEqual([obj["id"] for obj in objects], keys)
+        return sorted(len(chunk) for chunk in chunks)
+
+    def test_chunks(self):
+        self.assertEqual(self.fetch_in_chunks(0), [])
+        self.assertEqual(self.fetch_in_chunks(1), [1])
+        self.assertEqual(self.fetch_in_chunks(100), [100])
+        self.assertEqual(self.fetch_in_chunks(101), [1, 100])
+        self.assertEqual(self.fetch_in_chunks(450), [50, 100, 100, 100, 100])
+
+
+class TwitchScheduleTests(TwitchClientTestCase):
+    START = datetime(2021, 5, 3, 18, tzinfo=pytz.UTC)
+
+    def setUp(self):
+        super().setUp()
+
+        # Three pages of two segments, one per hour.
+        def get_schedule(method, url, params=None, **kwargs):
+            self.requested.append(params)
+            page = int(params.get("after") or 0)
+            segments = [
+                {
+                    "id": f"segment-{i}",
+                    "start_time": (self.START + timedelta(hours=i)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                    "end_time": (self.START + timedelta(hours=i, minutes=30)).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                }
+                for i in range(page * 2, page * 2 + 2)
+            ]
+            pagination = {"cursor": str(page + 1)} if page < 2 else {}
+            return http_response(data={"data": {"segments": segments}, "pagination": pagination})
+
+        self.requested = []
+        self.http.request.side_effect = get_schedule
+
+        # A pool of our own, to wait for the prefetches before checking what
+        # was requested.
+        self.executor = ThreadPoolExecutor(max_workers=2)
+        patcher = mock.patch("pogscience.twitch.get_prefetch_executor", return_value=self.executor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def segments(self, **kwargs):
+        segments = [segment["id"] for segment in self.helix().get_schedule("1", **kwargs)]
+        self.executor.shutdown(wait=True)
+        return segments
+
+    def test_start_time(self):
+        paris = pytz.timezone("Europe/Paris")
+        for start_time, tz, utc_offset in (
+            (self.START, None, 0),
+            (self.START.astimezone(paris), None, 0),
+            (datetime(2021, 5, 3, 20), paris, 120),
+            ("2021-05-03T20:00:00+02:00", None, 0),
+            (datetime(2021, 5, 3, 14), pytz.timezone("America/New_York"), -240),
+        ):
+            with self.subTest(start_time=start_time, tz=tz):
+                self.requested.clear()
+                self.helix().get_schedule("1", start_time=start_time, tz=tz, prefetch=False)
+                self.assertEqual(self.requested[0]["start_time"], "2021-05-03T18:00:00Z")
+                self.assertEqual(self.requested[0]["utc_offset"], utc_offset)
+
+    def test_whole_schedule(self):
+        self.assertEqual(self.segments(), [f"segment-{i}" for i in range(6)])
+        self.assertEqual([params.get("after") for params in self.requested], [None, "1", "2"])
+
+    def test_end_time(self):
+        # Segments starting at or after the end time are not returned, and the
+        # pages after the one reaching it are not requested.
+        self.assertEqual(
+            self.segments(end_time=self.START + timedelta(hours=3)), ["segment-0", "segment-1", "segment-2"]
+        )
+        self.assertEqual([params.get("after") for params in self.requested], [None, "1"])
+
+
+class EventSubReconciliationTests(TwitchClientMixin, TestCase):
+    CALLBACK_URL = "https://pogscience.test/eventsub/"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.first = Streamer.objects.create(name="First", twitch_login="first", twitch_id=1)
+        cls.second = Streamer.objects.create(name="Second", twitch_login="second", twitch_id=2)
+
+    def setUp(self):
+        super().setUp()
+
+        # The subscriptions are listed through the client, so their dates are
+        # parsed as they would be from Twitch's responses.
+        self.remote = []
+        self.http.request.return_value = http_response(data={"data": self.remote, "pagination": {}})
+
+        self.twitch = self.helix()
+        self.twitch.eventsub_delete_subscription = mock.Mock()
+        self.twitch.eventsub_subscribe = mock.Mock()
+
+    def subscription(self, streamer, event_type, status=None, remote_status=None, callback_url=CALLBACK_URL):
+        """
+        Creates a subscription stored with the given status (if any), and known
+        by Twitch with the given status (if any).
+        """
+        sub_uuid = uuid.uuid4()
+        if status is not None:
+            EventSubSubscription.objects.create(
+                streamer=streamer, type=event_type, uuid=sub_uuid, secret="secret", status=status
+            )
+        if remote_status is not None:
+            self.remote.append(
+                {
+                    "id": str(sub_uuid),
+                    "status": remote_status,
+                    "type": event_type,
+                    "condition": {"broadcaster_user_id": str(streamer.twitch_id)},
+                    "transport": {"method": "webhook", "callback": callback_url},
+                    "created_at": "2020-11-10T14:32:18.730260295Z",
+                }
+            )
+        return str(sub_uuid)
+
+    def test_reconcile(self):
+        subscribed, pending = EventSubSubscription.SUBSCRIBED, EventSubSubscription.PENDING
+
+        healthy = self.subscription(self.first, "stream.online", subscribed, "enabled")
+        outdated = self.subscription(self.first, "stream.offline", pending, "enabled")
+        revoked = self.subscription(self.first, "channel.update", subscribed, "authorization_revoked")
+        failed = self.subscription(self.second, "stream.online", pending, "webhook_callback_verification_failed")
+        forgotten = self.subscription(self.second, "stream.offline", subscribed)
+        orphaned = self.subscription(self.second, "stream.offline", remote_status="enabled")
+        self.subscription(self.second, "stream.offline", remote_status="enabled", callback_url="https://other.test/")
+
+        plan = plan_reconciliation(self.twitch, callback_url=self.CALLBACK_URL)
+
+        self.assertEqual(plan.unchanged, 1)
+        self.assertEqual([(str(sub.uuid), status) for sub, status in plan.to_update], [(outdated, subscribed)])
+        self.assertEqual([str(sub.uuid) for sub in plan.to_forget], [forgotten])
+        self.assertEqual(
+            sorted((sub_uuid, sub is not None) for sub_uuid, sub, _ in plan.to_delete),
+            sorted([(revoked, True), (failed, True), (orphaned, False)]),
+        )
+        self.assertEqual(
+            sorted((streamer.name, event_type) for streamer, event_type in plan.to_create),
+            [
+                ("First", "channel.update"),
+                ("Second", "channel.update"),
+                ("Second", "stream.offline"),
+                ("Second", "stream.online"),
+            ],
+        )
+        self.assertEqual(plan.api_calls, 7)
+
+        # The failed subscription is already gone from Twitch.
+        def delete(**kwargs):
+            if kwargs["uuid"] == failed:
+                raise HTTPError(response=mock.Mock(status_code=404))
+
+        self.twitch.eventsub_delete_subscription.side_effect = delete
+        self.twitch.eventsub_subscribe.side_effect = lambda event_type, **kwargs: [
+            {"id": str(uuid.uuid4()), "type": event_type}
+        ]
+
+        results = list(apply_reconciliation(self.twitch, plan, callback_url=self.CALLBACK_URL, concurrency=2))
+        self.assertEqual(len(results), plan.api_calls)
+        self.assertTrue(all(error is None for _, _, error in results))
+
+        stored = EventSubSubscription.objects.all()
+        self.assertEqual(
+            sorted((sub.streamer_id, sub.type) for sub in stored),
+            sorted(
+                (streamer.pk, event_type)
+                for streamer in (self.first, self.second)
+                for event_type in Streamer.EVENTSUB_SUBSCRIPTIONS
+            ),
+        )
+        self.assertEqual(stored.get(uuid=healthy).status, subscribed)
+        self.assertEqual(stored.get(uuid=outdated).status, subscribed)
+        self.assertFalse(stored.filter(uuid__in=[revoked, failed, forgotten]).exists())
+
+        # The subscriptions to another callback URL are left alone.
+        self.assertEqual(
+            sorted(call.kwargs["uuid"] for call in self.twitch.eventsub_delete_subscription.call_args_list),
+            sorted([revoked, failed, orphaned]),
+        )
+
+
+class DownloadImageTests(SimpleTestCase):
+    URL = "https://static-cdn.jtvnw.net/user-default-pictures/profile_image-300x300.png"
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.media_root = directory.name
+
+        overrides = override_settings(MEDIA_ROOT=self.media_root)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        patcher = mock.patch("streamers.models.get_http_session")
+        self.http = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+        self.streamer = Streamer(name="PogScience", twitch_login="pogscience", twitch_id=1)
+
+    @staticmethod
+    def png(colour, size=32):
+        from PIL import Image
+
+        image = io.BytesIO()
+        Image.new("RGB", (size, size), colour).save(image, "PNG")
+        return image.getvalue()
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, filename), self.media_root)
+            for root, _, filenames in os.walk(self.media_root)
+            for filename in filenames
+        )
+
+    def download(self, status_code, content=b"", etag='"a"', field="profile_image"):
+        self.http.get.return_value = mock.Mock(
+            status_code=status_code, ok=status_code < 400, content=content, headers={"ETag": etag}
+        )
+        return self.streamer._download_and_store_image(self.URL, getattr(self.streamer, field))
+
+    def test_unchanged_image_is_not_stored_again(self):
+        self.assertTrue(self.download(200, self.png("red")))
+        name, files = self.streamer.profile_image.name, self.files()
+        self.assertIn(name, files)
+
+        # The request is conditional, and the image not modified.
+        self.assertFalse(self.download(304))
+        self.assertEqual(self.http.get.call_args.kwargs["headers"], {"If-None-Match": '"a"'})
+
+        # The server sends the same image anyway.
+        self.assertFalse(self.download(200, self.png("red"), etag='"b"'))
+
+        self.assertEqual(self.streamer.profile_image.name, name)
+        self.assertEqual(self.files(), files)
+
+        self.assertTrue(self.download(200, self.png("blue")))
+        self.assertNotEqual(self.streamer.profile_image.name, name)
+        self.assertGreater(len(self.files()), len(files))
+
+    def test_derivatives(self):
+        self.download(200, self.png("red", size=200))
+
+        # Images are never enlarged.
+        derivatives = self.streamer.images_metadata["profile_image"]["derivatives"]
+        self.assertEqual(
+            {fmt: list(names) for fmt, names in derivatives.items()}, {"avif": ["64", "128"], "webp": ["64", "128"]}
+        )
+        for fmt, names in derivatives.items():
+            for width, name in names.items():
+                with self.subTest(fmt=fmt, width=width):
+                    self.assertRegex(name, rf"^twitch/profile/pogscience-{width}w\.[0-9a-f]{{12}}\.{fmt}$")
+                    self.assertIn(name, self.files())
+
+        # Content-hashed derivatives are not versioned.
+        self.assertEqual(
+            self.streamer.profile_image_srcset,
+            {fmt: f"/media/{names['64']} 64w, /media/{names['128']} 128w" for fmt, names in derivatives.items()},
+        )
+
+        # Smaller than every width, an image has a single derivative, at its
+        # own size.
+        self.download(200, self.png("blue", size=32), etag='"b"')
+        derivatives = self.streamer.images_metadata["profile_image"]["derivatives"]
+        self.assertEqual({fmt: list(names) for fmt, names in derivatives.items()}, {"avif": ["32"], "webp": ["32"]})
+
+    def test_unsupported_formats_are_skipped(self):
+        with override_settings(POG_IMAGES={**settings.POG_IMAGES, "FORMATS": ["jpegxl", "webp"]}):
+            self.download(200, self.png("red", size=200))
+
+        self.assertEqual(list(self.streamer.images_metadata["profile_image"]["derivatives"]), ["webp"])
+        self.assertEqual(list(self.streamer.profile_image_srcset), ["webp"])
+
+    def test_live_previews_are_not_resized(self):
+        self.download(200, self.png("red", size=1280), field="live_preview")
+
+        self.assertEqual(self.streamer.images_metadata["live_preview"]["derivatives"], {})
+        self.assertEqual(self.files(), [self.streamer.live_preview.name])
+
+    def test_srcsets(self):
+        field = mock.Mock(storage=FileSystemStorage(location=self.media_root, base_url="/media/"))
+        metadata = {
+            "sha256": "0123456789abcdef",
+            "derivatives": {
+                "webp": {"64": "twitch/profile/pogscience-64w.webp", "128": "twitch/profile/pogscience-128w.webp"},
+            },
+        }
+
+        # Derivatives without content hash are overwritten, so their URLs are
+        # versioned.
+        self.assertEqual(
+            srcsets(field, metadata),
+            {
+                "webp": (
+                    "/media/twitch/profile/pogscience-64w.webp?v=0123456789ab 64w, "
+                    "/media/twitch/profile/pogscience-128w.webp?v=0123456789ab 128w"
+                )
+            },
+        )
+        self.assertEqual(srcsets(field, {"sha256": "0123456789abcdef"}), {})
+
+
+class ContentHashedStorageTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.storage = ContentHashedStorage(location=directory.name, grace_period=timedelta(minutes=15))
+
+    def save(self, content):
+        return self.storage.save("twitch/profile/image.png", ContentFile(content))
+
+    def files(self):
+        return sorted(os.path.join("twitch/profile", name) for name in self.storage.listdir("twitch/profile")[1])
+
+    def age(self, name, minutes):
+        """Makes the file look like it was written some minutes ago."""
+        written = time.time() - minutes * 60
+        os.utime(self.storage.path(name), (written, written))
+
+    def test_identical_content_is_reused(self):
+        first = self.save(b"first")
+        self.assertTrue(ContentHashedStorage.is_hashed(first))
+        self.assertEqual(self.save(b"first"), first)
+        self.assertEqual(self.files(), [first])
+
+    def test_superseded_files_are_deleted_after_the_grace_period(self):
+        first = self.save(b"first")
+        self.age(first, 60)
+
+        # Just superseded, the first version is kept for already loaded pages.
+        second = self.save(b"second")
+        self.assertEqual(self.files(), sorted([first, second]))
+
+        # Still within the grace period.
+        self.age(second, 10)
+        self.assertEqual(self.save(b"second"), second)
+        self.assertEqual(self.files(), sorted([first, second]))
+
+        # Superseded for longer than the grace period.
+        self.age(second, 20)
+        self.assertEqual(self.save(b"second"), second)
+        self.assertEqual(self.files(), [second])
+
+        # A version saved again after being superseded supersedes the newer
+        # ones from then on.
+        self.assertEqual(self.save(b"first"), first)
+        self.assertEqual(self.files(), sorted([first, second]))
+        self.age(first, 20)
+        self.assertEqual(self.save(b"first"), first)
+        self.assertEqual(self.files(), [first])
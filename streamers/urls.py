@@ -6,6 +6,7 @@ from streamers.views.api import (
     LiveAndUpcomingAPIView,
     ScheduledStreamsAPIView,
     StreamersResourcesAPIView,
+    ViewersStatsAPIView,
 )
 from streamers.views.raid import RaidAPIView
 
@@ -17,6 +18,7 @@ urlpatterns = [
     path("api/live-and-upcoming", LiveAndUpcomingAPIView.as_view(), name="api-live-upcoming"),
     path("api/scheduled", ScheduledStreamsAPIView.as_view(), name="api-scheduled"),
     path("api/streamers-resources", StreamersResourcesAPIView.as_view(), name="api-streamers-resources"),
+    path("api/stats/viewers", ViewersStatsAPIView.as_view(), name="api-stats-viewers"),
     path("api/raid/<str:twitch_login>", RaidAPIView.as_view(), name="api-raid"),
     path("twitch/eventsub/ingest", EventSubIngestView.as_view(), name="eventsub-ingest"),
 ]
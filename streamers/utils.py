@@ -1,11 +1,7 @@
 import binascii
+import colorsys
 from itertools import zip_longest
 
-import numpy as np
-import scipy.cluster
-
-from PIL import Image
-
 
 def grouper(iterable, n, fillvalue=None):
     """
@@ -21,6 +17,33 @@ def grouper(iterable, n, fillvalue=None):
     return zip_longest(*args, fillvalue=fillvalue)
 
 
+def colours_palette(colours):
+    """
+    Computes, from RGB colours, every notation used to display them, so they can
+    be stored and used without any further computation.
+
+    :param colours: The colours, as (red, green, blue) tuples, each value
+                    between 0 and 255.
+    :return: A dict ready to be stored as JSON, with, for each notation, the list
+             of colours: `rgb` (lists of three values between 0 and 255), `hex`
+             (e.g. `#ff8000`), `hsl` (lists of hue in degrees, then saturation
+             and lightness in percents), and `hsl_css` (e.g. `hsl(30.0, 100.0%,
+             50.0%)`).
+    """
+    rgb = [[float(c) for c in colour] for colour in colours]
+    hsl = []
+    for colour in rgb:
+        h, l, s = colorsys.rgb_to_hls(*[c / 255.0 for c in colour])
+        hsl.append([h * 360, s * 100, l * 100])
+
+    return {
+        "rgb": rgb,
+        "hex": ["#" + binascii.hexlify(bytearray(int(c) for c in colour)).decode("ascii") for colour in rgb],
+        "hsl": hsl,
+        "hsl_css": [f"hsl({h}, {s}%, {l}%)" for h, s, l in hsl],
+    }
+
+
 def extract_main_colours(image_path: str, colours_count: int = 3, discriminate_grays: bool = True):
     """
     Analyses an image, and extracts the main colours using the k-means
@@ -36,6 +59,12 @@ def extract_main_colours(image_path: str, colours_count: int = 3, discriminate_g
     :return: A list of the (r, g, b) tuples corresponding to the main colors,
              ordered.
     """
+    # These are slow to import, and only needed here: they are imported on
+    # first use so they don't slow down every process startup.
+    import numpy as np
+    import scipy.cluster
+    from PIL import Image
+
     # Loads the image into a numpy array
     im = Image.open(image_path)
     ar = np.asarray(im)
@@ -0,0 +1,234 @@
+"""
+Viewers counts time series.
+
+`synclivestreams` samples the viewers count of every live stream. Samples are
+rolled up per minute, then minute rollups per hour, and hour rollups per day;
+each level being deleted after its retention period (see `POG_VIEWERS`), once
+rolled up into the next one. Statistics are computed from the rollups only.
+"""
+from django.conf import settings
+from django.db.models import Count, DateTimeField, FloatField, Max, Min, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Cast, Trunc, TruncMonth
+from django.utils import timezone
+
+from streamers.models import ScheduledStream, ViewerCountRollup, ViewerCountSample
+
+RESOLUTIONS = [ViewerCountRollup.MINUTE, ViewerCountRollup.HOUR, ViewerCountRollup.DAY]
+
+
+def _last_rolled_up(resolution):
+    """Returns the start of the last period rolled up at this resolution, or None."""
+    return ViewerCountRollup.objects.filter(resolution=resolution).aggregate(last=Max("start"))["last"]
+
+
+def _trunc(expression, resolution):
+    """
+    Truncates a time in the database. Minutes and hours are truncated in UTC, as
+    they are ambiguous in local time when DST ends; days in the current time
+    zone, so they start at midnight local time.
+    """
+    return Trunc(expression, resolution, tzinfo=None if resolution == ViewerCountRollup.DAY else timezone.utc)
+
+
+def _truncated(time, resolution):
+    """
+    Truncates the given time in the database. Truncated columns must only be
+    compared to truncated values, as some databases (e.g. SQLite) return them
+    in the truncation time zone.
+    """
+    return _trunc(Value(time, output_field=DateTimeField()), resolution)
+
+
+def rollup(now=None) -> dict:
+    """
+    Rolls up every complete period not rolled up yet, from the finest to the
+    coarsest resolution.
+
+    :param now: The current time; periods including it are not complete.
+    :return: The number of rollups created, for each resolution.
+    """
+    now = now or timezone.now()
+    created = {}
+
+    for index, resolution in enumerate(RESOLUTIONS):
+        # Aggregates are not named after the rollup fields, as annotations
+        # cannot shadow fields.
+        if index == 0:
+            rows, time_field = ViewerCountSample.objects.all(), "time"
+            aggregates = dict(count=Count("pk"), total=Sum("viewers"), low=Min("viewers"), high=Max("viewers"))
+        else:
+            rows, time_field = ViewerCountRollup.objects.filter(resolution=RESOLUTIONS[index - 1]), "start"
+            aggregates = dict(
+                count=Sum("samples"), total=Sum("viewers_sum"), low=Min("viewers_min"), high=Max("viewers_max")
+            )
+
+        # Periods are only rolled up once complete, so the rows of the periods
+        # already rolled up are never updated.
+        rows = rows.filter(**{f"{time_field}__lt": now}).annotate(period=_trunc(time_field, resolution))
+        rows = rows.filter(period__lt=_truncated(now, resolution))
+
+        last = _last_rolled_up(resolution)
+        if last is not None:
+            rows = rows.filter(**{f"{time_field}__gte": last}, period__gt=_truncated(last, resolution))
+
+        rollups = [
+            ViewerCountRollup(
+                streamer_id=row["streamer_id"],
+                resolution=resolution,
+                start=row["period"],
+                samples=row["count"],
+                viewers_sum=row["total"],
+                viewers_min=row["low"],
+                viewers_max=row["high"],
+            )
+            for row in rows.values("streamer_id", "period").annotate(**aggregates).order_by()
+        ]
+        ViewerCountRollup.objects.bulk_create(rollups, ignore_conflicts=True)
+        created[resolution] = len(rollups)
+
+    return created
+
+
+def compact(now=None) -> dict:
+    """
+    Deletes the samples and rollups older than their retention period (see
+    `POG_VIEWERS`). Data not rolled up into the next resolution yet is kept
+    whatever its age, so nothing is lost if `rollup` was not run for a while.
+
+    :param now: The current time.
+    :return: The number of deleted rows, for samples and each resolution.
+    """
+    now = now or timezone.now()
+    retention = settings.POG_VIEWERS["RETENTION"]
+    deleted = {}
+
+    levels = [("sample", ViewerCountSample.objects.all(), "time")] + [
+        (resolution, ViewerCountRollup.objects.filter(resolution=resolution), "start") for resolution in RESOLUTIONS
+    ]
+
+    for (level, rows, time_field), next_resolution in zip(levels, RESOLUTIONS + [None]):
+        if retention.get(level) is None or next_resolution is None:
+            deleted[level] = 0
+            continue
+
+        last = _last_rolled_up(next_resolution)
+        if last is None:
+            deleted[level] = 0
+            continue
+
+        deleted[level], _ = (
+            rows.filter(**{f"{time_field}__lt": now - retention[level]})
+            .annotate(period=_trunc(time_field, next_resolution))
+            .filter(period__lte=_truncated(last, next_resolution))
+            .delete()
+        )
+
+    return deleted
+
+
+def covering_rollups(resolution=ViewerCountRollup.DAY):
+    """
+    Returns the rollups covering every sample rolled up so far exactly once: the
+    rollups at the given resolution, plus the finer rollups of the periods not
+    rolled up at this resolution yet (e.g. the hour rollups of the current day).
+
+    :param resolution: The coarsest resolution to use.
+    :return: A queryset of rollups.
+    """
+    levels = RESOLUTIONS[: RESOLUTIONS.index(resolution) + 1]
+    condition = Q(resolution=resolution)
+
+    for finer, coarser in zip(levels, levels[1:]):
+        last = _last_rolled_up(coarser)
+        if last is None:
+            condition |= Q(resolution=finer)
+        else:
+            condition |= Q(resolution=finer, start__gte=last, **{f"{coarser}_period__gt": _truncated(last, coarser)})
+
+    return ViewerCountRollup.objects.annotate(
+        **{f"{coarser}_period": _trunc("start", coarser) for coarser in levels[1:]}
+    ).filter(condition)
+
+
+def _stats() -> dict:
+    """The aggregates computing the statistics from rollups."""
+    return dict(
+        peak=Max("viewers_max"),
+        average=Cast(Sum("viewers_sum"), FloatField()) / Cast(Sum("samples"), FloatField()),
+    )
+
+
+def _filter(rollups, start, end, streamers):
+    """Filters rollups by time range and streamers, if given."""
+    if start is not None:
+        rollups = rollups.filter(start__gte=start)
+    if end is not None:
+        rollups = rollups.filter(start__lt=end)
+    if streamers is not None:
+        rollups = rollups.filter(streamer__in=streamers)
+    return rollups
+
+
+def stats_per_month(start=None, end=None, streamers=None):
+    """
+    Peak and average viewers per streamer and month.
+
+    :param start: Only include data after this time, if any.
+    :param end: Only include data before this time, if any.
+    :param streamers: Only include these streamers (queryset), if any.
+    :return: A values queryset, with the `month`, `streamer__twitch_login`,
+             `peak` and `average`.
+    """
+    rollups = _filter(covering_rollups(), start, end, streamers)
+    return (
+        rollups.annotate(month=TruncMonth("start"))
+        .values("month", "streamer__twitch_login")
+        .annotate(**_stats())
+        .order_by("month", "streamer__twitch_login")
+    )
+
+
+def stats_per_streamer(start=None, end=None, streamers=None):
+    """
+    Peak and average viewers per streamer.
+
+    :return: A values queryset, with the `streamer__twitch_login`, `peak` and
+             `average`. See `stats_per_month` for the parameters.
+    """
+    rollups = _filter(covering_rollups(), start, end, streamers)
+    return rollups.values("streamer__twitch_login").annotate(**_stats()).order_by("streamer__twitch_login")
+
+
+def stats_per_stream(start=None, end=None, streamers=None):
+    """
+    Peak and average viewers per past stream (see `Streamer.end_stream`),
+    computed from the hour rollups overlapping the stream.
+
+    :return: A queryset of the done scheduled streams, annotated with their
+             `peak` and `average`. See `stats_per_month` for the parameters.
+    """
+    rollups = covering_rollups(ViewerCountRollup.HOUR).filter(
+        streamer=OuterRef("streamer"),
+        hour_period__gte=OuterRef("start_hour"),
+        start__lt=OuterRef("end"),
+    )
+    streams = (
+        ScheduledStream.objects.filter(done=True)
+        .annotate(start_hour=_trunc("start", ViewerCountRollup.HOUR))
+        .select_related("streamer")
+        .order_by("start")
+    )
+
+    if start is not None:
+        streams = streams.filter(end__gte=start)
+    if end is not None:
+        streams = streams.filter(start__lte=end)
+    if streamers is not None:
+        streams = streams.filter(streamer__in=streamers)
+
+    return streams.annotate(
+        **{
+            name: Subquery(rollups.values("streamer").annotate(**{name: aggregate}).values(name))
+            for name, aggregate in _stats().items()
+        }
+    )
@@ -1,5 +1,9 @@
-import dateutil.parser as dp
+import heapq
+from datetime import timedelta
+from itertools import islice
+from operator import attrgetter
 
+import dateutil.parser as dp
 from django.db.models import OuterRef, Subquery
 from django.utils import timezone
 from django.utils.decorators import method_decorator
@@ -8,36 +12,86 @@ from django.views.generic import TemplateView
 from rest_framework import generics, views, viewsets
 from rest_framework.response import Response
 
-from streamers.models import ScheduledStream, Streamer
+from streamers import viewers
+from streamers.models import RecurringStream, ScheduledStream, Streamer
 from streamers.serializers import (
     LiveAndScheduled,
     LiveAndScheduledSerializer,
+    MonthViewersStatsSerializer,
     ScheduledStreamFullCalendarSerializer,
     StreamerResourceFullCalendarSerializer,
+    StreamViewersStatsSerializer,
+    ViewersStatsSerializer,
 )
 
 
+def _aware(time):
+    return timezone.make_aware(time) if timezone.is_naive(time) else time
+
+
+def _with_occurrences(scheduled_streams, recurring_streams, start, end=None):
+    """
+    Merges the scheduled streams, ordered by start, with the occurrences of the
+    recurring streams overlapping the given time range. Lazy: occurrences are
+    computed as they are consumed.
+    """
+    return heapq.merge(
+        scheduled_streams,
+        *(recurring_stream.occurrences(start, end) for recurring_stream in recurring_streams),
+        key=attrgetter("start"),
+    )
+
+
+def _recurring_streams_overlapping(start, end=None):
+    """
+    The recurring streams which may have occurrences overlapping the given time
+    range (an occurrence lasts less than a week).
+    """
+    recurring_streams = RecurringStream.objects.filter(until__gte=start - timedelta(weeks=1))
+    if end is not None:
+        recurring_streams = recurring_streams.filter(start__lte=end)
+    return recurring_streams.select_related("streamer")
+
+
 @method_decorator(cache_page(30), name="dispatch")
 class LiveAndUpcomingAPIView(views.APIView):
     def get(self, request, **kwargs):
         now = timezone.now()
-        live_and_upcoming = LiveAndScheduled(
-            # We try to associate live streamers with the corresponding planned
-            # stream, so we can display the end time.
-            live=Streamer.objects.filter(live=True).annotate(
+
+        # We try to associate live streamers with the corresponding planned
+        # stream, so we can display the end time.
+        live = list(
+            Streamer.objects.filter(live=True).annotate(
                 live_end=Subquery(
                     ScheduledStream.objects.filter(streamer=OuterRef("pk"), start__lte=now, end__gte=now)
                     .order_by("start")
                     .values("end")[:1]
                 )
-            ),
+            )
+        )
+        live_by_pk = {streamer.pk: streamer for streamer in live if streamer.live_end is None}
+        for occurrence in _with_occurrences(
+            [], _recurring_streams_overlapping(now, now).filter(streamer__in=live_by_pk.keys()), now, now
+        ):
+            streamer = live_by_pk[occurrence.streamer_id]
+            streamer.live_end = streamer.live_end or occurrence.end
+
+        live_and_upcoming = LiveAndScheduled(
+            live=live,
             # We want scheduled stream that were not started yet (i.e.
             # the corresponding streamer is not live) and where the *end* time
             # is in the future (so streams starting late are still displayed).
-            scheduled=(
-                ScheduledStream.objects.filter(streamer__live=False, end__gte=now, done=False)
-                .prefetch_related("streamer")
-                .order_by("start")[:4]
+            scheduled=list(
+                islice(
+                    _with_occurrences(
+                        ScheduledStream.objects.filter(streamer__live=False, end__gte=now, done=False)
+                        .prefetch_related("streamer")
+                        .order_by("start")[:4],
+                        _recurring_streams_overlapping(now).filter(streamer__live=False),
+                        now,
+                    ),
+                    4,
+                )
             ),
         )
 
@@ -55,21 +109,55 @@ class ScheduledStreamsAPIView(generics.ListAPIView):
         end = self.request.query_params.get("end")
 
         try:
-            start = dp.parse(start)
-            queryset = queryset.filter(end__gte=start)
+            start = _aware(dp.parse(start))
         except (TypeError, dp.ParserError):
-            queryset = queryset.filter(end__gte=timezone.now())
+            start = timezone.now()
+        queryset = queryset.filter(end__gte=start)
 
         try:
-            end = dp.parse(end)
+            end = _aware(dp.parse(end))
             queryset = queryset.filter(start__lte=end)
         except (TypeError, dp.ParserError):
-            pass
+            end = None
 
-        return queryset
+        # Recurring streams are expanded for the requested time range only.
+        return list(_with_occurrences(queryset, _recurring_streams_overlapping(start, end), start, end))
 
 
 @method_decorator(cache_page(300), name="list")
 class StreamersResourcesAPIView(generics.ListAPIView):
     queryset = Streamer.objects.all()
     serializer_class = StreamerResourceFullCalendarSerializer
+
+
+@method_decorator(cache_page(300), name="dispatch")
+class ViewersStatsAPIView(views.APIView):
+    """
+    Peak and average viewers, `per` month (default), streamer, or stream;
+    optionally between the `start` and `end` dates, and for the given
+    `streamers` (comma-separated Twitch logins). Computed from the viewers
+    counts rollups (see `streamers.viewers`).
+    """
+
+    STATS = {
+        "month": (viewers.stats_per_month, MonthViewersStatsSerializer),
+        "streamer": (viewers.stats_per_streamer, ViewersStatsSerializer),
+        "stream": (viewers.stats_per_stream, StreamViewersStatsSerializer),
+    }
+
+    def get(self, request, **kwargs):
+        stats, serializer_class = self.STATS.get(request.query_params.get("per"), self.STATS["month"])
+
+        dates = {}
+        for param in ("start", "end"):
+            try:
+                dates[param] = _aware(dp.parse(request.query_params.get(param)))
+            except (TypeError, dp.ParserError):
+                dates[param] = None
+
+        streamers = None
+        if request.query_params.get("streamers"):
+            streamers = Streamer.objects.filter(twitch_login__in=request.query_params["streamers"].split(","))
+
+        serialized = serializer_class(stats(streamers=streamers, **dates), many=True)
+        return Response(serialized.data)
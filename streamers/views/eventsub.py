@@ -105,6 +105,7 @@ class EventSubIngestView(View):
         streamer = self.sub.streamer
         streamer.start_stream()
         streamer.save()
+        streamer.update_stream_later()
 
         return HttpResponse(status=HTTPStatus.NO_CONTENT)
 